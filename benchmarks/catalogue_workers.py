@@ -0,0 +1,86 @@
+""" Compares the total memory of several worker processes for each way of holding the catalogue.
+    Reads proportional set size (PSS) from /proc, so shared pages are split between the
+    processes sharing them. Linux only.
+
+    python -m benchmarks.catalogue_workers [workers]
+"""
+import multiprocessing, sys, tempfile
+from pathlib import Path
+
+from music.adapters import csv_data_importer, columnar_repository
+from music.adapters.columnar_repository import ColumnarRepository
+from music.adapters.memory_repository import MemoryRepository
+from music.adapters.repository import SORT_METHODS
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+def proportional_set_size() -> int:
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def open_repository(mode: str, catalogue_path: Path):
+    if mode == 'memory':
+        repo = MemoryRepository()
+        csv_data_importer.load_all(DATA_PATH, repo)
+    elif mode == 'columnar':
+        repo = ColumnarRepository()
+        columnar_repository.populate(DATA_PATH, repo)
+    elif mode == 'catalogue':
+        repo = ColumnarRepository.open_catalogue(catalogue_path)
+    else:
+        repo = None
+    return repo
+
+
+def worker(mode: str, catalogue_path: Path, ready, release, results):
+    repo = open_repository(mode, catalogue_path)
+    if repo is not None:
+        # touch everything a worker would read while serving pages and searches
+        for sort_method in SORT_METHODS:
+            for page in range(1, repo.get_number_of_tracks() // 30 + 2):
+                repo.get_page(sort_method, False, page, 30)
+        for query in ("the", "love", "a"):
+            repo.return_track_from_dict(query)
+    ready.wait()
+    results.put(proportional_set_size())
+    release.wait()
+
+
+def measure(mode: str, workers: int, catalogue_path: Path) -> int:
+    ready = multiprocessing.Barrier(workers + 1)
+    release = multiprocessing.Barrier(workers + 1)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(mode, catalogue_path, ready, release, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    ready.wait()
+    total = sum(results.get() for _ in processes)
+    release.wait()
+    for process in processes:
+        process.join()
+    return total
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    multiprocessing.set_start_method('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        catalogue_path = Path(directory) / 'benchmark.catalogue'
+        repo = ColumnarRepository()
+        columnar_repository.populate(DATA_PATH, repo)
+        repo.save_catalogue(catalogue_path)
+        # workers that only import the application, subtracted from the others
+        baseline = measure('none', workers, catalogue_path)
+        for mode in ('memory', 'columnar', 'catalogue'):
+            total = measure(mode, workers, catalogue_path) - baseline
+            print(f"{mode:>9}: {total / 2**20:7.2f} MiB PSS for the catalogue across {workers} workers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+""" Times the browse, track and search pages when rendered in full and when the browser already has
+    them and gets 304 Not Modified, for the given repository.
+
+    python -m benchmarks.conditional_pages [memory|columnar|database] [requests]
+"""
+import sys, tempfile, time
+from pathlib import Path
+
+from music import create_app
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+URLS = ('/tracks/browse/3?sort=get_track_name&order=asc', '/tracks/browse/track/2', '/tracks/search')
+
+
+def best_time(client, url: str, requests: int, headers: dict = None) -> float:
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get(url, headers=headers)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    repository = sys.argv[1] if len(sys.argv) > 1 else 'memory'
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({'TESTING': True, 'TEST_DATA_PATH': DATA_PATH, 'REPOSITORY': repository,
+                          'SQLALCHEMY_DATABASE_URI': f"sqlite:///{Path(directory) / 'benchmark.db'}",
+                          'SQLALCHEMY_ECHO': False, 'SINGLE_PASS_IMPORT': True, 'MEMORY_SNAPSHOT': None,
+                          'CATALOGUE_FILE': None})
+        client = app.test_client()
+        for url in URLS:
+            response = client.get(url)
+            etag = response.get_etag()[0]
+            rendered = best_time(client, url, requests)
+            not_modified = best_time(client, url, requests, {'If-None-Match': f'"{etag}"'})
+            print(f"{url:48} rendered {rendered * 1000:6.2f} ms  304 {not_modified * 1000:6.2f} ms "
+                  f"({rendered / not_modified:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+""" Reports the memory used per track when the full tracks file is loaded.
+
+    python -m benchmarks.domain_memory
+"""
+import gc, tracemalloc
+from pathlib import Path
+
+from music.adapters import csv_data_importer, columnar_repository
+from music.adapters.columnar_repository import ColumnarRepository
+from music.adapters.memory_repository import MemoryRepository
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+class EntityCollector:
+    """ Stands in for a repository so only the loaded albums, artists, genres and tracks are measured"""
+
+    def bulk_load(self, albums: list, artists: list, genres: list, tracks: list):
+        self.albums, self.artists, self.genres, self.tracks = albums, artists, genres, tracks
+
+
+def measure(load, repo) -> int:
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    load(DATA_PATH, repo)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used
+
+
+def main():
+    entities = EntityCollector()
+    entity_bytes = measure(csv_data_importer.load_all, entities)
+    track_count = len(entities.tracks)
+    del entities
+    repository_bytes = measure(csv_data_importer.load_all, MemoryRepository())
+    columnar_bytes = measure(columnar_repository.populate, ColumnarRepository())
+    print(f"{track_count} tracks")
+    print(f"domain objects:      {entity_bytes / track_count:8.0f} bytes/track")
+    print(f"memory repository:   {repository_bytes / track_count:8.0f} bytes/track")
+    print(f"columnar repository: {columnar_bytes / track_count:8.0f} bytes/track")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+""" Compares track page throughput with concurrent readers for each database engine profile.
+
+    python -m benchmarks.engine_profile [threads] [seconds]
+"""
+import sys, tempfile, threading, time
+from pathlib import Path
+
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from config import Config
+from music.adapters import repository_populate
+from music.adapters.database_repository import SqlAlchemyRepository, create_database_engine
+from music.adapters.orm import metadata, map_model_to_tables
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+def run(database_uri, track_ids, profile, threads, seconds):
+    engine = create_database_engine(database_uri, False, profile, Config.DATABASE_POOL_SIZE, Config.SQLITE_PRAGMAS)
+    repo = SqlAlchemyRepository(sessionmaker(autocommit=False, autoflush=True, bind=engine))
+    counts = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def reader(index):
+        position = index
+        while time.perf_counter() < stop:
+            # one track page request: fresh session, track looked up by id, session closed
+            repo.reset_session()
+            track_object = repo.get_track(track_ids[position])
+            track_object.artist.full_name, track_object.album.title, track_object.average_rating()
+            repo.close_session()
+            counts[index] += 1
+            position = (position + threads) % len(track_ids)
+
+    workers = [threading.Thread(target=reader, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    engine.dispose()
+    return sum(counts) / seconds
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = f"sqlite:///{Path(directory) / 'benchmark.db'}"
+        clear_mappers()
+        engine = create_database_engine(database_uri, profile='nullpool')
+        metadata.create_all(engine)
+        map_model_to_tables()
+        repository_populate.populate(DATA_PATH, SqlAlchemyRepository(sessionmaker(bind=engine)), True, single_pass=True)
+        track_ids = [row[0] for row in engine.execute("SELECT id FROM tracks")]
+        engine.dispose()
+        for profile in ('nullpool', 'tuned'):
+            print(f"{profile:>8}: {run(database_uri, track_ids, profile, threads, seconds):8.1f} requests/s with {threads} readers")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" Compares parse_genres with ast.literal_eval on the track_genres column, after checking both
+    give the same value for every row.
+
+    python -m benchmarks.genre_parser [repeats]
+"""
+import ast, sys, time
+from pathlib import Path
+
+from music.adapters import genre_parser
+from music.adapters.csv_data_importer import read_csv_file
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+def best_time(action, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        action()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    column = [row[27] for row in read_csv_file(str(DATA_PATH / "raw_tracks_excerpt.csv")) if row[27] != ""]
+    for raw in column:
+        assert genre_parser.parse_genres(raw) == ast.literal_eval(raw), raw
+
+    def uncached():
+        genre_parser._parsed.clear()
+        for raw in column:
+            genre_parser._scan(raw)
+
+    literal_time = best_time(lambda: [ast.literal_eval(raw) for raw in column], repeats)
+    scan_time = best_time(uncached, repeats)
+    cached_time = best_time(lambda: [genre_parser.parse_genres(raw) for raw in column], repeats)
+    print(f"{len(column)} rows, {len(set(column))} distinct values")
+    print(f"literal_eval {literal_time * 1000:6.2f} ms")
+    print(f"scanner      {scan_time * 1000:6.2f} ms ({literal_time / scan_time:.1f}x)")
+    print(f"cached       {cached_time * 1000:6.2f} ms ({literal_time / cached_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+""" Times the single pass importer with 1, 2, 4, ... worker processes on the tracks file
+    repeated until it has about as many rows as the full dataset.
+
+    python -m benchmarks.parallel_import [copies]
+"""
+import os, sys, tempfile, time
+from pathlib import Path
+
+from benchmarks.domain_memory import EntityCollector
+from music.adapters import csv_data_importer
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+def repeated_tracks_file(directory: Path, copies: int) -> Path:
+    with open(DATA_PATH / "raw_tracks_excerpt.csv", 'rb') as file:
+        header = file.readline()
+        rows = file.read()
+    with open(directory / "raw_tracks_excerpt.csv", 'wb') as file:
+        file.write(header)
+        for _ in range(copies):
+            file.write(rows)
+    return directory
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = repeated_tracks_file(Path(directory), copies)
+        workers = 1
+        serial_time = None
+        while workers <= (os.cpu_count() or 1):
+            collector = EntityCollector()
+            start = time.perf_counter()
+            csv_data_importer.load_all(data_path, collector, workers)
+            elapsed = time.perf_counter() - start
+            serial_time = serial_time or elapsed
+            print(f"{workers:3} workers: {len(collector.tracks)} tracks in {elapsed:6.2f} s "
+                  f"({serial_time / elapsed:.1f}x)")
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main()
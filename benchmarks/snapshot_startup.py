@@ -0,0 +1,39 @@
+""" Compares memory repository start-up from the CSV files with start-up from a snapshot.
+
+    python -m benchmarks.snapshot_startup [repeats]
+"""
+import sys, tempfile, time
+from pathlib import Path
+
+from music.adapters.memory_repository import MemoryRepository, populate
+from music.adapters.snapshot import load_snapshot, save_snapshot
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+def best_time(action, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        action()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = Path(directory) / 'benchmark.snapshot'
+        for single_pass in (False, True):
+            repo = MemoryRepository()
+            populate(DATA_PATH, repo, single_pass)
+            save_snapshot(repo, snapshot_path, DATA_PATH, single_pass)
+            csv_time = best_time(lambda: populate(DATA_PATH, MemoryRepository(), single_pass), repeats)
+            snapshot_time = best_time(lambda: load_snapshot(snapshot_path, DATA_PATH, single_pass), repeats)
+            importer = "single pass" if single_pass else "per entity"
+            print(f"{importer:>11}: CSV {csv_time * 1000:7.1f} ms, snapshot {snapshot_time * 1000:6.1f} ms "
+                  f"({snapshot_time / csv_time:.0%}, {snapshot_path.stat().st_size // 1024} KiB)")
+
+
+if __name__ == '__main__':
+    main()
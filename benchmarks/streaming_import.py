@@ -0,0 +1,41 @@
+""" Compares the peak memory of reading every track at once with reading them in batches.
+
+    python -m benchmarks.streaming_import [batch size]
+"""
+import gc, sys, tracemalloc
+from pathlib import Path
+
+from music.adapters.csvdatareader import TrackCSVReader
+
+DATA_PATH = Path('music') / 'adapters' / 'data'
+
+
+def peak(read) -> int:
+    reader = TrackCSVReader(str(DATA_PATH / "raw_albums_excerpt.csv"), str(DATA_PATH / "raw_tracks_excerpt.csv"))
+    gc.collect()
+    tracemalloc.start()
+    read(reader)
+    used = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return used
+
+
+def read_all(reader: TrackCSVReader):
+    reader.read_csv_files()
+
+
+def read_batches(batch_size: int):
+    def read(reader: TrackCSVReader):
+        for batch in reader.read_track_batches(batch_size):
+            pass
+    return read
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(f"all tracks:      {peak(read_all) / 1024:8.0f} KiB peak")
+    print(f"batches of {batch_size:4}: {peak(read_batches(batch_size)) / 1024:8.0f} KiB peak")
+
+
+if __name__ == '__main__':
+    main()
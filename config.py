@@ -23,6 +23,38 @@ class Config:
     SQLALCHEMY_DATABASE_URI = environ.get('SQLALCHEMY_DATABASE_URI')
     REPOSITORY = environ.get('REPOSITORY')
 
+    # 'tuned' keeps a pool of SQLite connections set up with SQLITE_PRAGMAS,
+    # 'nullpool' opens and closes a connection for every session
+    DATABASE_ENGINE_PROFILE = environ.get('DATABASE_ENGINE_PROFILE', 'tuned').lower().strip()
+    DATABASE_POOL_SIZE = int(environ.get('DATABASE_POOL_SIZE', '5'))
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        'cache_size': int(environ.get('SQLITE_CACHE_SIZE', '-64000')),  # negative means KiB
+        'temp_store': 'MEMORY',
+    }
+
+    # File the populated memory repository is saved to and started from while the CSV files are unchanged,
+    # leave unset to always populate from the CSV files
+    MEMORY_SNAPSHOT = environ.get('MEMORY_SNAPSHOT') or None
+
+    # Read-only catalogue file the columnar repository maps, shared by every worker process.
+    # Built from the CSV files when missing or out of date, leave unset to keep tracks in process memory
+    CATALOGUE_FILE = environ.get('CATALOGUE_FILE') or None
+
+    # Read the tracks CSV once when populating, rather than once per entity type. The memory repository's
+    # object graph differs from the default loader's, see memory_repository.populate
+    single_pass_string = environ.get('SINGLE_PASS_IMPORT', 'False')
+    SINGLE_PASS_IMPORT = single_pass_string.lower().strip() == "true"
+    # Processes the single pass importer parses the tracks CSV with, 1 parses it in this process
+    IMPORT_WORKERS = int(environ.get('IMPORT_WORKERS', '1'))
+
+    # Apply changes to the CSV files to an existing database on start up. Off by default, as the sync deletes
+    # the reviews of tracks no longer in the files; `flask sync-catalogue` applies the changes on demand
+    sync_string = environ.get('SYNC_CATALOGUE', 'False')
+    SYNC_CATALOGUE = sync_string.lower().strip() == "true"
+
     echo_string = environ.get('SQLALCHEMY_ECHO')
     SQLALCHEMY_ECHO = False
     if echo_string.lower().strip() == "true":
@@ -1,20 +1,21 @@
 """Initialize Flask app."""
 
+import click, pickle
 from flask import Flask, render_template, redirect, url_for, session, request, Blueprint, abort
 from flask import current_app as app
 
 from pathlib import Path
 
 # imports from SQLAlchemy
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, clear_mappers
-from sqlalchemy.pool import NullPool
 
 import music.adapters.repository as repo
 from music.adapters.memory_repository import MemoryRepository, populate
-from music.adapters.database_repository import SqlAlchemyRepository
+from music.adapters.columnar_repository import ColumnarRepository, populate as columnar_populate
+from music.adapters.snapshot import load_snapshot, save_snapshot, source_key
+from music.adapters.database_repository import SqlAlchemyRepository, create_database_engine
 from music.adapters.repository_populate import populate as db_populate
-from music.adapters.orm import metadata, map_model_to_tables
+from music.adapters.orm import metadata, map_model_to_tables, upgrade_database
 def create_app(test_config=None):
     print("CREATE APP RUN")
     app = Flask(__name__)
@@ -27,16 +28,44 @@ def create_app(test_config=None):
         data_path = app.config['TEST_DATA_PATH']
     
     if app.config['REPOSITORY'] == 'memory':
-        repo.track_repo = MemoryRepository()
-        populate(data_path, repo.track_repo)
+        single_pass = app.config.get('SINGLE_PASS_IMPORT', False)
+        snapshot_path = app.config.get('MEMORY_SNAPSHOT')
+        repo.track_repo = None
+        if snapshot_path:
+            repo.track_repo = load_snapshot(snapshot_path, data_path, single_pass)
+        if repo.track_repo is None:
+            repo.track_repo = MemoryRepository()
+            populate(data_path, repo.track_repo, single_pass, app.config.get('IMPORT_WORKERS', 1))
+            if snapshot_path:
+                try:
+                    save_snapshot(repo.track_repo, snapshot_path, data_path, single_pass)
+                except (OSError, RecursionError, pickle.PicklingError):
+                    print('COULD NOT WRITE MEMORY SNAPSHOT', snapshot_path)
+
+    elif app.config['REPOSITORY'] == 'columnar':
+        catalogue_path = app.config.get('CATALOGUE_FILE')
+        if catalogue_path:
+            source = source_key(data_path, True)
+            try:
+                repo.track_repo = ColumnarRepository.open_catalogue(catalogue_path, source)
+            except (OSError, repo.RepositoryException):
+                print('BUILDING CATALOGUE FILE...')
+                new_repo = ColumnarRepository()
+                columnar_populate(data_path, new_repo)
+                new_repo.save_catalogue(catalogue_path, source)
+                repo.track_repo = ColumnarRepository.open_catalogue(catalogue_path, source)
+        else:
+            repo.track_repo = ColumnarRepository()
+            columnar_populate(data_path, repo.track_repo)
         
     elif app.config['REPOSITORY'] == 'database':
         database_uri = app.config['SQLALCHEMY_DATABASE_URI']
         database_echo = app.config['SQLALCHEMY_ECHO']
-        database_engine = create_engine(database_uri, connect_args={"check_same_thread": False}, poolclass=NullPool, echo=database_echo)
+        database_engine = create_database_engine(database_uri, database_echo, app.config.get('DATABASE_ENGINE_PROFILE', 'tuned'),
+                                                 app.config.get('DATABASE_POOL_SIZE', 5), app.config.get('SQLITE_PRAGMAS'))
         session_factory = sessionmaker(autocommit=False, autoflush=True, bind=database_engine)
         repo.track_repo = SqlAlchemyRepository(session_factory)
-        if app.config['TESTING'] == 'True' or len(database_engine.table_names()) == 0:
+        if app.config['TESTING'] in (True, 'True') or len(database_engine.table_names()) == 0:
             print('REPOPULATING DATABASE...')
             clear_mappers()
             metadata.create_all(database_engine)
@@ -45,14 +74,19 @@ def create_app(test_config=None):
             
             map_model_to_tables()
             database_mode = True
-            db_populate(data_path, repo.track_repo, database_mode)
+            db_populate(data_path, repo.track_repo, database_mode, app.config.get('SINGLE_PASS_IMPORT', False),
+                        app.config.get('IMPORT_WORKERS', 1))
+            repo.track_repo.record_catalogue_sources(data_path)
         
         else:
+            upgrade_database(database_engine)
+            clear_mappers()
             map_model_to_tables()
+            if app.config.get('SYNC_CATALOGUE', False):
+                print('SYNCING CATALOGUE...', repo.track_repo.sync_catalogue(data_path))
 
     #add the ability to access the repo from current_app
     app.repo = repo.track_repo
-    #app.repo.update_tracks()
     app.repo.sort_tracks("get_track_id", False)
     @app.route('/')
     def home():
@@ -68,6 +102,20 @@ def create_app(test_config=None):
     def page_not_found(e):
         return render_template('404.html'), 404
 
+    @app.cli.command('sync-catalogue')
+    @click.option('--force', is_flag=True, help='Compare with the database even if the CSV files are unchanged.')
+    @click.option('--batch-size', default=1000, help='Rows written per transaction.')
+    def sync_catalogue_command(force, batch_size):
+        """Apply changes to the catalogue CSV files to the database."""
+        if not isinstance(repo.track_repo, SqlAlchemyRepository):
+            click.echo('Only the database repository is stored between runs, there is nothing to sync.')
+            return
+        changes = repo.track_repo.sync_catalogue(data_path, batch_size, force)
+        if not changes:
+            click.echo('The CSV files are unchanged since the last sync.')
+        for table_name, (inserted, updated, deleted) in changes.items():
+            click.echo(f'{table_name}: {inserted} inserted, {updated} updated, {deleted} deleted')
+
     with app.app_context():
         from .authentication import authentication
         app.register_blueprint(authentication.authentication_blueprint)
@@ -0,0 +1,98 @@
+import mmap, os, struct, tempfile
+from array import array, typecodes
+from pathlib import Path
+
+from music.adapters.repository import RepositoryException
+
+MAGIC = b'MWCATLOG'
+# Bump whenever the sections ColumnarRepository writes change meaning
+CATALOGUE_VERSION = 2
+# magic, version, number of sections
+HEADER = struct.Struct('<8sII')
+# name, typecode, number of fields per record, offset and length in bytes
+SECTION = struct.Struct('<48scxxxIQQ')
+# sections start on this boundary so they can be cast to any item size
+ALIGNMENT = 8
+
+
+def write_catalogue(path: Path, sections: dict):
+    """ Writes sections, a dict of name -> (array, fields per record), to path as one file.
+        The file is written beside path and renamed into place, so a worker opening the
+        catalogue never sees a partial file.
+    """
+    entries = []
+    offset = HEADER.size + SECTION.size * len(sections)
+    for name, (values, fields) in sections.items():
+        offset += -offset % ALIGNMENT
+        length = len(values) * values.itemsize
+        entries.append((name, values, fields, offset, length))
+        offset += length
+    path = Path(path)
+    descriptor, temporary_path = tempfile.mkstemp(dir=path.resolve().parent, prefix=path.name)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, CATALOGUE_VERSION, len(entries)))
+            for name, values, fields, offset, length in entries:
+                file.write(SECTION.pack(name.encode(), values.typecode.encode(), fields, offset, length))
+            for name, values, fields, offset, length in entries:
+                file.write(bytes(offset - file.tell()))
+                values.tofile(file)
+        os.replace(temporary_path, path)
+    except:
+        os.unlink(temporary_path)
+        raise
+
+
+class MappedCatalogue:
+    """ A catalogue file mapped read-only into memory. Every process that opens the same file
+        shares its pages, and sections are read as memoryviews without copying.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as file:
+            try:
+                self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise RepositoryException(f"{path} is empty")
+        try:
+            entries = self.__read_entries(path)
+        except:
+            self.__map.close()
+            raise
+        view = memoryview(self.__map)
+        self.__sections = {name: (view[offset:offset + length].cast(typecode), fields)
+                           for name, typecode, fields, offset, length in entries}
+
+    def __read_entries(self, path: Path) -> list:
+        """ Reads the header and section table, checking every section lies inside the file"""
+        try:
+            magic, version, count = HEADER.unpack_from(self.__map, 0)
+            if magic != MAGIC or version != CATALOGUE_VERSION:
+                raise RepositoryException(f"{path} is not a version {CATALOGUE_VERSION} catalogue")
+            entries = []
+            for number in range(count):
+                name, typecode, fields, offset, length = SECTION.unpack_from(self.__map, HEADER.size + number * SECTION.size)
+                entries.append((name.rstrip(b'\0').decode(), typecode.decode(), fields, offset, length))
+        except (struct.error, UnicodeDecodeError):
+            raise RepositoryException(f"{path} is truncated")
+        for name, typecode, fields, offset, length in entries:
+            if typecode not in typecodes or fields < 1 or offset + length > len(self.__map) \
+                    or length % array(typecode).itemsize:
+                raise RepositoryException(f"{path} is truncated")
+        return entries
+
+    def __contains__(self, name: str):
+        return name in self.__sections
+
+    def column(self, name: str, field: int = 0):
+        """ Returns one field of every record in the section as a read-only sequence"""
+        values, fields = self.__sections[name]
+        return values[field::fields] if fields > 1 else values
+
+
+def record_array(typecode: str, columns: list) -> array:
+    """ Interleaves equally long columns into one array of fixed-width records"""
+    records = array(typecode, bytes(array(typecode).itemsize * len(columns) * (len(columns[0]) if columns else 0)))
+    for field, column in enumerate(columns):
+        records[field::len(columns)] = array(typecode, column)
+    return records
@@ -0,0 +1,558 @@
+import bisect, random, weakref
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+
+from music.adapters.repository import AbstractRepository, RepositoryException, SORT_METHODS
+from music.adapters.memory_repository import MemoryRepository
+from music.adapters import csv_data_importer
+from music.adapters.catalogue_file import MappedCatalogue, record_array, write_catalogue
+from music.adapters.search_index import MappedPostings, RowTrigramIndex
+from music.adapters.recommendation_engine import RECOMMENDATION_LIMIT, DURATION_WINDOW
+from music.domainmodel import album, artist, genre, review, track, user
+
+# Stored in the id columns when a track has no artist, album, duration or title
+MISSING = -1
+# Columns related tracks are looked up by, see ColumnarRepository.related_tracks
+COLUMN_INDEXES = ("artist", "album", "genre", "duration")
+
+
+class StringTable:
+    """ Stores each distinct string once and hands out its position, so a column of repeated
+        strings can be an array of ints
+    """
+
+    def __init__(self):
+        self.__strings = []
+        self.__positions = {}
+
+    def __len__(self):
+        return len(self.__strings)
+
+    def add(self, text: str, intern: bool = True) -> int:
+        """ Returns the position of text, only storing it again if intern is False"""
+        if text is None:
+            return MISSING
+        position = self.__positions.get(text) if intern else None
+        if position is None:
+            position = len(self.__strings)
+            self.__strings.append(text)
+            if intern:
+                self.__positions[text] = position
+        return position
+
+    def get(self, position: int) -> str:
+        return None if position == MISSING else self.__strings[position]
+
+    def export(self) -> tuple:
+        """ Returns the strings as one UTF-8 heap and the offset of each string in it"""
+        encoded = [text.encode() for text in self.__strings]
+        offsets = array('q', [0])
+        for text in encoded:
+            offsets.append(offsets[-1] + len(text))
+        return offsets, array('B', b''.join(encoded))
+
+
+class StringHeap:
+    """ Read-only StringTable over a heap exported by StringTable.export"""
+
+    def __init__(self, offsets, heap):
+        self.__offsets = offsets
+        self.__heap = heap
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def get(self, position: int) -> str:
+        if position == MISSING:
+            return None
+        return str(self.__heap[self.__offsets[position]:self.__offsets[position + 1]], 'utf-8')
+
+
+class ColumnIndex:
+    """ Rows ordered by one int column, so the rows with a key in a range can be found by bisecting"""
+
+    def __init__(self, keys, rows):
+        self.__keys = keys
+        self.__rows = rows
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        pairs = sorted(pairs)
+        return cls(array('i', (key for key, _ in pairs)), array('i', (row for _, row in pairs)))
+
+    @property
+    def keys(self):
+        return self.__keys
+
+    @property
+    def rows(self):
+        return self.__rows
+
+    def rows_between(self, low: int, high: int) -> array:
+        start = bisect.bisect_left(self.__keys, low)
+        end = bisect.bisect_right(self.__keys, high)
+        return self.__rows[start:end]
+
+
+class SparseColumn:
+    """ Writable int column that only stores the rows set to something other than 0, used for the
+        review totals of a catalogue file, which are the same for every row until reviews arrive
+    """
+
+    def __init__(self, size: int):
+        self.__size = size
+        self.__values = {}
+
+    def __len__(self):
+        return self.__size
+
+    def __getitem__(self, row: int) -> int:
+        return self.__values.get(row, 0)
+
+    def __setitem__(self, row: int, value: int):
+        self.__values[row] = value
+
+    def __iter__(self):
+        return (self.__values.get(row, 0) for row in range(self.__size))
+
+
+class ColumnarRepository(MemoryRepository):
+    """ Memory repository for read-mostly deployments that stores tracks as parallel typed arrays
+        (one row per track) instead of a list of Track objects.
+
+        A Track is only built when a page, search or recommendation returns its row, and is
+        dropped again once nothing refers to it. Tracks that have been reviewed are kept, since
+        their reviews live on the Track. Sorting, counting and the recommendation lookups run on
+        the arrays, through orderings and indexes built on first use and thrown away when a track
+        is added (or, for the rating ordering, reviewed).
+
+        Users, albums, artists and genres are stored as in MemoryRepository.
+
+        save_catalogue writes the tracks, orderings and indexes to a file that open_catalogue maps
+        read-only, so several worker processes share one copy. Reviews and users then stay in
+        each process, and no tracks can be added.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__ids = array('i')
+        self.__durations = array('i')
+        self.__artist_ids = array('i')
+        self.__album_ids = array('i')
+        self.__titles = array('i')
+        self.__track_urls = array('i')
+        # genres of row i are __genre_ids[__genre_offsets[i]:__genre_offsets[i + 1]]
+        self.__genre_offsets = array('i', [0])
+        self.__genre_ids = array('i')
+        self.__review_counts = array('i')
+        self.__rating_sums = array('i')
+        self.__strings = StringTable()
+        # id -> object for the artists, albums and genres tracks were added with
+        self.__track_artists = {}
+        self.__track_albums = {}
+        self.__track_genres = {}
+        # track ids in ascending order and the row of each, for get_track
+        self.__sorted_ids = array('i')
+        self.__sorted_id_rows = array('i')
+        # inside deferred_indexes, tracks are appended to the id index and sorted in at the end
+        self.__defer_id_index = False
+        self.__deferred_search_fields = []
+        self.__orderings = {}
+        self.__column_indexes = {}
+        self.__live_tracks = weakref.WeakValueDictionary()
+        self.__reviewed_tracks = {}
+        self.__sort_order = array('i')
+        # True while __sort_order is one of __orderings, which add_track_to_sort must not append to
+        self.__sort_order_shared = False
+        self.__search_index = RowTrigramIndex(self.__search_fields)
+        self.__recommended_tracks = []
+        self.__catalogue = None
+
+    def add_track(self, new_track: track):
+        AbstractRepository.add_track(self, new_track)
+        if self.__catalogue is not None:
+            raise RepositoryException("Tracks cannot be added to a catalogue file")
+        row = len(self.__ids)
+        self.__ids.append(new_track.track_id)
+        self.__durations.append(MISSING if new_track.track_duration is None else new_track.track_duration)
+        self.__artist_ids.append(self.__remember(self.__track_artists, new_track.artist, 'artist_id'))
+        self.__album_ids.append(self.__remember(self.__track_albums, new_track.album, 'album_id'))
+        self.__titles.append(self.__strings.add(new_track.title))
+        self.__track_urls.append(self.__strings.add(new_track.track_url, intern=False))
+        for track_genre in new_track.genres:
+            self.__genre_ids.append(self.__remember(self.__track_genres, track_genre, 'genre_id'))
+        self.__genre_offsets.append(len(self.__genre_ids))
+        self.__review_counts.append(new_track.get_num_of_reviews())
+        self.__rating_sums.append(new_track.rating_sum)
+        if new_track.get_num_of_reviews() > 0:
+            self.__reviewed_tracks[row] = new_track
+        if self.__defer_id_index:
+            self.__sorted_ids.append(new_track.track_id)
+            self.__sorted_id_rows.append(row)
+        else:
+            position = bisect.bisect_right(self.__sorted_ids, new_track.track_id)
+            self.__sorted_ids.insert(position, new_track.track_id)
+            self.__sorted_id_rows.insert(position, row)
+        self.__orderings.clear()
+        self.__column_indexes.clear()
+        self._catalogue_changed()
+
+    @staticmethod
+    def __remember(objects: dict, entity, id_name: str) -> int:
+        if entity is None:
+            return MISSING
+        entity_id = getattr(entity, id_name)
+        objects.setdefault(entity_id, entity)
+        return entity_id
+
+    def __row_of(self, track_id: int):
+        position = bisect.bisect_left(self.__sorted_ids, track_id)
+        if position < len(self.__sorted_ids) and self.__sorted_ids[position] == track_id:
+            return self.__sorted_id_rows[position]
+        return None
+
+    def __track_at(self, row: int) -> track.Track:
+        track_object = self.__reviewed_tracks.get(row) or self.__live_tracks.get(row)
+        if track_object is not None:
+            return track_object
+        track_object = track.Track(self.__ids[row], self.__strings.get(self.__titles[row]))
+        if self.__track_urls[row] != MISSING:
+            track_object.track_url = self.__strings.get(self.__track_urls[row])
+        if self.__durations[row] != MISSING:
+            track_object.track_duration = self.__durations[row]
+        if self.__artist_ids[row] != MISSING:
+            track_object.artist = self.__track_artists[self.__artist_ids[row]]
+        if self.__album_ids[row] != MISSING:
+            track_object.album = self.__track_albums[self.__album_ids[row]]
+        for genre_id in self.__genre_ids[self.__genre_offsets[row]:self.__genre_offsets[row + 1]]:
+            track_object.add_genre(self.__track_genres[genre_id])
+        self.__live_tracks[row] = track_object
+        return track_object
+
+    def __tracks_at(self, rows) -> list[track.Track]:
+        return [self.__track_at(row) for row in rows]
+
+    def add_review_to_track(self, current_track: track.Track, new_review: review.Review, current_user: user.User):
+        current_track.set_user_review(new_review)
+        row = self.__row_of(current_track.track_id)
+        if row is None:
+            return
+        # the review only exists on this Track object, so it must outlive the page that made it
+        self.__reviewed_tracks[row] = current_track
+        self.__live_tracks[row] = current_track
+        self.__review_counts[row] = current_track.get_num_of_reviews()
+        self.__rating_sums[row] = current_track.rating_sum
+        self.__orderings.pop(("get_track_rating", False), None)
+        self.__orderings.pop(("get_track_rating", True), None)
+        self._catalogue_changed()
+
+    def add_track_to_sort(self, new_track: track):
+        AbstractRepository.add_track(self, new_track)
+        row = self.__row_of(new_track.track_id)
+        if row is None:
+            self.add_track(new_track)
+            row = len(self.__ids) - 1
+        if self.__sort_order_shared:
+            self.__sort_order = array('i', self.__sort_order)
+            self.__sort_order_shared = False
+        self.__sort_order.append(row)
+
+    def get_sorted_tracks(self):
+        return self.__tracks_at(self.__sort_order)
+
+    def get_track(self, track_id: int) -> track:
+        row = self.__row_of(track_id)
+        return None if row is None else self.__track_at(row)
+
+    def get_number_of_tracks(self) -> int:
+        return len(self.__ids)
+
+    def get_list_of_tracks(self, page_start: int, songs_per_page: int) -> list[track.Track]:
+        first_track = (page_start-1)*songs_per_page
+        last_track = first_track+songs_per_page
+        return self.__tracks_at(self.__sort_order[first_track:last_track])
+
+    def get_page(self, sort_key: str, descending: bool, page: int, per_page: int) -> list[track.Track]:
+        if sort_key not in SORT_METHODS:
+            raise RepositoryException(f"Unknown sort method {sort_key}")
+        first_track = (page-1)*per_page
+        last_track = first_track+per_page
+        return self.__tracks_at(self.__ordering(sort_key, descending)[first_track:last_track])
+
+    def __ordering(self, function: str, descending: bool) -> array:
+        ordering = self.__orderings.get((function, descending))
+        if ordering is None:
+            values = self.__sort_values(function)
+            # sorted() is stable with reverse=True too, so ties keep the order tracks were added in
+            ordering = array('i', sorted(range(len(self.__ids)), key=values.__getitem__, reverse=descending))
+            self.__orderings[(function, descending)] = ordering
+        return ordering
+
+    def __sort_values(self, function: str) -> list:
+        if function == "get_track_id":
+            values = self.__ids
+        elif function == "get_track_name":
+            values = [self.__strings.get(position) for position in self.__titles]
+        elif function == "get_track_duration":
+            values = [None if duration == MISSING else duration for duration in self.__durations]
+        elif function == "get_track_artist_name":
+            values = [self.__entity_value(self.__track_artists, artist_id, 'full_name') for artist_id in self.__artist_ids]
+        elif function == "get_track_album_name":
+            values = [self.__entity_value(self.__track_albums, album_id, 'title') for album_id in self.__album_ids]
+        else:
+            values = [rating_sum / count if count else 0 for rating_sum, count in zip(self.__rating_sums, self.__review_counts)]
+        # tracks missing the attribute sort before all others, as in MemoryRepository
+        return [(0, 0) if value is None else (1, value) for value in values]
+
+    @staticmethod
+    def __entity_value(objects: dict, entity_id: int, attribute: str):
+        if entity_id == MISSING:
+            return None
+        return getattr(objects[entity_id], attribute)
+
+    def __column_index(self, name: str) -> ColumnIndex:
+        index = self.__column_indexes.get(name)
+        if index is None:
+            if name == "genre":
+                pairs = ((genre_id, row) for row in range(len(self.__ids))
+                         for genre_id in self.__genre_ids[self.__genre_offsets[row]:self.__genre_offsets[row + 1]])
+            else:
+                column = {"artist": self.__artist_ids, "album": self.__album_ids, "duration": self.__durations}[name]
+                pairs = ((value, row) for row, value in enumerate(column) if value != MISSING)
+            index = self.__column_indexes[name] = ColumnIndex.from_pairs(pairs)
+        return index
+
+    @contextmanager
+    def deferred_indexes(self):
+        """ Tracks added inside the block are appended to the id index, which is sorted once at the
+            end rather than bisecting every track in. Until then tracks cannot be looked up by id, so
+            their search fields are kept and indexed at the end too.
+        """
+        self.__defer_id_index = True
+        try:
+            yield
+        finally:
+            self.__defer_id_index = False
+            # a stable sort keeps the rows of a repeated id in the order they were added, as bisect_right does
+            order = sorted(range(len(self.__ids)), key=self.__ids.__getitem__)
+            self.__sorted_ids = array('i', (self.__ids[row] for row in order))
+            self.__sorted_id_rows = array('i', order)
+            for track_id, fields in self.__deferred_search_fields:
+                self.__search_index.add(self.__row_of(track_id), fields)
+            self.__deferred_search_fields = []
+
+    def bulk_load(self, albums: list, artists: list, genres: list, tracks: list):
+        with self.deferred_indexes():
+            AbstractRepository.bulk_load(self, albums, artists, genres, tracks)
+        for new_track in tracks:
+            self.add_track_to_sort(new_track)
+            self.add_track_dict(new_track, new_track.album, new_track.artist)
+
+    def add_track_dict(self, track_object: track, track_album: album, track_artist: artist):
+        if self.__catalogue is not None:
+            return
+        fields = [track_object.title, track_album.title, track_artist.full_name]
+        if self.__defer_id_index:
+            self.__deferred_search_fields.append((track_object.track_id, fields))
+            return
+        row = self.__row_of(track_object.track_id)
+        if row is not None:
+            self.__search_index.add(row, fields)
+
+    def __search_fields(self, row: int) -> list:
+        return [self.__strings.get(self.__titles[row]) or '',
+                self.__entity_value(self.__track_albums, self.__album_ids[row], 'title') or '',
+                self.__entity_value(self.__track_artists, self.__artist_ids[row], 'full_name') or '']
+
+    def get_track_dict(self):
+        track_dict = {}
+        for row in self.__search_index:
+            track_object = self.__track_at(row)
+            track_dict[track_object] = [track_object.title, track_object.album.title, track_object.artist.full_name]
+        return track_dict
+
+    def return_track_from_dict(self, input):
+        return self.__tracks_at(self.__search_index.search(input))
+
+    def sort_tracks(self, function: str, order: bool):
+        if function not in SORT_METHODS:
+            raise RepositoryException(f"Unknown sort method {function}")
+        self.__sort_order = self.__ordering(function, order)
+        self.__sort_order_shared = True
+
+    def save_catalogue(self, path: Path, source: bytes = b''):
+        """ Writes the tracks, with their orderings, recommendation indexes and search index, to
+            path for open_catalogue. source identifies the data the tracks came from.
+        """
+        albums = self.__entities(self.get_albums(), self.__track_albums, 'album_id')
+        artists = self.__entities(self.get_artists(), self.__track_artists, 'artist_id')
+        genres = self.__entities(self.get_genres(), self.__track_genres, 'genre_id')
+        album_titles = [self.__strings.add(new_album.title) for new_album in albums]
+        album_urls = [self.__strings.add(getattr(new_album, 'album_url', None), intern=False) for new_album in albums]
+        album_types = [self.__strings.add(getattr(new_album, 'album_type', None)) for new_album in albums]
+        release_years = [MISSING if getattr(new_album, 'release_year', None) is None else new_album.release_year
+                         for new_album in albums]
+        artist_names = [self.__strings.add(new_artist.full_name) for new_artist in artists]
+        genre_names = [self.__strings.add(new_genre.name) for new_genre in genres]
+        string_offsets, string_heap = self.__strings.export()
+        search_indexed, search_fields = self.__search_index.export()
+        sections = {
+            'tracks': (record_array('i', [self.__ids, self.__durations, self.__artist_ids, self.__album_ids,
+                                          self.__titles, self.__track_urls]), 6),
+            'genre_offsets': (self.__genre_offsets, 1),
+            'genre_ids': (self.__genre_ids, 1),
+            'id_index': (record_array('i', [self.__sorted_ids, self.__sorted_id_rows]), 2),
+            'string_offsets': (string_offsets, 1),
+            'string_heap': (string_heap, 1),
+            'albums': (record_array('i', [[new_album.album_id for new_album in albums], album_titles, album_urls,
+                                          album_types, release_years]), 5),
+            'artists': (record_array('i', [[new_artist.artist_id for new_artist in artists], artist_names]), 2),
+            'genres': (record_array('i', [[new_genre.genre_id for new_genre in genres], genre_names]), 2),
+            'search_indexed': (array('B', search_indexed), 1),
+            'source': (array('B', source), 1),
+        }
+        for function in SORT_METHODS:
+            # ratings depend on the reviews each process receives, so are sorted in the process
+            if function != "get_track_rating":
+                for descending in (False, True):
+                    sections[f'ordering:{function}:{descending:d}'] = (self.__ordering(function, descending), 1)
+        for name in COLUMN_INDEXES:
+            index = self.__column_index(name)
+            sections[f'index:{name}'] = (record_array('i', [index.keys, index.rows]), 2)
+        for field, (keys, starts, rows) in enumerate(search_fields):
+            sections[f'search_keys:{field}'] = (keys, 1)
+            sections[f'search_starts:{field}'] = (starts, 1)
+            sections[f'search_rows:{field}'] = (rows, 1)
+        write_catalogue(path, sections)
+
+    @staticmethod
+    def __entities(stored: list, from_tracks: dict, id_name: str) -> list:
+        entities = {getattr(entity, id_name): entity for entity in stored}
+        for entity_id, entity in from_tracks.items():
+            entities.setdefault(entity_id, entity)
+        return list(entities.values())
+
+    @classmethod
+    def open_catalogue(cls, path: Path, source: bytes = None):
+        """ Returns a repository reading its tracks from a file written by save_catalogue
+            Raises RepositoryException if the file was saved from another source
+        """
+        catalogue = MappedCatalogue(path)
+        if source is not None and bytes(catalogue.column('source')) != source:
+            raise RepositoryException(f"{path} was not built from the current data")
+        repo = cls()
+        repo.__load_catalogue(catalogue)
+        return repo
+
+    def __load_catalogue(self, catalogue: MappedCatalogue):
+        self.__catalogue = catalogue
+        self.__ids, self.__durations, self.__artist_ids, self.__album_ids, self.__titles, self.__track_urls = \
+            (catalogue.column('tracks', field) for field in range(6))
+        self.__genre_offsets = catalogue.column('genre_offsets')
+        self.__genre_ids = catalogue.column('genre_ids')
+        self.__sorted_ids = catalogue.column('id_index', 0)
+        self.__sorted_id_rows = catalogue.column('id_index', 1)
+        self.__strings = StringHeap(catalogue.column('string_offsets'), catalogue.column('string_heap'))
+        self.__review_counts = SparseColumn(len(self.__ids))
+        self.__rating_sums = SparseColumn(len(self.__ids))
+        for album_id, title, album_url, album_type, release_year in zip(*(catalogue.column('albums', field)
+                                                                             for field in range(5))):
+            new_album = album.Album(album_id, self.__strings.get(title))
+            if album_url != MISSING:
+                new_album.album_url = self.__strings.get(album_url)
+            if album_type != MISSING:
+                new_album.album_type = self.__strings.get(album_type)
+            if release_year != MISSING:
+                new_album.release_year = release_year
+            self.add_album(new_album)
+            self.__track_albums[album_id] = new_album
+        for artist_id, full_name in zip(catalogue.column('artists', 0), catalogue.column('artists', 1)):
+            new_artist = artist.Artist(artist_id, self.__strings.get(full_name))
+            self.add_artist(new_artist)
+            self.__track_artists[artist_id] = new_artist
+        for genre_id, name in zip(catalogue.column('genres', 0), catalogue.column('genres', 1)):
+            new_genre = genre.Genre(genre_id, self.__strings.get(name))
+            self.add_genre(new_genre)
+            self.__track_genres[genre_id] = new_genre
+        for function in SORT_METHODS:
+            for descending in (False, True):
+                if f'ordering:{function}:{descending:d}' in catalogue:
+                    self.__orderings[(function, descending)] = catalogue.column(f'ordering:{function}:{descending:d}')
+        for name in COLUMN_INDEXES:
+            self.__column_indexes[name] = ColumnIndex(catalogue.column(f'index:{name}', 0), catalogue.column(f'index:{name}', 1))
+        postings = tuple(MappedPostings(catalogue.column(f'search_keys:{field}'), catalogue.column(f'search_starts:{field}'),
+                                        catalogue.column(f'search_rows:{field}')) for field in range(3))
+        self.__search_index = RowTrigramIndex(self.__search_fields, postings, catalogue.column('search_indexed'))
+
+    def related_tracks(self, seed_track: track.Track) -> list[track.Track]:
+        """ Returns every track related to seed_track, other than seed_track itself, by the rules of
+            RecommendationEngine.related_tracks
+        """
+        return self.__tracks_at(self.__related_rows(seed_track))
+
+    def __related_rows(self, seed_track: track.Track) -> dict:
+        related = {}
+        if seed_track.artist is not None:
+            related.update(dict.fromkeys(self.__column_index("artist").rows_between(seed_track.artist.artist_id, seed_track.artist.artist_id)))
+        if seed_track.album is not None:
+            related.update(dict.fromkeys(self.__column_index("album").rows_between(seed_track.album.album_id, seed_track.album.album_id)))
+        for track_genre in seed_track.genres:
+            related.update(dict.fromkeys(self.__column_index("genre").rows_between(track_genre.genre_id, track_genre.genre_id)))
+        if seed_track.track_duration is not None:
+            related.update(dict.fromkeys(self.__column_index("duration").rows_between(
+                seed_track.track_duration - DURATION_WINDOW, seed_track.track_duration + DURATION_WINDOW)))
+        for row in range(bisect.bisect_left(self.__sorted_ids, seed_track.track_id),
+                         bisect.bisect_right(self.__sorted_ids, seed_track.track_id)):
+            related.pop(self.__sorted_id_rows[row], None)
+        return related
+
+    def recommend_tracks(self, user_object: user):
+        recommended = {}
+        for user_review in user_object.reviews:
+            if user_review.rating > 3:
+                recommended.update(self.__related_rows(user_review.track))
+        recommended = list(recommended)
+        if len(recommended) > RECOMMENDATION_LIMIT:
+            recommended = random.sample(recommended, RECOMMENDATION_LIMIT)
+        else:
+            random.shuffle(recommended)
+        self.__recommended_tracks = self.__tracks_at(recommended)
+        return self.__recommended_tracks
+
+    def recommend_from_artist(self, high_reviewed_track, track_object):
+        if high_reviewed_track.artist == track_object.artist and high_reviewed_track != track_object and track_object not in self.__recommended_tracks:
+            self.__recommended_tracks.append(track_object)
+
+    def recommend_from_genre(self, high_reviewed_track, track_object):
+        for genre_type in high_reviewed_track.genres:
+            if genre_type in track_object.genres and high_reviewed_track != track_object and track_object not in self.__recommended_tracks:
+                self.__recommended_tracks.append(track_object)
+
+    def recommend_from_album(self, high_reviewed_track, track_object):
+        if high_reviewed_track.album == track_object.album and high_reviewed_track != track_object and track_object not in self.__recommended_tracks:
+            self.__recommended_tracks.append(track_object)
+
+    def recommend_from_duration(self, high_reviewed_track, track_object):
+        if high_reviewed_track.track_duration-15 <= track_object.track_duration <= high_reviewed_track.track_duration+15 and high_reviewed_track != track_object and track_object not in self.__recommended_tracks:
+            self.__recommended_tracks.append(track_object)
+
+
+def populate(data_path: Path, repo: ColumnarRepository):
+    """ Streams the tracks file into the repository's columns. Unlike csv_data_importer.load_all,
+        albums and artists are not given a list of their tracks, so each Track read from the file
+        can be freed as soon as its row is stored.
+    """
+    albums = {0: album.Album(0, "None")}
+    artists = {}
+    genres = {}
+    with repo.deferred_indexes():
+        for new_track in csv_data_importer.read_tracks(data_path, albums, artists, genres):
+            repo.add_track(new_track)
+            repo.add_track_dict(new_track, new_track.album, new_track.artist)
+    for new_album in albums.values():
+        repo.add_album(new_album)
+    for new_artist in artists.values():
+        repo.add_artist(new_artist)
+    for new_genre in genres.values():
+        repo.add_genre(new_genre)
@@ -1,14 +1,20 @@
-import csv, ast, random
+import csv, hashlib, io, os, random
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 from music.adapters.repository import AbstractRepository, RepositoryException
+from music.adapters.genre_parser import parse_genres
 from music.domainmodel import album, artist, genre, playlist, review, track, user
 
-def read_csv_file(filename: str):
+def read_csv_file(filename: str, strip: bool = True):
         with open(filename, encoding="unicode_escape") as file:
             reader = csv.reader(file)
             headers = next(reader)
+            if not strip:
+                yield from reader
+                return
             for row in reader:
                 row = [item.strip() for item in row]
                 yield row
@@ -30,7 +36,7 @@ def load_tracks(data_path: Path, repo: AbstractRepository):
         artist_name_fixed = row[5].replace('&amp;', '&')
         new_track.artist = artist.Artist(int(row[4]), artist_name_fixed)
         if row[27] != "":
-            for genre_object in ast.literal_eval(row[27]):
+            for genre_object in parse_genres(row[27]):
                 new_genre = genre.Genre(int(genre_object["genre_id"]), genre_object["genre_title"])
                 new_track.add_genre(new_genre)
         if row[38] != "":
@@ -43,22 +49,20 @@ def load_tracks(data_path: Path, repo: AbstractRepository):
 
 def load_albums(data_path: Path, repo: AbstractRepository):
     albums_filename = str(Path(data_path) / "raw_tracks_excerpt.csv")
+    album_table = read_album_table(data_path)
     repo.add_album(album.Album(0, "None"))
+    added_ids = {0}
     for row in read_csv_file(albums_filename):
         if row[0] == "track_id":
             continue
         elif row[1] == "":
             continue
+        album_id = int(row[1])
+        if album_id in added_ids:
+            continue
+        added_ids.add(album_id)
         album_name_fixed = row[2].replace('&amp;', '&')
-        new_album = album.Album(int(row[1]), album_name_fixed)
-        new_album.album_url = row[3]
-        unique_flag = True
-        album_list = repo.get_albums()
-        for check_album in album_list:
-            if check_album.album_id == new_album.album_id:
-                unique_flag = False
-        if unique_flag:
-            repo.add_album(new_album)
+        repo.add_album(create_album(album_id, album_table.get(album_id, (album_name_fixed, row[3], None, None))))
 
     """
     albums_filename = str(Path(data_path) / "raw_albums_excerpt.csv")
@@ -117,7 +121,7 @@ def load_genres(data_path: Path, repo: AbstractRepository, database_mode: bool =
         if row[0] == "track_id":
             continue
         if row[27] != "":
-            genre_list = ast.literal_eval(row[27])
+            genre_list = parse_genres(row[27])
         else:
             continue
         track_name_fixed = row[37].replace('&amp;', '&')
@@ -171,7 +175,7 @@ def load_tracks_and_genres(data_path: Path, repo: AbstractRepository):
                     break
         """
         if row[27] != "":
-            for genre_object in ast.literal_eval(row[27]):
+            for genre_object in parse_genres(row[27]):
                 # Here, we check to see if the genres are unique
                 unique_flag = True
                 for check_genre in genre_list:
@@ -192,9 +196,11 @@ def load_tracks_and_genres(data_path: Path, repo: AbstractRepository):
         #repo.add_track_to_sort(new_track)
         #repo.add_track_dict(new_track, new_track.album, new_track.artist)
 
-def populate(data_path: Path, repo: AbstractRepository):
-    #Primary way, will return to later
-    #load_all(data_path, repo)
+def populate(data_path: Path, repo: AbstractRepository, single_pass: bool = False):
+    #Primary way, one read of the tracks file
+    if single_pass:
+        load_all(data_path, repo)
+        return
 
     #Interesting fix
     load_albums(data_path, repo)
@@ -206,113 +212,246 @@ def populate(data_path: Path, repo: AbstractRepository):
     #load_genres(data_path, repo)
 
 
-def load_all(data_path: Path, repo: AbstractRepository):
+def load_all(data_path: Path, repo: AbstractRepository, workers: int = 1):
+    """ Single pass replacement for load_albums, load_artists and load_tracks_and_genres.
+        Streams the tracks file once, dedupes albums/artists/genres with id-keyed dicts
+        and hands the linked entities to the repository in one bulk_load call. Album details
+        come from the albums file through read_album_table.
+        With more than one worker the rows are parsed by read_tracks_parallel instead.
+    """
+    albums = {0: album.Album(0, "None")}
+    artists = {}
+    genres = {}
+    if workers > 1:
+        track_source = read_tracks_parallel(data_path, albums, artists, genres, workers)
+    else:
+        track_source = read_tracks(data_path, albums, artists, genres)
+    tracks = []
+    for new_track in track_source:
+        new_track.album.add_track(new_track)
+        new_track.artist.add_track(new_track)
+        tracks.append(new_track)
+
+    repo.bulk_load(list(albums.values()), list(artists.values()), list(genres.values()), tracks)
+
+
+def read_tracks(data_path: Path, albums: dict, artists: dict, genres: dict):
+    """ Yields a Track for each row of the tracks file, linked to the albums, artists and genres
+        in the given id-keyed dicts. New albums, artists and genres are added to the dicts as found.
+    """
     tracks_filename = str(Path(data_path) / "raw_tracks_excerpt.csv")
-    albums_filename = str(Path(data_path) / "raw_albums_excerpt.csv")
-    album_list = [album.Album(0, "None")]
-    artist_list = []
+    values = read_album_table(data_path), {}, {}
+    for row in read_csv_file(tracks_filename, strip=False):
+        yield link_track(parse_track(row, *values), albums, artists, genres, *values)
 
-    #First, initalise album_list
-    for row in read_csv_file(albums_filename):
-        if row[0] == "album_id":
-            continue
-        album_name_fixed = row[12].replace('&amp;', '&')
-        new_album = album.Album(int(row[0]), album_name_fixed)
-        if row[15] == None:
-            new_album.album_url = 'None'
-        else:
-            new_album.album_url = row[15]
-        new_album.album_type = row[14]
-        if row[3] == "":
-            new_album.release_year = 0
-        else:
-            new_album.release_year = int(row[3])
-        unique_flag = True
-        for check_album in album_list:
-            if check_album.album_id == new_album.album_id:
-                unique_flag = False
-        if unique_flag:
-            album_list.append(new_album)
-    print(album_list)
-    #Secondly, initalise artist_list
-    for row in read_csv_file(tracks_filename):
-        if row[0] == "track_id":
+
+def parse_track(row: list, album_values: dict, artist_values: dict, genre_values: dict) -> tuple:
+    """ Reads a row of the tracks file into (track_id, title, track_url, duration, album_id, artist_id,
+        genre_ids), with album_id 0 when the track has no album. The album's values as in read_album_table,
+        the artist's name and the genres' titles are added to the id-keyed value dicts if not already there.
+        Only the fields used are stripped, so the row may come unstripped from read_csv_file.
+    """
+    album_field = row[1].strip()
+    album_id = 0 if album_field == "" else int(album_field)
+    if album_id not in album_values:
+        album_values[album_id] = (row[2].strip().replace('&amp;', '&'), row[3].strip(), None, None)
+    artist_id = int(row[4])
+    if artist_id not in artist_values:
+        artist_values[artist_id] = row[5].strip().replace('&amp;', '&')
+    genre_ids = []
+    genres_field = row[27].strip()
+    if genres_field != "":
+        for genre_object in parse_genres(genres_field):
+            genre_id = int(genre_object["genre_id"])
+            genre_values.setdefault(genre_id, genre_object["genre_title"])
+            genre_ids.append(genre_id)
+    return (int(row[0]), row[37].strip().replace('&amp;', '&'), row[38].strip(), int(float(row[22])),
+            album_id, artist_id, genre_ids)
+
+
+def link_track(parsed_track: tuple, albums: dict, artists: dict, genres: dict,
+               album_values: dict, artist_values: dict, genre_values: dict) -> track.Track:
+    """ Creates the Track for a parse_track tuple, linked to the albums, artists and genres in the
+        id-keyed dicts. Ones not in the dicts yet are created from the value dicts and added.
+    """
+    track_id, title, track_url, duration, album_id, artist_id, genre_ids = parsed_track
+    track_album = albums.get(album_id)
+    if track_album is None:
+        track_album = create_album(album_id, album_values[album_id])
+        albums[album_id] = track_album
+    track_artist = artists.get(artist_id)
+    if track_artist is None:
+        track_artist = artist.Artist(artist_id, artist_values[artist_id])
+        artists[artist_id] = track_artist
+
+    new_track = track.Track(track_id, title)
+    new_track.track_url = track_url
+    new_track.track_duration = duration
+    new_track.artist = track_artist
+    new_track.album = track_album
+    for genre_id in genre_ids:
+        track_genre = genres.get(genre_id)
+        if track_genre is None:
+            track_genre = genre.Genre(genre_id, genre_values[genre_id])
+            genres[genre_id] = track_genre
+        new_track.add_genre(track_genre)
+    return new_track
+
+
+def create_album(album_id: int, album_values: tuple) -> album.Album:
+    title, album_url, album_type, release_year = album_values
+    new_album = album.Album(album_id, title)
+    new_album.album_url = album_url
+    new_album.album_type = album_type
+    new_album.release_year = release_year
+    return new_album
+
+
+def read_album_table(data_path: Path) -> dict:
+    """ Reads the albums file once into a dict of album_id -> (title, album_url, album_type, release_year),
+        which the importers look albums up in as they read the tracks file. The first row with an id
+        is kept. Without an albums file the table is empty and albums are taken from the tracks file.
+    """
+    albums_filename = Path(data_path) / "raw_albums_excerpt.csv"
+    album_table = {}
+    if not albums_filename.exists():
+        return album_table
+    data = albums_filename.read_bytes()
+    # Without a backslash there is nothing to unescape and latin-1 gives the same text, much faster
+    text = data.decode('unicode_escape' if b'\\' in data else 'latin-1')
+    reader = csv.reader(io.StringIO(text, newline=None))
+    next(reader, None)
+    for row in reader:
+        album_id = row[0].strip()
+        if not album_id.isdigit() or int(album_id) in album_table:
             continue
-        artist_name_fixed = row[5].replace('&amp;', '&')
-        new_artist = artist.Artist(int(row[4]), artist_name_fixed)
-        unique_flag = True
-        for check_artist in artist_list:
-            if check_artist.artist_id == new_artist.artist_id:
-                unique_flag = False
-        if unique_flag:
-            artist_list.append(new_artist)
-    print(artist_list)
-    #Finally, create the track objects, complete with their cooresponding album and artist
-    # Remember to include checks if artist/album in repo
+        release_year = row[3].strip()
+        album_table[int(album_id)] = (row[12].strip().replace('&amp;', '&'), row[15].strip(), row[14].strip(),
+                                      int(release_year) if release_year.isdigit() else None)
+    return album_table
 
-    for row in read_csv_file(tracks_filename):
-        if row[0] == "track_id":
+
+# Bytes read at a time while looking for row boundaries
+RANGE_CHUNK_SIZE = 1 << 20
+# Ranges per worker, so one slow range does not leave the other workers idle
+RANGES_PER_WORKER = 4
+
+
+def record_ranges(filename: str, parts: int):
+    """ Splits the rows after the header of a CSV file into up to parts (start, end) byte ranges.
+        A range only ends at a newline outside quotes. Returns None if the file has a \\" escape,
+        as the quotes in the raw bytes then no longer show where rows end.
+    """
+    size = os.path.getsize(filename)
+    targets = [0] + [size * part // parts for part in range(1, parts)]
+    boundaries = []
+    quotes = 0
+    offset = 0
+    last = b''
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(RANGE_CHUNK_SIZE), b''):
+            if b'\\"' in last + chunk:
+                return None
+            position = 0
+            while targets and targets[0] < offset + len(chunk):
+                newline = chunk.find(b'\n', max(position, targets[0] - offset))
+                if newline == -1:
+                    break
+                position = newline + 1
+                before = chunk[newline - 1:newline] if newline else last
+                if (quotes + chunk.count(b'"', 0, newline)) % 2 == 0 and before != b'\\':
+                    boundaries.append(offset + position)
+                    while targets and targets[0] < offset + position:
+                        targets.pop(0)
+            quotes += chunk.count(b'"')
+            last = chunk[-1:]
+            offset += len(chunk)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def read_csv_range(filename: str, start: int, end: int, strip: bool = True):
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('unicode_escape')
+    reader = csv.reader(io.StringIO(text, newline=None))
+    if not strip:
+        yield from reader
+        return
+    for row in reader:
+        yield [item.strip() for item in row]
+
+
+def parse_track_range(filename: str, start: int, end: int) -> tuple:
+    """ Runs in a worker process. Returns the parse_track tuples of the rows in the range and the
+        range's album, artist and genre value dicts. Domain objects are made by the parent, as the
+        ORM's instrumented classes cannot be pickled.
+    """
+    values = {}, {}, {}
+    parsed_tracks = [parse_track(row, *values) for row in read_csv_range(filename, start, end, strip=False)]
+    return parsed_tracks, values
+
+
+def read_tracks_parallel(data_path: Path, albums: dict, artists: dict, genres: dict, workers: int):
+    """ Does the same as read_tracks, with the tracks file split into ranges that are parsed by
+        a pool of worker processes. The ranges are linked in file order, so an album, artist or
+        genre is created from the values of the first row that has it, just as in read_tracks.
+    """
+    tracks_filename = str(Path(data_path) / "raw_tracks_excerpt.csv")
+    ranges = record_ranges(tracks_filename, workers * RANGES_PER_WORKER)
+    if ranges is None:
+        yield from read_tracks(data_path, albums, artists, genres)
+        return
+
+    album_table = read_album_table(data_path)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = executor.map(parse_track_range, *zip(*((tracks_filename, start, end) for start, end in ranges)))
+        for parsed_tracks, (album_values, artist_values, genre_values) in parts:
+            album_values = ChainMap(album_table, album_values)
+            for parsed_track in parsed_tracks:
+                yield link_track(parsed_track, albums, artists, genres, album_values, artist_values, genre_values)
+
+
+# CSV files the catalogue tables are read from
+CATALOGUE_FILES = ("raw_tracks_excerpt.csv", "raw_albums_excerpt.csv")
+
+
+def source_digests(data_path: Path) -> dict:
+    """ Returns the sha256 hex digest of each of CATALOGUE_FILES in data_path, keyed by file name"""
+    digests = {}
+    for filename in CATALOGUE_FILES:
+        if not (Path(data_path) / filename).exists():
             continue
-        track_name_fixed = row[37].replace('&amp;', '&')
-        new_track = track.Track(int(row[0]), track_name_fixed)
-        new_track.track_url = row[38]
-        new_track.track_duration = int(float(row[22]))
-        print(new_track, len(album_list), len(artist_list))
-
-        #SET TRACK ALBUM
-        #Search through album_list for album
-        for index in range(len(album_list)-1):
-            if album_list[index].album_id == int(row[1]):
-                print("Unique ID found!")
-                new_track.album = album_list[index]
-                album_list.pop(index)
-        #If nothing, it means it either doesn't have an album, or it's already in repo
-        if new_track.album.album_id == 0:
-            print("Searching DB, potentially null")
-            #check to see if it has an album
-            if row[1] == "":
-                print("It's null")
-                #check to see if default album still in album_list
-                if album_list[0].album_id != 0:
-                    for check_album in repo.get_albums():
-                        if check_album.album_id == 0:
-                            check_album.add_track(new_track)
-                else:
-                    new_track.album = album_list[0]
-                    album_list.pop(0)
-            else:
-            #check to see if it's in repo
-                for check_album in repo.get_albums():
-                    if check_album.album_id == int(row[1]):
-                        check_album.add_track(new_track)
-                        print(new_track.album, "NEW_TRACK")
-            
-        #SET TRACK ARTIST
-        for index in range(len(artist_list)-1):
-            if artist_list[index].artist_id == int(row[4]):
-                new_track.artist = artist_list[index]
-                artist_list.pop(index)
-        if new_track.artist.artist_id == 0:
-            for check_artist in repo.get_artists():
-                print(check_artist, int(row[4]))
-                if check_artist.artist_id == int(row[4]):
-                    check_artist.add_track(new_track)
-                    #new_track.artist = check_artist
+        digest = hashlib.sha256()
+        with open(Path(data_path) / filename, 'rb') as file:
+            for chunk in iter(lambda: file.read(RANGE_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        digests[filename] = digest.hexdigest()
+    return digests
 
-        
-        
-        if row[27] != "":
-            for genre_object in ast.literal_eval(row[27]):
-                # Here, we check to see if the genres are unique
-                unique_flag = True
-                for check_genre in repo.get_genres():
-                    if check_genre.genre_id == int(genre_object["genre_id"]):
-                        new_track.add_genre(check_genre)
-                        unique_flag = False
-                if unique_flag:
-                    new_genre = genre.Genre(int(genre_object["genre_id"]), genre_object["genre_title"])
-                    new_track.add_genre(new_genre)
-        repo.add_track(new_track)
+
+def read_catalogue(data_path: Path) -> dict:
+    """ Returns the rows load_all would store, without creating domain objects, as a dict of table
+        name -> {id: tuple of column values}. Albums are (title, album_url, album_type, release_year),
+        artists (full_name,), genres (genre_name,), tracks (title, album_id, artist_id, duration,
+        track_url) and track_genre maps each track id to the ids of its genres.
+    """
+    album_values, artist_values, genre_values = values = read_album_table(data_path), {}, {}
+    tracks = {}
+    track_genres = {}
+    for row in read_csv_file(str(Path(data_path) / "raw_tracks_excerpt.csv"), strip=False):
+        track_id, title, track_url, duration, album_id, artist_id, genre_ids = parse_track(row, *values)
+        tracks[track_id] = (title, album_id, artist_id, duration, track_url)
+        track_genres[track_id] = tuple(dict.fromkeys(genre_ids))
+    track_albums = {track_values[1] for track_values in tracks.values()}
+    track_albums.discard(0)
+    return {
+        'albums': {0: ("None", None, None, None), **{album_id: album_values[album_id] for album_id in track_albums}},
+        'artists': {artist_id: (name,) for artist_id, name in artist_values.items()},
+        'genres': {genre_id: (name,) for genre_id, name in genre_values.items()},
+        'tracks': tracks,
+        'track_genre': track_genres,
+    }
 
 #Keep as old code
 """
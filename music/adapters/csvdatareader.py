@@ -1,7 +1,7 @@
 import os
 import csv
-import ast
 
+from music.adapters.genre_parser import parse_genres
 from music.domainmodel.artist import Artist
 from music.domainmodel.album import Album
 from music.domainmodel.track import Track
@@ -43,7 +43,7 @@ def extract_genres(track_row: dict):
     genres = []
     if track_genres_raw:
         try:
-            genre_dicts = ast.literal_eval(
+            genre_dicts = parse_genres(
                 track_genres_raw) if track_genres_raw != "" else []
 
             for genre_dict in genre_dicts:
@@ -57,6 +57,27 @@ def extract_genres(track_row: dict):
     return genres
 
 
+class CSVLines:
+    """ Lines of a CSV file opened in binary mode, decoded the way the readers below open files.
+        position is where the next line starts, so the row a csv reader returns next can be
+        found again with seek.
+    """
+
+    def __init__(self, file):
+        self.__file = file
+        self.position = file.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self.__file.readline()
+        if not line:
+            raise StopIteration
+        self.position += len(line)
+        return line.decode('unicode_escape')
+
+
 class TrackCSVReader:
 
     def __init__(self, albums_csv_file: str, tracks_csv_file: str):
@@ -79,6 +100,10 @@ class TrackCSVReader:
         # Set of unique genres
         self.__dataset_of_genres = set()
 
+        # album_id -> byte offset of the album's row, built on first use
+        self.__album_offsets = None
+        self.__album_fields = None
+
     @property
     def dataset_of_tracks(self) -> list:
         return self.__dataset_of_tracks
@@ -115,6 +140,86 @@ class TrackCSVReader:
 
         return album_dict
 
+    def read_album_offsets(self) -> dict:
+        """ Returns a dict of album_id -> where the album's row starts in the albums file. Albums
+            are read from their row when a track first needs them instead of all up front.
+        """
+        if self.__album_offsets is not None:
+            return self.__album_offsets
+        if not os.path.exists(self.__albums_csv_file):
+            print(f"path {self.__albums_csv_file} does not exist!")
+            return {}
+
+        self.__album_offsets = dict()
+        with open(self.__albums_csv_file, 'rb') as album_csv:
+            lines = CSVLines(album_csv)
+            reader = csv.reader(lines)
+            self.__album_fields = next(reader, [])
+            if 'album_id' not in self.__album_fields:
+                return self.__album_offsets
+            album_id_column = self.__album_fields.index('album_id')
+            offset = lines.position
+            for row in reader:
+                if len(row) > album_id_column and row[album_id_column].isdigit():
+                    self.__album_offsets[int(row[album_id_column])] = offset
+                offset = lines.position
+        return self.__album_offsets
+
+    def read_album_at(self, album_csv, offset: int) -> Album:
+        """ Creates the album whose row starts at offset in album_csv, the albums file opened in binary mode"""
+        album_csv.seek(offset)
+        reader = csv.DictReader(CSVLines(album_csv), fieldnames=self.__album_fields)
+        return create_album_object(next(reader))
+
+    def read_track_batches(self, batch_size: int = 1000):
+        """ Yields the tracks in the tracks file as lists of up to batch_size tracks, each linked
+            to its artist, album and genres. Rows are read as the batches are consumed and a
+            track is only kept while its batch is, so memory grows with batch_size and the number
+            of artists, albums and genres rather than with the number of tracks.
+        """
+        if type(batch_size) is not int or batch_size < 1:
+            raise ValueError('batch_size should be a positive integer')
+        if not os.path.exists(self.__tracks_csv_file):
+            print(f"path {self.__tracks_csv_file} does not exist!")
+            return
+
+        album_offsets = self.read_album_offsets()
+        albums, artists, genres = dict(), dict(), dict()
+        album_csv = open(self.__albums_csv_file, 'rb') if album_offsets else None
+        try:
+            batch = []
+            # encoding of unicode_escape is required to decode successfully
+            with open(self.__tracks_csv_file, encoding='unicode_escape') as track_csv:
+                for track_row in csv.DictReader(track_csv):
+                    track = create_track_object(track_row)
+
+                    artist = create_artist_object(track_row)
+                    track.artist = artists.setdefault(artist.artist_id, artist)
+                    self.__dataset_of_artists.add(track.artist)
+
+                    for genre in extract_genres(track_row):
+                        genre = genres.setdefault(genre.genre_id, genre)
+                        track.add_genre(genre)
+                        self.__dataset_of_genres.add(genre)
+
+                    album_id = int(
+                        track_row['album_id']) if track_row['album_id'].isdigit() else None
+                    if album_id in album_offsets:
+                        if album_id not in albums:
+                            albums[album_id] = self.read_album_at(album_csv, album_offsets[album_id])
+                        track.album = albums[album_id]
+                        self.__dataset_of_albums.add(track.album)
+
+                    batch.append(track)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+        finally:
+            if album_csv is not None:
+                album_csv.close()
+
     def read_tracks_file(self):
         if not os.path.exists(self.__tracks_csv_file):
             print(f"path {self.__tracks_csv_file} does not exist!")
@@ -128,41 +233,10 @@ class TrackCSVReader:
         return track_rows
 
     def read_csv_files(self):
-        # key is album_id
-        albums_dict: dict = self.read_albums_file_as_dict()
-        # list of track csv rows, not track objects
-        track_rows: list = self.read_tracks_file()
-
         # Make sure re-initialize to empty list, so that calling this function multiple times does not create
         # duplicated dataset.
         self.__dataset_of_tracks = []
-        for track_row in track_rows:
-            track = create_track_object(track_row)
-            artist = create_artist_object(track_row)
-            track.artist = artist
-
-            # Extract track_genres attributes and assign genres to the track.
-            track_genres = extract_genres(track_row)
-            for genre in track_genres:
-                track.add_genre(genre)
-
-            album_id = int(
-                track_row['album_id']) if track_row['album_id'].isdigit() else None
-
-            album = albums_dict[album_id] if album_id in albums_dict else None
-            track.album = album
-
-            # Populate datasets for Artist and Genre
-            if artist not in self.__dataset_of_artists:
-                self.__dataset_of_artists.add(artist)
-
-            if album is not None and album not in self.__dataset_of_albums:
-                self.__dataset_of_albums.add(album)
-
-            for genre in track_genres:
-                if genre not in self.__dataset_of_genres:
-                    self.__dataset_of_genres.add(genre)
-
-            self.__dataset_of_tracks.append(track)
+        for batch in self.read_track_batches():
+            self.__dataset_of_tracks.extend(batch)
 
         return self.__dataset_of_tracks
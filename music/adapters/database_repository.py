@@ -1,19 +1,51 @@
 from datetime import date
 from typing import List
-import csv, ast, random
+import csv, ast, random, re, uuid
 from pathlib import Path
 
-from sqlalchemy import desc, asc
+from sqlalchemy import desc, asc, and_, or_, func, select, DateTime, text, bindparam, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
-from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import scoped_session, contains_eager, selectinload, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from music.browse.services import get_list_of_tracks 
 
 from music.domainmodel import album, artist, genre, playlist, review, track, user
-from music.adapters.repository import AbstractRepository
-from music.adapters import orm
+from music.adapters.repository import AbstractRepository, RepositoryException, SORT_METHODS
+from music.adapters import orm, csv_data_importer
+from music.adapters.search_index import RESULT_LIMIT
+from music.adapters.recommendation_engine import RECOMMENDATION_LIMIT, DURATION_WINDOW
 from music.adapters.memory_repository import MemoryRepository
 
+def create_database_engine(database_uri: str, echo: bool = False, profile: str = 'tuned', pool_size: int = 5,
+                           pragmas: dict = None):
+    """ Builds the engine for the database repository.
+        profile 'nullpool' opens a new connection for every session. profile 'tuned' keeps
+        connections in a pool and runs the given SQLite PRAGMAs on each new connection.
+    """
+    connect_args = {"check_same_thread": False}
+    if profile == 'nullpool':
+        return create_engine(database_uri, connect_args=connect_args, poolclass=NullPool, echo=echo)
+    if profile != 'tuned':
+        raise RepositoryException(f"Unknown database engine profile {profile}")
+    if make_url(database_uri).database in (None, '', ':memory:'):
+        # every connection to an in memory database is a new empty database, so keep one per thread
+        engine = create_engine(database_uri, connect_args=connect_args, poolclass=SingletonThreadPool, echo=echo)
+    else:
+        engine = create_engine(database_uri, connect_args=connect_args, poolclass=QueuePool, pool_size=pool_size,
+                               max_overflow=pool_size * 2, echo=echo)
+    if pragmas and engine.dialect.name == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+    return engine
+
+
 class SessionContextManager:
     def __init__(self, session_factory):
         self.__session_factory = session_factory
@@ -41,8 +73,9 @@ class SessionContextManager:
     def reset_session(self):
         # this method can be used e.g. to allow Flask to start a new session for each http request,
         # via the 'before_request' callback
-        self.close_current_session()
-        self.__session = scoped_session(self.__session_factory)
+        # remove() only discards the calling thread's session, so concurrent requests keep theirs
+        # and its pooled connection is handed back rather than left to the garbage collector
+        self.__session.remove()
 
     def close_current_session(self):
         if not self.__session is None:
@@ -53,6 +86,10 @@ class SqlAlchemyRepository(AbstractRepository):
     def __init__(self, session_factory):
         self._session_cm = SessionContextManager(session_factory)
         #self._sorted_tracks = []
+        self._sort_function = "get_track_id"
+        self._sort_order = False
+        # (sort key, descending, per_page) -> [(sort value, track id) of the first track on each page]
+        self._page_boundaries = {}
 
     def close_session(self):
         self._session_cm.close_current_session()
@@ -60,20 +97,6 @@ class SqlAlchemyRepository(AbstractRepository):
     def reset_session(self):
         self._session_cm.reset_session()
 
-    def update_tracks(self):
-        table = self._session_cm.session.query(track.Track)
-        data_path = Path('music') / 'adapters' / 'data'
-        tracks_filename = str(Path(data_path) / "raw_tracks_excerpt.csv")
-        for track_obj in table:
-            for row in self.read_csv_file(tracks_filename):
-                if int(row[0]) == track_obj.track_id:
-                    current_artist_id = row[4]
-                    current_album_id = row[1]
-                    self._session_cm.session.execute(f"UPDATE tracks SET artist_id = '{current_artist_id}', album_id = '{current_album_id}' WHERE id='{track_obj.track_id}'")
-                    self._session_cm.session.execute(f"UPDATE tracks SET album_id = '{current_album_id}' WHERE id='{track_obj.track_id}'")
-        self._session_cm.session.commit()
-        self._session_cm.session.close()
-
     def get_sorted_list(self, method, order):
         sql = f"""  
                 SELECT *
@@ -106,14 +129,6 @@ class SqlAlchemyRepository(AbstractRepository):
             pass
         return return_name
 
-    def read_csv_file(self, filename: str):
-        with open(filename, encoding="unicode_escape") as file:
-            reader = csv.reader(file)
-            headers = next(reader)
-            for row in reader:
-                row = [item.strip() for item in row]
-                yield row
-
     def add_user(self, new_user: user.User):
         with self._session_cm as scm:
             scm.session.add(new_user)
@@ -128,40 +143,40 @@ class SqlAlchemyRepository(AbstractRepository):
         return return_user
 
     def add_review(self, new_review: review.Review):
-        sql = f"""
-                            SELECT id
-                            FROM reviews
-                            WHERE reviews.user_id == {new_review.review_user.user_id}
-                            AND reviews.track_id == {new_review.track.track_id}
-                            """
-        x = self._session_cm.session.execute(sql)
-        y = (x.fetchall())
-        if len(y) > 1:
-            sql = f"""
-                UPDATE reviews
-                SET review = '{new_review.review_text}', rating = {new_review.rating}
-                WHERE user_id = {new_review.review_user.user_id} AND track_id = {new_review.track.track_id}
-                """
-            self._session_cm.session.execute(sql)
-            self._session_cm.session.commit()
-
-            remove_id = len(self._session_cm.session.query(review.Review).all())
-            sql = f"""
-                DELETE FROM reviews
-                WHERE reviews.id = {remove_id}
-                """
-            self._session_cm.session.execute(sql)
-            self._session_cm.session.commit()
-        else:
-            self._session_cm.session.add(new_review)
-            self._session_cm.session.commit()
-
-
-
-
-
-
-
+        """ Stores new_review as the user's review of its track, replacing any earlier one, with a
+            single upsert. The rating_totals triggers update the track's totals in the same statement.
+        """
+        session = self._session_cm.session
+        track_obj, review_user = new_review.track, new_review.review_user
+        with session.no_autoflush:
+            # Review() links itself into the session through its track and user, forget that so the
+            # ORM does not insert it as well
+            if new_review in session:
+                session.expunge(new_review)
+            for parent, attribute in ((track_obj, '_Track__reviews'), (review_user, '_User__reviews')):
+                if parent in session:
+                    session.expire(parent, [attribute])
+        review_id = session.execute(self._upsert_review, {
+            'user_id': review_user.user_id, 'track_id': track_obj.track_id, 'review': new_review.review_text,
+            'rating': new_review.rating, 'timestamp': new_review.timestamp}).scalar()
+        # new_review now stands for the stored row, in place of any copy of the review it replaced
+        replaced = session.identity_map.get(identity_key(review.Review, review_id))
+        if replaced is not None and replaced is not new_review:
+            session.expunge(replaced)
+        if new_review not in session:
+            new_review.id = review_id
+            make_transient_to_detached(new_review)
+            session.add(new_review)
+        session.commit()
+        self._page_boundaries.clear()
+
+    _upsert_review = text("""
+                    INSERT INTO reviews (user_id, track_id, review, rating, timestamp)
+                    VALUES (:user_id, :track_id, :review, :rating, :timestamp)
+                    ON CONFLICT (user_id, track_id) DO UPDATE
+                    SET review = excluded.review, rating = excluded.rating, timestamp = excluded.timestamp
+                    RETURNING id
+                    """).bindparams(bindparam('timestamp', type_=DateTime))
 
     def get_track_reviews(self, track_id: int):
         return_reviews = None
@@ -171,34 +186,20 @@ class SqlAlchemyRepository(AbstractRepository):
         return return_reviews
 
     def add_review_to_user(self, user: user.User, review: review.Review):
-        flag = True
-        for old_review in range(len(user.reviews)): # check if review is in user obj
-            if user.reviews[old_review].track.track_id == review.track.track_id:
-                flag = False
-                #user.reviews[old_review] = review # replace if review is in user obj
-                break
-        if flag:
-            pass
-            user.add_review(review)
+        # the upsert replaces the user's earlier review of the track, the collections reload from it
         self.add_review(review)
 
     def add_review_to_track(self, track: track.Track, review: review.Review, user: user.User):
-        flag = True
-        for old_track in range(len(track.reviews)): # check if review is in track obj
-            if track.reviews[old_track].review_user == user:
-                flag = False
-                track.reviews[old_track] = review # replace if review is in track obj
-                break
-        if flag:
-            pass
-            track.add_review(review)
-            
-            
+        # already stored if add_review_to_user ran first
+        if review not in self._session_cm.session:
+            self.add_review(review)
 
     def add_track(self, track: track.Track):
         with self._session_cm as scm:
             scm.session.add(track)
+            self._new_catalogue_version()
             scm.commit()
+        self._page_boundaries.clear()
     
     def add_track_to_sort(self, track: track.Track):
         #depreciated function, not used for the database 
@@ -223,25 +224,89 @@ class SqlAlchemyRepository(AbstractRepository):
         return self._session_cm.session.query(track.Track).all()
 
     def get_list_of_tracks(self, page_start: int, songs_per_page: int) -> list[track.Track]:
-        #list = self._session_cm.session.query(track.Track).order_by(track.Track._Track__title)
-        sql = "SELECT * from sort_track"
-        get_tracks = self._session_cm.session.execute(sql)
-        tracks = get_tracks.fetchall()
-        if tracks == []:
-            self.sort_tracks("get_track_id", False)
-        else:
-            sorted_tracks = []
-            first_track = (page_start - 1) * songs_per_page
-            last_track = first_track + songs_per_page
-            wanted_tracks = tracks[first_track:last_track]
-            for new_track in wanted_tracks:
-                sorted_tracks.append(self.get_track(new_track[1]))
-            return sorted_tracks
+        return self.get_page(self._sort_function, self._sort_order, page_start, songs_per_page)
+
+    def get_page(self, sort_key: str, descending: bool, page: int, per_page: int) -> list[track.Track]:
+        """ Seeks straight to the page using the cached (sort key, track id) of its first track,
+            so page N costs one indexed ORDER BY ... LIMIT query, the same as page 1.
+        """
+        if sort_key not in SORT_METHODS:
+            raise RepositoryException(f"Unknown sort method {sort_key}")
+        if page < 1:
+            return []
+        key_column = self._sort_key(sort_key)
+        # artist and album come from the join used for sorting, genres from one extra IN query, and
+        # ratings from the aggregate columns, so rendering the page does not lazy load per track
+        query = self._session_cm.session.query(track.Track) \
+            .outerjoin(track.Track._Track__artist) \
+            .outerjoin(track.Track._Track__album) \
+            .options(contains_eager(track.Track._Track__artist), contains_eager(track.Track._Track__album),
+                     selectinload(track.Track._Track__genres))
+        if page > 1:
+            boundaries = self._get_page_boundaries(sort_key, descending, per_page)
+            if page > len(boundaries):
+                return []
+            first_key, first_id = boundaries[page - 1]
+            track_id = orm.track_table.c.id
+            if descending:
+                query = query.filter(or_(key_column < first_key, and_(key_column == first_key, track_id >= first_id)))
+            else:
+                query = query.filter(or_(key_column > first_key, and_(key_column == first_key, track_id >= first_id)))
+        return query.order_by(*self._sort_order_by(key_column, descending)).limit(per_page).all()
+
+    def _sort_key(self, function: str):
+        # title and duration are NOT NULL, so ordering on the bare columns can walk their indexes
+        if function == "get_track_name":
+            return orm.track_table.c.title
+        elif function == "get_track_duration":
+            return orm.track_table.c.duration
+        elif function == "get_track_artist_name":
+            return func.coalesce(orm.artist_table.c.full_name, "")
+        elif function == "get_track_album_name":
+            return func.coalesce(orm.album_table.c.title, "")
+        elif function == "get_track_rating":
+            return orm.track_rating
+        return orm.track_table.c.id
+
+    def _sort_order_by(self, key_column, descending: bool):
+        # ties keep ascending track id order in both directions, like a stable sort
+        if descending:
+            return [key_column.desc(), orm.track_table.c.id.asc()]
+        return [key_column.asc(), orm.track_table.c.id.asc()]
+
+    def _get_page_boundaries(self, sort_key: str, descending: bool, per_page: int) -> list:
+        """ The cached boundaries are kept with the catalogue version they were read at, and read again
+            once the version in the database moves on, as other workers share the database
+        """
+        cache_key = (sort_key, descending, per_page)
+        cached = self._page_boundaries.get(cache_key)
+        if cached is not None and cached[0] == self.get_catalogue_version():
+            return cached[1]
+        key_column = self._sort_key(sort_key)
+        row_number = func.row_number().over(order_by=self._sort_order_by(key_column, descending)).label("row_number")
+        ordered = select(key_column.label("sort_key"), orm.track_table.c.id.label("track_id"), row_number) \
+            .select_from(orm.track_table
+                         .outerjoin(orm.artist_table, orm.artist_table.c.id == orm.track_table.c.artist_id)
+                         .outerjoin(orm.album_table, orm.album_table.c.id == orm.track_table.c.album_id)) \
+            .subquery()
+        # the version is read in the same statement, so it is the one the boundaries belong to
+        version = select(orm.catalogue_version_table.c.version).scalar_subquery()
+        query = select(ordered.c.sort_key, ordered.c.track_id, version) \
+            .where((ordered.c.row_number - 1) % per_page == 0) \
+            .order_by(ordered.c.row_number)
+        rows = self._session_cm.session.execute(query).fetchall()
+        boundaries = [(sort_value, track_id) for sort_value, track_id, _ in rows]
+        version = rows[0][2] if rows else None
+        if version is not None:
+            self._page_boundaries[cache_key] = (version, boundaries)
+        return boundaries
 
     def add_album(self, album: album.Album):
         with self._session_cm as scm:
             scm.session.add(album)
+            self._new_catalogue_version()
             scm.commit()
+        self._page_boundaries.clear()
 
     def get_albums(self) -> list[album.Album]:
         album_list = self._session_cm.session.query(album.Album).all()
@@ -256,7 +321,9 @@ class SqlAlchemyRepository(AbstractRepository):
     def add_artist(self, artist: artist.Artist):
         with self._session_cm as scm:
             scm.session.add(artist)
+            self._new_catalogue_version()
             scm.commit()
+        self._page_boundaries.clear()
 
     def get_artists(self) -> list[artist.Artist]:
         artist_list = self._session_cm.session.query(artist.Artist).all()
@@ -274,6 +341,142 @@ class SqlAlchemyRepository(AbstractRepository):
         genre_list = self._session_cm.session.query(genre.Genre).all()
         return genre_list
 
+    def bulk_load(self, albums: list, artists: list, genres: list, tracks: list, batch_size: int = None):
+        """ Inserts the catalogue through batched Core executemany calls.
+            With no batch_size everything goes in as one transaction, otherwise
+            each batch of batch_size rows is committed on its own.
+        """
+        album_rows = [{'id': new_album.album_id, 'title': new_album.title,
+                       'album_url': getattr(new_album, 'album_url', None),
+                       'album_type': getattr(new_album, 'album_type', None),
+                       'release_year': getattr(new_album, 'release_year', None)} for new_album in albums]
+        artist_rows = [{'id': new_artist.artist_id, 'full_name': new_artist.full_name} for new_artist in artists]
+        genre_rows = [{'id': new_genre.genre_id, 'genre_name': new_genre.name} for new_genre in genres]
+        track_rows = []
+        track_genre_rows = []
+        for new_track in tracks:
+            track_rows.append({'id': new_track.track_id, 'title': new_track.title,
+                               'album_id': new_track.album.album_id if new_track.album is not None else None,
+                               'artist_id': new_track.artist.artist_id if new_track.artist is not None else None,
+                               'duration': new_track.track_duration, 'track_url': new_track.track_url,
+                               'review_count': new_track.get_num_of_reviews(), 'rating_sum': new_track.rating_sum})
+            for track_genre in new_track.genres:
+                track_genre_rows.append({'track_id': new_track.track_id, 'genre_id': track_genre.genre_id})
+
+        session = self._session_cm.session
+        try:
+            for table, rows in ((orm.album_table, album_rows), (orm.artist_table, artist_rows),
+                                (orm.genre_table, genre_rows), (orm.track_table, track_rows),
+                                (orm.track_genre_table, track_genre_rows)):
+                self._execute_in_batches(table.insert(), rows, batch_size)
+            self._new_catalogue_version()
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        finally:
+            self._page_boundaries.clear()
+
+    def _execute_in_batches(self, statement, rows: list, batch_size: int = None):
+        session = self._session_cm.session
+        step = batch_size or len(rows)
+        for start in range(0, len(rows), max(step, 1)):
+            session.execute(statement, rows[start:start + step])
+            if batch_size:
+                session.commit()
+
+    def sync_catalogue(self, data_path: Path, batch_size: int = None, force: bool = False) -> dict:
+        """ Brings the albums, artists, genres, tracks and track_genre tables in line with the CSV files
+            in data_path, writing only the rows that differ. Reviews of tracks no longer in the files are
+            deleted with them. Returns {table name: (inserted, updated, deleted)}, or an empty dict when
+            the files are unchanged since the last sync and force is not set.
+            Like bulk_load, it is one transaction unless batch_size is given. The file digests are saved
+            last, so a sync that fails part way is finished by the next one.
+            On SQLite the write lock is taken before the digests are compared, so when several workers
+            start together the first one syncs and the others wait for it and then find nothing to do.
+        """
+        session = self._session_cm.session
+        source_table = orm.catalogue_source_table
+        digests = csv_data_importer.source_digests(data_path)
+        if session.get_bind().dialect.name == 'sqlite':
+            session.execute(text("BEGIN IMMEDIATE"))
+        stored_digests = dict(session.execute(select(source_table.c.filename, source_table.c.digest)).fetchall())
+        if digests == stored_digests and not force:
+            session.rollback()
+            return {}
+
+        wanted = csv_data_importer.read_catalogue(data_path)
+        changes = {}
+        removed = {}
+        try:
+            for name, table, columns in (('albums', orm.album_table, ('title', 'album_url', 'album_type', 'release_year')),
+                                         ('artists', orm.artist_table, ('full_name',)),
+                                         ('genres', orm.genre_table, ('genre_name',)),
+                                         ('tracks', orm.track_table, ('title', 'album_id', 'artist_id', 'duration', 'track_url'))):
+                stored = {row[0]: tuple(row[1:]) for row in session.execute(select(table.c.id, *(table.c[column] for column in columns)))}
+                inserted = [{'id': row_id, **dict(zip(columns, values))}
+                            for row_id, values in wanted[name].items() if row_id not in stored]
+                updated = [{'row_id': row_id, **{'new_' + column: value for column, value in zip(columns, values)}}
+                           for row_id, values in wanted[name].items() if row_id in stored and stored[row_id] != values]
+                removed[name] = [{'row_id': row_id} for row_id in stored if row_id not in wanted[name]]
+                self._execute_in_batches(table.insert(), inserted, batch_size)
+                self._execute_in_batches(table.update().where(table.c.id == bindparam('row_id')).values(
+                    {column: bindparam('new_' + column) for column in columns}), updated, batch_size)
+                changes[name] = (len(inserted), len(updated), len(removed[name]))
+
+            track_genre_table = orm.track_genre_table
+            stored_genres = {}
+            for track_id, genre_id in session.execute(select(track_genre_table.c.track_id, track_genre_table.c.genre_id)):
+                stored_genres.setdefault(track_id, set()).add(genre_id)
+            changed = [track_id for track_id, genre_ids in wanted['track_genre'].items()
+                       if set(genre_ids) != stored_genres.get(track_id, set())]
+            stale = [{'row_id': track_id} for track_id in changed if track_id in stored_genres]
+            stale += [{'row_id': track_id} for track_id in stored_genres if track_id not in wanted['track_genre']]
+            inserted = [{'track_id': track_id, 'genre_id': genre_id} for track_id in changed
+                        for genre_id in wanted['track_genre'][track_id]]
+            self._execute_in_batches(track_genre_table.delete().where(track_genre_table.c.track_id == bindparam('row_id')),
+                                     stale, batch_size)
+            self._execute_in_batches(track_genre_table.insert(), inserted, batch_size)
+            changes['track_genre'] = (len(inserted), 0, sum(len(stored_genres[row['row_id']]) for row in stale))
+
+            self._execute_in_batches(orm.review_table.delete().where(orm.review_table.c.track_id == bindparam('row_id')),
+                                     removed['tracks'], batch_size)
+            for name, table in (('tracks', orm.track_table), ('genres', orm.genre_table),
+                                ('artists', orm.artist_table), ('albums', orm.album_table)):
+                self._execute_in_batches(table.delete().where(table.c.id == bindparam('row_id')), removed[name], batch_size)
+
+            self._save_source_digests(digests)
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        finally:
+            self._page_boundaries.clear()
+        return changes
+
+    def record_catalogue_sources(self, data_path: Path):
+        """ Marks the tables as in line with the CSV files in data_path, for use after populating them"""
+        self._save_source_digests(csv_data_importer.source_digests(data_path))
+        self._session_cm.session.commit()
+
+    def _save_source_digests(self, digests: dict):
+        session = self._session_cm.session
+        session.execute(orm.catalogue_source_table.delete())
+        session.execute(orm.catalogue_source_table.insert(),
+                        [{'filename': filename, 'digest': digest} for filename, digest in digests.items()])
+        self._new_catalogue_version()
+
+    def get_catalogue_version(self) -> str:
+        """ Read from the database, so every worker process gives the same version. Reviews get a new
+            version from the catalogue_version triggers, imports from _new_catalogue_version.
+        """
+        return self._session_cm.session.execute(select(orm.catalogue_version_table.c.version)).scalar()
+
+    def _new_catalogue_version(self):
+        session = self._session_cm.session
+        session.execute(orm.catalogue_version_table.delete())
+        session.execute(orm.catalogue_version_table.insert(), {'id': 1, 'version': uuid.uuid4().hex})
+
 
     def add_track_dict(self, track_object: track.Track, track_album: album.Album, track_artist: artist.Artist):
         #depreciated function, not used for the database 
@@ -283,85 +486,27 @@ class SqlAlchemyRepository(AbstractRepository):
         return self._session_cm.session.query(track.Track).all()
 
     def return_track_from_dict(self, input):
-        sql = f"""
-                    SELECT tracks.id, tracks.title, albums.id, albums.title, artists.id, artists.full_name, tracks.duration
-                    FROM tracks
-                    LEFT OUTER JOIN albums
-                    ON tracks.album_id = albums.id
-                    LEFT OUTER JOIN artists
-                    ON tracks.artist_id = artists.id
-                    WHERE tracks.title LIKE '%{input}%' OR albums.title LIKE '%{input}%' OR artists.full_name LIKE '%{input}%'
-                    """
-        sql2 = f"""  
-                    SELECT *
-                    FROM reviews
-                    LEFT OUTER JOIN users
-                    ON reviews.user_id = users.id
-                    """
-        x = self._session_cm.session.execute(sql)
-        return_list = []
-        for tup in x.fetchall():
-            newTrack = track.Track(int(tup[0]), tup[1])
-            newTrack.album = album.Album(int(tup[2]), tup[3])
-            newTrack.artist = artist.Artist(int(tup[4]), tup[5])
-            newTrack.track_duration = int(tup[6])
-            return_list.append(newTrack)
-        review_sql = self._session_cm.session.execute(sql2)
-        for obj in review_sql.fetchall():
-            for track_obj in return_list:
-                if track_obj.track_id == int(obj[2]):
-                    newReview = review.Review(track_obj, obj[3], int(obj[4]), user.User(int(obj[1]), obj[7], obj[8]))
-        return return_list
-        #for track_obj in self._session_cm.session.query(track.Track).all():
-        #    check_list = [track_obj.title, track_obj.artist.full_name, track_obj.album.title]
-        #    for item in check_list:
-        #        if input in item.lower():
-        #            return_list.append(track_obj)
-        #            if len(return_list) == 30:
-        #                return return_list
-
+        """ Searches the track_search FTS5 index, every word of input has to prefix a word of the
+            track title, album title or artist name. Best bm25 matches come first, title matches
+            weighted highest.
+        """
+        terms = re.findall(r"\w+", input)
+        if len(terms) == 0:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        rows = self._session_cm.session.execute(text("""
+                    SELECT rowid FROM track_search
+                    WHERE track_search MATCH :match
+                    ORDER BY bm25(track_search, 10.0, 5.0, 5.0), rowid
+                    LIMIT :limit
+                    """), {'match': match, 'limit': RESULT_LIMIT})
+        track_ids = [row[0] for row in rows]
+        return self._get_tracks_in_order(track_ids)
 
     def sort_tracks(self, function: str, order: bool):
-        return_list = []
-        if order == True:
-            updown = "DESC"
-        else:
-            updown = "ASC"
-        if function == "get_track_name":
-            func = "tracks.title"
-        elif function == "get_track_id":
-            func = "tracks.id"
-        elif function == "get_track_duration":
-            func = "tracks.duration"
-        elif function == "get_track_artist_name":
-            func = "artists.full_name"
-        elif function == "get_track_album_name":
-            func = "albums.title"
-        elif function == "get_track_rating":
-            func = "(reviews.rating)"
-        
-        sql = f"""  
-            SELECT *
-            FROM tracks
-            LEFT OUTER JOIN artists
-            ON artists.id = tracks.artist_id
-            LEFT OUTER JOIN albums
-            ON albums.id = tracks.album_id
-            LEFT OUTER JOIN reviews 
-            ON reviews.track_id = tracks.id
-            ORDER BY {func} {updown}
-            """
-        x = self._session_cm.session.execute(sql)
-        delete = "DELETE FROM sort_track"
-        self._session_cm.session.execute(delete)
-        temp_track_list = []
-        for obj in x.fetchall():
-            number = int(obj[0])
-            if number not in temp_track_list:
-                temp_track_list.append(number)
-                insert = f"INSERT INTO sort_track (track_id) VALUES ({number})"
-                self._session_cm.session.execute(insert)
-        self._session_cm.session.commit()
+        """ Only records the ordering, get_list_of_tracks applies it with ORDER BY"""
+        self._sort_function = function
+        self._sort_order = order
 
         #get_tracks = self._session_cm.session.query(track.Track).all()
         
@@ -418,52 +563,48 @@ class SqlAlchemyRepository(AbstractRepository):
         return track_obj.average_rating()
 
     def recommend_tracks(self, user_object: user):
-        high_reviewed_tracks = []
-        tracks_list = []
-        self.recommended_tracks = []
-        sql = f"""  
-                        SELECT *
-                        FROM tracks
-                        LEFT OUTER JOIN artists
-                        ON artists.id = tracks.artist_id
-                        LEFT OUTER JOIN albums
-                        ON albums.id = tracks.album_id
-                        """
-        sql2 = f"""  
-                        SELECT *
+        """ Same rules as RecommendationEngine, with each rule answered by a join on the
+            highly reviewed tracks rather than by loading the catalogue
+        """
+        sql = """
+                    WITH seeds AS (
+                        SELECT DISTINCT tracks.id, tracks.artist_id, tracks.album_id, tracks.duration
                         FROM reviews
-                        LEFT OUTER JOIN users
-                        ON users.id = reviews.user_id
-                        """
-        track_sql = self._session_cm.session.execute(sql)
-        for obj in track_sql.fetchall():
-            newTrack = track.Track(int(obj[0]), obj[1])
-            newTrack.track_duration = obj[4]
-            newTrack.artist = artist.Artist(int(obj[6]), obj[7])
-            try:
-                newTrack.album = album.Album(int(obj[8]), obj[9])
-            except:
-                newTrack.album = album.Album(0, "None")
-
-            tracks_list.append(newTrack)
-        review_sql = self._session_cm.session.execute(sql2)
-        for obj in review_sql.fetchall():
-            for track_obj in tracks_list:
-                if track_obj.track_id == int(obj[2]):
-                    newReview = review.Review(track_obj, obj[3], int(obj[4]), user.User(int(obj[1]), obj[7], obj[8]))
-                    if obj[4] > 3 and obj[1] == user_object.user_id:
-                        high_reviewed_tracks.append(track_obj)
-        for high_reviewed_track in high_reviewed_tracks:
-            for track_obj in tracks_list:
-                self.recommend_from_artist(high_reviewed_track, track_obj)
-                self.recommend_from_genre(high_reviewed_track, track_obj)
-                self.recommend_from_album(high_reviewed_track, track_obj)
-                self.recommend_from_duration(high_reviewed_track, track_obj)
-        random.shuffle(self.recommended_tracks)
-        if len(self.recommended_tracks) > 10:
-            self.recommended_tracks = self.recommended_tracks[0:10]
+                        JOIN tracks ON tracks.id = reviews.track_id
+                        WHERE reviews.user_id = :user_id AND reviews.rating > 3
+                    )
+                    SELECT id FROM (
+                    SELECT tracks.id AS id FROM seeds JOIN tracks
+                    ON tracks.artist_id = seeds.artist_id AND tracks.id != seeds.id
+                    UNION
+                    SELECT tracks.id FROM seeds JOIN tracks
+                    ON tracks.album_id = seeds.album_id AND tracks.id != seeds.id
+                    UNION
+                    SELECT related.track_id FROM seeds
+                    JOIN track_genre AS seed_genre ON seed_genre.track_id = seeds.id
+                    JOIN track_genre AS related ON related.genre_id = seed_genre.genre_id AND related.track_id != seeds.id
+                    UNION
+                    SELECT tracks.id FROM seeds JOIN tracks
+                    ON tracks.duration BETWEEN seeds.duration - :window AND seeds.duration + :window AND tracks.id != seeds.id
+                    )
+                    ORDER BY RANDOM()
+                    LIMIT :limit
+                    """
+        rows = self._session_cm.session.execute(text(sql), {'user_id': user_object.user_id, 'window': DURATION_WINDOW,
+                                                            'limit': RECOMMENDATION_LIMIT})
+        track_ids = [row[0] for row in rows]
+        self.recommended_tracks = self._get_tracks_in_order(track_ids)
         return self.recommended_tracks
-    
+
+    def _get_tracks_in_order(self, track_ids: list) -> list[track.Track]:
+        """ Loads the tracks with these ids, with their artist, album and genres, in the order given"""
+        query = self._session_cm.session.query(track.Track) \
+            .options(selectinload(track.Track._Track__artist), selectinload(track.Track._Track__album),
+                     selectinload(track.Track._Track__genres)) \
+            .filter(orm.track_table.c.id.in_(track_ids))
+        tracks = {track_obj.track_id: track_obj for track_obj in query}
+        return [tracks[track_id] for track_id in track_ids if track_id in tracks]
+
     def recommend_from_artist(self, high_reviewed_track, track_object):
         if high_reviewed_track.artist == track_object.artist and high_reviewed_track != track_object and track_object not in self.recommended_tracks:
             self.recommended_tracks.append(track_object)
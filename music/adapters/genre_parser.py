@@ -0,0 +1,49 @@
+import ast, re
+
+# A Python string literal without escapes, in either quote style
+STRING = r"""(?:'[^'\\\n]*'|"[^"\\\n]*")"""
+PAIR = rf"\s*{STRING}\s*:\s*{STRING}\s*"
+GENRE = rf"\s*\{{(?:{PAIR}(?:,{PAIR})*,?)?\s*\}}\s*"
+# The whole column value: a list of dicts whose keys and values are all plain strings
+GENRE_LIST = re.compile(rf"\s*\[(?:{GENRE}(?:,{GENRE})*,?)?\s*\]\s*")
+# Once a value matches GENRE_LIST, these are the only tokens that matter
+TOKEN = re.compile(r"""'([^'\n]*)'|"([^"\n]*)"|([{}])""")
+# Genre combinations repeat heavily, so each distinct column value is parsed once
+CACHE_LIMIT = 4096
+
+_parsed = {}
+
+
+def parse_genres(raw: str) -> list:
+    """ Parses the track_genres column, a list of dicts of strings written as a Python literal,
+        into the same value ast.literal_eval gives. Values in any other form, such as ones with
+        escapes or numbers, go to ast.literal_eval. The result is shared between equal raw
+        values and must not be modified.
+    """
+    genres = _parsed.get(raw)
+    if genres is None:
+        genres = _scan(raw)
+        if genres is None:
+            genres = ast.literal_eval(raw)
+        if len(_parsed) < CACHE_LIMIT:
+            _parsed[raw] = genres
+    return genres
+
+
+def _scan(raw: str):
+    """ Returns the list of dicts in raw, or None if raw does not match GENRE_LIST"""
+    if GENRE_LIST.fullmatch(raw) is None:
+        return None
+    genres = []
+    key = None
+    for single, double, brace in TOKEN.findall(raw):
+        if brace == '{':
+            genre = {}
+        elif brace == '}':
+            genres.append(genre)
+        elif key is None:
+            key = single or double
+        else:
+            genre[key] = single or double
+            key = None
+    return genres
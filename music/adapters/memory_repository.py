@@ -1,7 +1,12 @@
-import csv, ast, random
+import csv, random, bisect, uuid
+from contextlib import contextmanager
 from pathlib import Path
 
-from music.adapters.repository import AbstractRepository, RepositoryException
+from music.adapters.repository import AbstractRepository, RepositoryException, SORT_METHODS
+from music.adapters import csv_data_importer
+from music.adapters.genre_parser import parse_genres
+from music.adapters.search_index import TrigramIndex
+from music.adapters.recommendation_engine import RecommendationEngine
 from music.domainmodel import album, artist, genre, playlist, review, track, user
 
 
@@ -13,47 +18,64 @@ class MemoryRepository(AbstractRepository):
         self.__genres = []
         self.__users = []
         self.__reviews = []
+        # primary key indexes, kept in step with the lists above by the add_* methods
+        self.__tracks_by_id = {}
+        self.__albums_by_id = {}
+        self.__artists_by_id = {}
+        self.__users_by_name = {}
+        # (sort function, descending) -> ([sort keys], [tracks]), both kept in ascending key order
+        # by bisect insertion so that any ordering can be read without sorting at request time
+        self.__sort_indexes = {(function, order): ([], []) for function in SORT_METHODS for order in (False, True)}
+        self.__track_sequence = {}
+        self.__next_sequence = 0
+        self.__rating_values = {}
+        self.__defer_indexes = False
+        self.__deferred_tracks = []
         # self.__playlists = {} #TODO ?
         self.__track_dict = {}
+        self.__search_index = TrigramIndex()
+        self.__recommendation_engine = RecommendationEngine()
         self.__sorted_tracks = []
-        self.__high_reviewed_tracks = []
         self.__recommended_tracks = []
+        # made on first use after a change, so importing tracks does not create a token per track
+        self.__catalogue_version = None
+
+    def __getstate__(self):
+        # the sort index bookkeeping is keyed by id(), which does not survive pickling,
+        # so store it against the tracks themselves (see snapshot.py)
+        state = self.__dict__.copy()
+        tracks = {id(track_obj): track_obj for track_obj in self.__tracks}
+        state['_MemoryRepository__track_sequence'] = [(tracks[key], sequence) for key, sequence in self.__track_sequence.items()]
+        state['_MemoryRepository__rating_values'] = [(tracks[key], value) for key, value in self.__rating_values.items()]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__track_sequence = {id(track_obj): sequence for track_obj, sequence in state['_MemoryRepository__track_sequence']}
+        self.__rating_values = {id(track_obj): value for track_obj, value in state['_MemoryRepository__rating_values']}
 
     #def create_user(self, username, password):
 
     def add_user(self, new_user: user):
         super().add_user(new_user)
         self.__users.append(new_user)
+        if new_user.user_name is not None:
+            self.__users_by_name.setdefault(new_user.user_name.casefold(), new_user)
 
     """def remove_user(self, user_name: str):
         # TODO - Current ID method will not work when this is implemented, need to rethink it
         pass"""
 
     def get_user(self, user_name: str):
-        for user_object in self.__users:
-            if user_object.user_name.lower() == user_name.lower():
-                return user_object
-        return None
+        return self.__users_by_name.get(user_name.casefold())
 
     def add_review_to_user(self, current_user: user.User, new_review: review.Review):
-        flag = True
-        for old_review in range(len(current_user.reviews)): # check if review is in user obj
-            if current_user.reviews[old_review].track.track_id == new_review.track.track_id:
-                flag = False
-                current_user.reviews[old_review] = new_review # replace if review is in user obj
-                return None
-        if flag:
-            current_user.add_review(new_review)
+        current_user.set_track_review(new_review)
 
     def add_review_to_track(self, current_track: track.Track, new_review: review.Review, current_user: user.User):
-        flag = True
-        for old_track in range(len(current_track.reviews)): # check if review is in track obj
-            if current_track.reviews[old_track].review_user == current_user:
-                flag = False
-                current_track.reviews[old_track] = new_review # replace if review is in track obj
-                return None
-        if flag:
-            current_track.add_review(new_review)
+        current_track.set_user_review(new_review)
+        self.__update_rating_index(current_track)
+        self._catalogue_changed()
 
     """def get_user_count(self) -> int:
         return len(self.__users)"""
@@ -150,6 +172,13 @@ class MemoryRepository(AbstractRepository):
     def add_track(self, new_track: track):
         super().add_track(new_track)
         self.__tracks.append(new_track)
+        self.__tracks_by_id.setdefault(new_track.track_id, new_track)
+        if self.__defer_indexes:
+            self.__deferred_tracks.append(new_track)
+        else:
+            self.__recommendation_engine.add_track(new_track)
+            self.__add_to_sort_indexes(new_track)
+        self._catalogue_changed()
 
     def add_track_to_sort(self, new_track: track):
         super().add_track(new_track)
@@ -159,10 +188,7 @@ class MemoryRepository(AbstractRepository):
         return self.__sorted_tracks
 
     def get_track(self, track_id: int) -> track:
-        for track_object in self.__tracks:
-            if track_object.track_id == track_id:
-                return track_object
-        return None
+        return self.__tracks_by_id.get(track_id)
 
     """def get_tracks_by_duration(self, duration: int) -> list[track]:
         return_tracks = []
@@ -186,6 +212,16 @@ class MemoryRepository(AbstractRepository):
     def get_number_of_tracks(self) -> int:
         return len(self.__tracks)
 
+    def get_catalogue_version(self) -> str:
+        # a random token rather than a counter, so worker processes forked from one repository
+        # cannot reach the same version with different reviews
+        if self.__catalogue_version is None:
+            self.__catalogue_version = uuid.uuid4().hex
+        return self.__catalogue_version
+
+    def _catalogue_changed(self):
+        self.__catalogue_version = None
+
     """def get_first_track(self) -> track:
         # TODO: Decide whether we want to sort the tracks specifically or just by when added
         return self.__tracks[0]
@@ -202,6 +238,77 @@ class MemoryRepository(AbstractRepository):
         last_track = first_track+songs_per_page
         return self.__sorted_tracks[first_track:last_track]
 
+    def get_page(self, sort_key: str, descending: bool, page: int, per_page: int) -> list[track.Track]:
+        if sort_key not in SORT_METHODS:
+            raise RepositoryException(f"Unknown sort method {sort_key}")
+        first_track = (page-1)*per_page
+        last_track = first_track+per_page
+        tracks = self.__sort_indexes[(sort_key, descending)][1]
+        if not descending:
+            return tracks[first_track:last_track]
+        # descending indexes are stored ascending, so read the page from the end backwards
+        size = len(tracks)
+        return tracks[max(size-last_track, 0):max(size-first_track, 0)][::-1]
+
+    def __sort_value(self, function: str, track_obj: track.Track):
+        try:
+            value = getattr(self, function)(track_obj)
+        except AttributeError:
+            value = None
+        # tracks missing the attribute sort before all others instead of failing the comparison
+        if value is None:
+            return (0, 0)
+        return (1, value)
+
+    def __sort_key(self, value, sequence: int, order: bool):
+        # ties keep the order tracks were added in, in both directions, like a stable sort
+        return (value, -sequence if order else sequence)
+
+    def __add_to_sort_indexes(self, new_track: track.Track):
+        sequence = self.__next_sequence
+        self.__next_sequence += 1
+        self.__track_sequence[id(new_track)] = sequence
+        for function in SORT_METHODS:
+            value = self.__sort_value(function, new_track)
+            if function == "get_track_rating":
+                self.__rating_values[id(new_track)] = value
+            for order in (False, True):
+                self.__insert_into_index(function, order, self.__sort_key(value, sequence, order), new_track)
+
+    def __insert_into_index(self, function: str, order: bool, key, track_obj: track.Track):
+        keys, tracks = self.__sort_indexes[(function, order)]
+        position = bisect.bisect_left(keys, key)
+        keys.insert(position, key)
+        tracks.insert(position, track_obj)
+
+    def __update_rating_index(self, track_obj: track.Track):
+        sequence = self.__track_sequence.get(id(track_obj))
+        if sequence is None:
+            return
+        old_value = self.__rating_values[id(track_obj)]
+        new_value = self.__sort_value("get_track_rating", track_obj)
+        if old_value == new_value:
+            return
+        self.__rating_values[id(track_obj)] = new_value
+        for order in (False, True):
+            keys, tracks = self.__sort_indexes[("get_track_rating", order)]
+            position = bisect.bisect_left(keys, self.__sort_key(old_value, sequence, order))
+            del keys[position]
+            del tracks[position]
+            self.__insert_into_index("get_track_rating", order, self.__sort_key(new_value, sequence, order), track_obj)
+
+    def __rebuild_sort_indexes(self):
+        self.__track_sequence = {id(track_obj): sequence for sequence, track_obj in enumerate(self.__tracks)}
+        self.__next_sequence = len(self.__tracks)
+        for function in SORT_METHODS:
+            values = [self.__sort_value(function, track_obj) for track_obj in self.__tracks]
+            if function == "get_track_rating":
+                self.__rating_values = {id(track_obj): value for track_obj, value in zip(self.__tracks, values)}
+            for order in (False, True):
+                entries = sorted((self.__sort_key(value, sequence, order), sequence) for sequence, value in enumerate(values))
+                self.__sort_indexes[(function, order)] = ([key for key, _ in entries],
+                                                          [self.__tracks[sequence] for _, sequence in entries])
+
     """def get_tracks_by_album(self, album_id: int) -> list[track]:
         return_tracks = []
         for track_object in self.__tracks:
@@ -231,26 +338,24 @@ class MemoryRepository(AbstractRepository):
     def add_album(self, new_album: album):
         super().add_album(new_album)
         self.__albums.append(new_album)
+        self.__albums_by_id.setdefault(new_album.album_id, new_album)
 
     def get_albums(self) -> list[album.Album]:
         return self.__albums
     
     def get_album(self, index: int) -> album.Album:
-        for check_album in self.__albums:
-            if check_album.album_id == index:
-                return check_album
+        return self.__albums_by_id.get(index)
 
     def add_artist(self, new_artist: artist):
         super().add_artist(new_artist)
         self.__artists.append(new_artist)
+        self.__artists_by_id.setdefault(new_artist.artist_id, new_artist)
 
     def get_artists(self) -> list[artist.Artist]:
         return self.__artists
     
     def get_artist(self, index: int) -> artist.Artist:
-        for check_artist in self.__artists:
-            if check_artist.artist_id == index:
-                return check_artist
+        return self.__artists_by_id.get(index)
 
     def add_genre(self, new_genre: genre):
         super().add_genre(new_genre)
@@ -259,22 +364,36 @@ class MemoryRepository(AbstractRepository):
     def get_genres(self) -> list[genre.Genre]:
         return self.__genres
 
+    @contextmanager
+    def deferred_indexes(self):
+        """ Tracks added inside the block are left out of the sort and recommendation indexes, which
+            are then sorted once at the end rather than bisecting every track in
+        """
+        self.__defer_indexes = True
+        try:
+            yield
+        finally:
+            self.__defer_indexes = False
+            self.__recommendation_engine.add_tracks(self.__deferred_tracks)
+            self.__deferred_tracks = []
+            self.__rebuild_sort_indexes()
+
+    def bulk_load(self, albums: list, artists: list, genres: list, tracks: list):
+        with self.deferred_indexes():
+            super().bulk_load(albums, artists, genres, tracks)
+        for new_track in tracks:
+            self.add_track_to_sort(new_track)
+            self.add_track_dict(new_track, new_track.album, new_track.artist)
+
     def add_track_dict(self, track_object: track, track_album: album, track_artist: artist):
         self.__track_dict[track_object] = [track_object.title, track_album.title, track_artist.full_name]
+        self.__search_index.add(track_object, self.__track_dict[track_object])
 
     def get_track_dict(self):
         return self.__track_dict
 
     def return_track_from_dict(self, input):
-        input = input.lower()
-        return_list = []
-        for track_obj in self.__track_dict:
-            for item in self.__track_dict[track_obj]:
-                if input in item.lower():
-                    return_list.append(track_obj)
-                    if len(return_list) == 30:
-                        return return_list
-        return return_list
+        return self.__search_index.search(input)
 
     def sort_tracks(self, function: str, order: bool):
         """
@@ -285,9 +404,10 @@ class MemoryRepository(AbstractRepository):
                   track name desc = sort_tracks(get_track_name, True)
         """
 
-        function = "self." + function
-
-        self.__sorted_tracks = sorted(self.__tracks, reverse=order, key=eval(function))
+        if function not in SORT_METHODS:
+            raise RepositoryException(f"Unknown sort method {function}")
+        tracks = self.__sort_indexes[(function, order)][1]
+        self.__sorted_tracks = tracks[::-1] if order else list(tracks)
 
     def get_track_name(self, track_obj):
         return track_obj.title
@@ -308,20 +428,7 @@ class MemoryRepository(AbstractRepository):
         return track_obj.average_rating()
 
     def recommend_tracks(self, user_object: user):
-        self.__high_reviewed_tracks.clear()
-        self.__recommended_tracks.clear()
-        for user_review in user_object.reviews:
-            if user_review.rating > 3:
-                self.__high_reviewed_tracks.append(user_review.track)
-        for high_reviewed_track in self.__high_reviewed_tracks:
-            for track_object in self.__tracks:
-                self.recommend_from_artist(high_reviewed_track, track_object)
-                self.recommend_from_genre(high_reviewed_track, track_object)
-                self.recommend_from_album(high_reviewed_track, track_object)
-                self.recommend_from_duration(high_reviewed_track, track_object)
-        random.shuffle(self.__recommended_tracks)
-        if len(self.__recommended_tracks) > 10:
-            self.__recommended_tracks = self.__recommended_tracks[0:10]
+        self.__recommended_tracks = self.__recommendation_engine.recommend_tracks(user_object)
         return self.__recommended_tracks
 
     def recommend_from_artist(self, high_reviewed_track, track_object):
@@ -358,49 +465,37 @@ class MemoryRepository(AbstractRepository):
 
 def load_tracks(data_path: Path, repo: MemoryRepository):
     tracks_filename = str(Path(data_path) / "raw_tracks_excerpt.csv")
-    for row in MemoryRepository.read_csv_file(tracks_filename):
-        if row[0] == "track_id":
-            continue
-        track_name_fixed = row[37].replace('&amp;', '&')
-        new_track = track.Track(int(row[0]), track_name_fixed)
-        if row[1] == "":
-            new_track.album = album.Album(0, "None")
-        else:
-            album_name_fixed = row[2].replace('&amp;', '&')
-            new_track.album = album.Album(int(row[1]), album_name_fixed)
-        if row[4] == "":
-            new_track.artist = artist.Artist(0, "None")
-        else:
-            artist_name_fixed = row[5].replace('&amp;', '&')
-            new_track.artist = artist.Artist(int(row[4]), artist_name_fixed)
-        if row[27] != "":
-            for genre_object in ast.literal_eval(row[27]):
-                new_genre = genre.Genre(int(genre_object["genre_id"]), genre_object["genre_title"])
-                new_track.add_genre(new_genre)
-        if row[38] != "":
-            new_track.track_url = row[38]
-        new_track.track_duration = int(float(row[22]))
-        repo.add_track(new_track)
-        repo.add_track_to_sort(new_track)
-        repo.add_track_dict(new_track, new_track.album, new_track.artist)
+    with repo.deferred_indexes():
+        for row in MemoryRepository.read_csv_file(tracks_filename):
+            if row[0] == "track_id":
+                continue
+            track_name_fixed = row[37].replace('&amp;', '&')
+            new_track = track.Track(int(row[0]), track_name_fixed)
+            if row[1] == "":
+                new_track.album = album.Album(0, "None")
+            else:
+                album_name_fixed = row[2].replace('&amp;', '&')
+                new_track.album = album.Album(int(row[1]), album_name_fixed)
+            if row[4] == "":
+                new_track.artist = artist.Artist(0, "None")
+            else:
+                artist_name_fixed = row[5].replace('&amp;', '&')
+                new_track.artist = artist.Artist(int(row[4]), artist_name_fixed)
+            if row[27] != "":
+                for genre_object in parse_genres(row[27]):
+                    new_genre = genre.Genre(int(genre_object["genre_id"]), genre_object["genre_title"])
+                    new_track.add_genre(new_genre)
+            if row[38] != "":
+                new_track.track_url = row[38]
+            new_track.track_duration = int(float(row[22]))
+            repo.add_track(new_track)
+            repo.add_track_to_sort(new_track)
+            repo.add_track_dict(new_track, new_track.album, new_track.artist)
 
 
 def load_albums(data_path: Path, repo: MemoryRepository):
-    albums_filename = str(Path(data_path) / "raw_albums_excerpt.csv")
-    for row in MemoryRepository.read_csv_file(albums_filename):
-        if row[0] == "album_id":
-            continue
-        album_name_fixed = row[12].replace('&amp;', '&')
-        new_album = album.Album(int(row[0]), album_name_fixed)
-        new_album.album_url = row[15]
-        new_album.album_type = row[14]
-        if row[3] == "":
-            new_album.release_year = None
-        else:
-            new_album.release_year = int(row[3])
-        album_list = repo.get_albums()
-        if new_album not in album_list:
-            repo.add_album(new_album)
+    for album_id, album_values in csv_data_importer.read_album_table(data_path).items():
+        repo.add_album(csv_data_importer.create_album(album_id, album_values))
 
 
 def load_artists(data_path: Path, repo: MemoryRepository):
@@ -426,7 +521,7 @@ def load_genres(data_path: Path, repo: MemoryRepository):
         if row[0] == "track_id":
             continue
         if row[27] != "":
-            genre_list = ast.literal_eval(row[27])
+            genre_list = parse_genres(row[27])
         else:
             continue
         track_name_fixed = row[37].replace('&amp;', '&')
@@ -445,7 +540,16 @@ def load_genres(data_path: Path, repo: MemoryRepository):
 
 
 
-def populate(data_path: Path, repo: MemoryRepository):
+def populate(data_path: Path, repo: MemoryRepository, single_pass: bool = False, workers: int = 1):
+    """ Loads the CSV files in data_path into repo. The tracks, artists and genres are the same either way,
+        but the single pass importer links each track to the shared Album from the albums file, which
+        lists its tracks, and leaves a missing track url as '', where the load_* passes below give each
+        track a bare Album of its own and leave the url as None. Its album list also holds album 0 and
+        the albums tracks name that are missing from the albums file.
+    """
+    if single_pass:
+        csv_data_importer.load_all(data_path, repo, workers)
+        return
     load_tracks(data_path, repo)
     load_albums(data_path, repo)
     load_artists(data_path, repo)
@@ -1,6 +1,7 @@
 from pickle import FALSE
 from typing import Counter
-from sqlalchemy import Table, MetaData, Column, Integer, String, Date, DateTime, ForeignKey
+from sqlalchemy import Table, MetaData, Column, Integer, String, Date, DateTime, Float, ForeignKey, Index, inspect, event, DDL, \
+    func, cast, literal_column
 from sqlalchemy.orm import mapper, relationship, synonym
 from music.domainmodel import album, artist, genre, playlist, review, track, user
 
@@ -48,6 +49,9 @@ track_table = Table(
     Column('artist_id', ForeignKey('artists.id')),
     Column('duration', Integer, nullable=False),
     Column('track_url', String(1024)), 
+    # running totals of the track's reviews, so average rating is rating_sum / review_count
+    Column('review_count', Integer, nullable=False, server_default='0'),
+    Column('rating_sum', Integer, nullable=False, server_default='0'),
 )
 track_genre_table = Table(
     'track_genre', metadata,
@@ -55,12 +59,158 @@ track_genre_table = Table(
     Column('track_id', ForeignKey('tracks.id')),
     Column('genre_id', ForeignKey('genres.id')),
 )
-sorted_track_table = Table(
-    'sort_track', metadata,
-    Column('id', Integer, primary_key=True, autoincrement=True),
-    Column('track_id', Integer, nullable=False)
+# Digest of each CSV file as of the last catalogue sync, so an unchanged file is not diffed again
+catalogue_source_table = Table(
+    'catalogue_sources', metadata,
+    Column('filename', String(255), primary_key=True),
+    Column('digest', String(64), nullable=False)
+)
+# One row (id 1) holding a random token, replaced whenever tracks are imported or reviewed. The browse
+# pages build their ETags from it
+catalogue_version_table = Table(
+    'catalogue_version', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('version', String(32), nullable=False)
 )
 
+# Average rating of a track, 0 when unreviewed. The constants are inlined rather than bound so that
+# the ORDER BY matches ix_tracks_rating_id
+track_rating = func.coalesce(cast(track_table.c.rating_sum, Float) / func.nullif(track_table.c.review_count, literal_column('0')),
+                             literal_column('0'))
+
+# Secondary indexes: the foreign keys used by joins and lazy loads, the browse sort keys (with id
+# as the tie break, so a keyset page is a range of the index) and one review per user per track
+indexes = [
+    Index('ix_tracks_album_id', track_table.c.album_id),
+    Index('ix_tracks_artist_id', track_table.c.artist_id),
+    Index('ix_tracks_title_id', track_table.c.title, track_table.c.id),
+    Index('ix_tracks_duration_id', track_table.c.duration, track_table.c.id),
+    Index('ix_tracks_rating_id', track_rating, track_table.c.id),
+    Index('ix_albums_title_id', album_table.c.title, album_table.c.id),
+    Index('ix_artists_full_name_id', artist_table.c.full_name, artist_table.c.id),
+    Index('ix_track_genre_track_id_genre_id', track_genre_table.c.track_id, track_genre_table.c.genre_id),
+    Index('ix_track_genre_genre_id_track_id', track_genre_table.c.genre_id, track_genre_table.c.track_id),
+    Index('ix_reviews_track_id', review_table.c.track_id),
+    Index('uq_reviews_user_id_track_id', review_table.c.user_id, review_table.c.track_id, unique=True),
+]
+
+# FTS5 index over each track's title, album title and artist name, keyed by track id.
+# The triggers keep it in step with every write to tracks, albums and artists.
+search_index_ddl = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS track_search USING fts5(title, album_title, artist_name, prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS track_search_insert AFTER INSERT ON tracks BEGIN
+        INSERT INTO track_search(rowid, title, album_title, artist_name) VALUES (new.id, new.title,
+            COALESCE((SELECT title FROM albums WHERE id = new.album_id), ''),
+            COALESCE((SELECT full_name FROM artists WHERE id = new.artist_id), ''));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS track_search_update AFTER UPDATE OF title, album_id, artist_id ON tracks BEGIN
+        UPDATE track_search SET title = new.title,
+            album_title = COALESCE((SELECT title FROM albums WHERE id = new.album_id), ''),
+            artist_name = COALESCE((SELECT full_name FROM artists WHERE id = new.artist_id), '')
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS track_search_delete AFTER DELETE ON tracks BEGIN
+        DELETE FROM track_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS track_search_album_update AFTER UPDATE OF title ON albums BEGIN
+        UPDATE track_search SET album_title = new.title
+        WHERE rowid IN (SELECT id FROM tracks WHERE album_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS track_search_artist_update AFTER UPDATE OF full_name ON artists BEGIN
+        UPDATE track_search SET artist_name = new.full_name
+        WHERE rowid IN (SELECT id FROM tracks WHERE artist_id = new.id);
+    END""",
+]
+# Triggers keeping tracks.review_count and tracks.rating_sum in step with the reviews table, so that
+# inserting or upserting a review is the only statement needed to post it
+rating_totals_ddl = [
+    """CREATE TRIGGER IF NOT EXISTS rating_totals_insert AFTER INSERT ON reviews BEGIN
+        UPDATE tracks SET review_count = review_count + 1, rating_sum = rating_sum + new.rating
+        WHERE id = new.track_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rating_totals_update AFTER UPDATE OF rating, track_id ON reviews BEGIN
+        UPDATE tracks SET review_count = review_count - 1, rating_sum = rating_sum - old.rating
+        WHERE id = old.track_id;
+        UPDATE tracks SET review_count = review_count + 1, rating_sum = rating_sum + new.rating
+        WHERE id = new.track_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rating_totals_delete AFTER DELETE ON reviews BEGIN
+        UPDATE tracks SET review_count = review_count - 1, rating_sum = rating_sum - old.rating
+        WHERE id = old.track_id;
+    END""",
+]
+# Triggers giving the catalogue a new version with every change to the reviews, in the statement that
+# makes the change. The row is deleted and inserted again, as a REPLACE inside a trigger would take on
+# the conflict handling of the review upsert that fired it
+catalogue_version_ddl = [
+    f"""CREATE TRIGGER IF NOT EXISTS catalogue_version_review_{event_name.lower()} AFTER {event_name} ON reviews BEGIN
+        DELETE FROM catalogue_version;
+        INSERT INTO catalogue_version (id, version) VALUES (1, lower(hex(randomblob(16))));
+    END""" for event_name in ('INSERT', 'UPDATE', 'DELETE')
+]
+for statement in search_index_ddl + rating_totals_ddl + catalogue_version_ddl:
+    event.listen(metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(metadata, 'before_drop', DDL("DROP TABLE IF EXISTS track_search").execute_if(dialect='sqlite'))
+
+recompute_rating_totals = """
+    UPDATE tracks
+    SET review_count = (SELECT COUNT(*) FROM reviews WHERE reviews.track_id = tracks.id),
+        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.track_id = tracks.id)
+    """
+
+def upgrade_database(engine):
+    """ Brings a database created by an older version of this schema up to date.
+        Safe to run on every start up, it only changes what is missing.
+    """
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            # take the write lock before reading the schema, so that of several workers starting on an old
+            # database the first upgrades it and the others find it up to date
+            connection.execute("BEGIN IMMEDIATE")
+        inspector = inspect(connection)
+        track_columns = [column['name'] for column in inspector.get_columns('tracks')]
+        has_search_index = inspector.has_table('track_search')
+        catalogue_source_table.create(connection, checkfirst=True)
+        catalogue_version_table.create(connection, checkfirst=True)
+        if 'review_count' not in track_columns:
+            connection.execute("ALTER TABLE tracks ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0")
+        if 'rating_sum' not in track_columns:
+            connection.execute("ALTER TABLE tracks ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0")
+        if 'review_count' not in track_columns or 'rating_sum' not in track_columns:
+            connection.execute(recompute_rating_totals)
+        if engine.dialect.name == 'sqlite' and not has_search_index:
+            for statement in search_index_ddl:
+                connection.execute(statement)
+            connection.execute("""
+                INSERT INTO track_search(rowid, title, album_title, artist_name)
+                SELECT tracks.id, tracks.title, COALESCE(albums.title, ''), COALESCE(artists.full_name, '')
+                FROM tracks
+                LEFT OUTER JOIN albums ON tracks.album_id = albums.id
+                LEFT OUTER JOIN artists ON tracks.artist_id = artists.id
+                """)
+        # the inspector does not report expression indexes or triggers, so read the names from the schema table
+        existing_indexes = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        existing_triggers = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+        if 'uq_reviews_user_id_track_id' not in existing_indexes:
+            # older versions could leave more than one review per user per track, keep the newest
+            removed = connection.execute("""
+                DELETE FROM reviews
+                WHERE id NOT IN (SELECT MAX(id) FROM reviews GROUP BY user_id, track_id)
+                """).rowcount
+            if removed:
+                connection.execute(recompute_rating_totals)
+        if engine.dialect.name == 'sqlite' and 'rating_totals_insert' not in existing_triggers:
+            for statement in rating_totals_ddl:
+                connection.execute(statement)
+            connection.execute(recompute_rating_totals)
+        if engine.dialect.name == 'sqlite' and 'catalogue_version_review_insert' not in existing_triggers:
+            for statement in catalogue_version_ddl:
+                connection.execute(statement)
+            connection.execute("INSERT OR IGNORE INTO catalogue_version (id, version) VALUES (1, lower(hex(randomblob(16))))")
+        for index in indexes:
+            if index.name not in existing_indexes:
+                index.create(connection, checkfirst=True)
+
 def map_model_to_tables():
     mapper(user.User, user_table, properties={
         '_User__user_id': user_table.c.id,
@@ -98,6 +248,8 @@ def map_model_to_tables():
         #'_Track__artist_id': relationship(artist.Artist),
         '_Track__track_duration': track_table.c.duration,
         '_Track__track_url': track_table.c.track_url,
+        '_Track__review_count': track_table.c.review_count,
+        '_Track__rating_sum': track_table.c.rating_sum,
         '_Track__genres': relationship(genre.Genre, secondary=track_genre_table, back_populates='_Genre__applied_to'),
         '_Track__reviews': relationship(review.Review, backref='_Review__track'),
         #'_Track__album': relationship(album.Album),#, backref='_Album__tracks'), # TODO: NOT COMPLETE/WORKING
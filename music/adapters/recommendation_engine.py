@@ -0,0 +1,83 @@
+import bisect, random
+
+from music.domainmodel import track, user
+
+# Most tracks recommend_tracks returns
+RECOMMENDATION_LIMIT = 10
+# Tracks within this many seconds of a highly reviewed track are recommended
+DURATION_WINDOW = 15
+
+
+class RecommendationEngine:
+    """ Indexes tracks by artist, album, genre and duration so the tracks related to a highly
+        reviewed track can be looked up instead of found by comparing it against every track.
+
+        A track is recommended if it shares an artist, album or genre with, or is within
+        DURATION_WINDOW seconds of, a track the user rated above 3. The reviewed track itself is
+        never recommended from its own review, and at most RECOMMENDATION_LIMIT tracks are picked
+        at random from the matches.
+    """
+
+    def __init__(self):
+        self.__by_artist = {}
+        self.__by_album = {}
+        self.__by_genre = {}
+        # (duration, insertion order) keys and their tracks, kept sorted for range lookups
+        self.__duration_keys = []
+        self.__duration_tracks = []
+        self.__indexed = set()
+
+    def __index(self, new_track: track.Track) -> bool:
+        """ Adds new_track to the artist, album and genre indexes, False if it was already indexed"""
+        if new_track in self.__indexed:
+            return False
+        self.__indexed.add(new_track)
+        if new_track.artist is not None:
+            self.__by_artist.setdefault(new_track.artist, {})[new_track] = None
+        if new_track.album is not None:
+            self.__by_album.setdefault(new_track.album, {})[new_track] = None
+        for track_genre in new_track.genres:
+            self.__by_genre.setdefault(track_genre, {})[new_track] = None
+        return True
+
+    def add_track(self, new_track: track.Track):
+        if self.__index(new_track) and new_track.track_duration is not None:
+            key = (new_track.track_duration, len(self.__indexed))
+            position = bisect.bisect(self.__duration_keys, key)
+            self.__duration_keys.insert(position, key)
+            self.__duration_tracks.insert(position, new_track)
+
+    def add_tracks(self, tracks: list):
+        """ Same as calling add_track for each track, with the duration index sorted once at the end"""
+        for new_track in tracks:
+            if self.__index(new_track) and new_track.track_duration is not None:
+                self.__duration_keys.append((new_track.track_duration, len(self.__indexed)))
+                self.__duration_tracks.append(new_track)
+        order = sorted(range(len(self.__duration_keys)), key=self.__duration_keys.__getitem__)
+        self.__duration_keys = [self.__duration_keys[position] for position in order]
+        self.__duration_tracks = [self.__duration_tracks[position] for position in order]
+
+    def related_tracks(self, seed_track: track.Track) -> dict:
+        """ Returns every indexed track related to seed_track, other than seed_track itself"""
+        related = {}
+        related.update(self.__by_artist.get(seed_track.artist, {}))
+        related.update(self.__by_album.get(seed_track.album, {}))
+        for track_genre in seed_track.genres:
+            related.update(self.__by_genre.get(track_genre, {}))
+        if seed_track.track_duration is not None:
+            start = bisect.bisect_left(self.__duration_keys, (seed_track.track_duration - DURATION_WINDOW,))
+            end = bisect.bisect_right(self.__duration_keys, (seed_track.track_duration + DURATION_WINDOW, float('inf')))
+            related.update(dict.fromkeys(self.__duration_tracks[start:end]))
+        related.pop(seed_track, None)
+        return related
+
+    def recommend_tracks(self, user_object: user.User) -> list:
+        recommended = {}
+        for user_review in user_object.reviews:
+            if user_review.rating > 3:
+                recommended.update(self.related_tracks(user_review.track))
+        recommended = list(recommended)
+        if len(recommended) > RECOMMENDATION_LIMIT:
+            return random.sample(recommended, RECOMMENDATION_LIMIT)
+        random.shuffle(recommended)
+        return recommended
@@ -6,6 +6,10 @@ from music.domainmodel import album, artist, genre, playlist, review, track, use
 # Static repo to simulate database
 track_repo = None
 
+# Track orderings the browse pages can ask for, see get_page
+SORT_METHODS = ("get_track_id", "get_track_name", "get_track_duration", "get_track_artist_name",
+                "get_track_album_name", "get_track_rating")
+
 
 class RepositoryException(Exception):
 
@@ -188,6 +192,13 @@ class AbstractRepository(abc.ABC):
         """ Returns number of tracks in repository"""
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_catalogue_version(self) -> str:
+        """ Returns a token that changes whenever tracks are imported or reviewed, or None if the
+            repository cannot tell
+        """
+        raise NotImplementedError
+
     '''@abc.abstractmethod
     def get_first_track(self) -> track:
         """ Returns first track in repository
@@ -207,6 +218,13 @@ class AbstractRepository(abc.ABC):
         """ Returns list of tracks to display on page according to users choice of songs shown per page"""
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_page(self, sort_key: str, descending: bool, page: int, per_page: int) -> list[track.Track]:
+        """ Returns one page of tracks ordered by sort_key (one of SORT_METHODS)
+            Does not change any shared sort state, so it is safe to call per request
+        """
+        raise NotImplementedError
+
     '''@abc.abstractmethod
     def get_tracks_by_album(self, album_id: int) -> list[track]:
         """ Returns list of tracks from repository within certain album
@@ -274,6 +292,17 @@ class AbstractRepository(abc.ABC):
         """ Returns genres from repository"""
         raise NotImplementedError
 
+    def bulk_load(self, albums: list, artists: list, genres: list, tracks: list):
+        """ Adds fully linked albums, artists, genres and tracks to the repository in one go"""
+        for new_album in albums:
+            self.add_album(new_album)
+        for new_artist in artists:
+            self.add_artist(new_artist)
+        for new_genre in genres:
+            self.add_genre(new_genre)
+        for new_track in tracks:
+            self.add_track(new_track)
+
     @abc.abstractmethod
     def add_track_dict(self, track_object: track, track_album: album, track_artist: artist):
         """ Adds track to the track dict with name, album, and artist"""
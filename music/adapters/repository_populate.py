@@ -5,14 +5,16 @@ from music.adapters import csv_data_importer
 from music.adapters import database_repository
 
 
-def populate(data_path: Path, repo: AbstractRepository, database_mode: bool):
-    #csv_data_importer.load_all(data_path, repo)
-    
+def populate(data_path: Path, repo: AbstractRepository, database_mode: bool, single_pass: bool = False,
+             workers: int = 1):
+    if single_pass:
+        csv_data_importer.load_all(data_path, repo, workers)
+        return
+
     csv_data_importer.load_artists(data_path, repo)
     csv_data_importer.load_albums(data_path, repo)
     csv_data_importer.load_tracks_and_genres(data_path, repo)
     
     
-    #database_repository.SqlAlchemyRepository(AbstractRepository).update_tracks()
     #csv_data_importer.load_tracks(data_path, repo)
     #csv_data_importer.load_genres(data_path, repo, database_mode)
\ No newline at end of file
@@ -0,0 +1,180 @@
+import bisect
+from array import array
+
+from music.domainmodel import track
+
+# Number of results the search page shows
+RESULT_LIMIT = 30
+
+
+def trigrams(text: str) -> set:
+    """ Returns the set of three character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def gram_key(gram: str) -> int:
+    """ Packs the code points of a trigram into one int, so trigrams can be stored in an int array"""
+    return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+
+class TrigramIndex:
+    """ Inverted index from the trigrams of each track's title, album title and artist name to the
+        tracks containing them. A substring query can then only match tracks that appear in the
+        posting list of every trigram of the query, so only those few candidates are checked.
+
+        Results are ranked by the field that matched (title, then album, then artist) and then by
+        the order the tracks were indexed, so the same query always gives the same results.
+    """
+
+    def __init__(self):
+        # one index per field: trigram -> {track: None}, dicts keep the tracks in indexing order
+        self.__postings = ({}, {}, {})
+        self.__fields = {}
+
+    def __len__(self):
+        return len(self.__fields)
+
+    def add(self, track_object: track.Track, fields: list):
+        """ Indexes (or re-indexes) track_object under the given [title, album title, artist name]"""
+        if track_object in self.__fields:
+            self.remove(track_object)
+        fields = tuple(field.lower() for field in fields)
+        self.__fields[track_object] = fields
+        for postings, field in zip(self.__postings, fields):
+            for gram in trigrams(field):
+                postings.setdefault(gram, {})[track_object] = None
+
+    def remove(self, track_object: track.Track):
+        fields = self.__fields.pop(track_object, None)
+        if fields is None:
+            return
+        for postings, field in zip(self.__postings, fields):
+            for gram in trigrams(field):
+                tracks = postings.get(gram)
+                if tracks is not None:
+                    tracks.pop(track_object, None)
+                    if not tracks:
+                        del postings[gram]
+
+    def search(self, query: str, limit: int = RESULT_LIMIT) -> list:
+        """ Returns up to limit tracks with query as a substring of their title, album or artist"""
+        query = query.lower()
+        results = {}
+        for position, postings in enumerate(self.__postings):
+            for track_object in self.__candidates(postings, query):
+                if track_object not in results and query in self.__fields[track_object][position]:
+                    results[track_object] = None
+                    if len(results) == limit:
+                        return list(results)
+        return list(results)
+
+    def __candidates(self, postings: dict, query: str):
+        grams = trigrams(query)
+        if not grams:
+            # too short to have a trigram, fall back to checking every track
+            return iter(self.__fields)
+        lists = sorted((postings.get(gram, {}) for gram in grams), key=len)
+        if not lists[0]:
+            return iter(())
+        shortest, others = lists[0], lists[1:]
+        return (track_object for track_object in shortest if all(track_object in other for other in others))
+
+
+class RowTrigramIndex:
+    """ TrigramIndex for the columnar repository, keyed by row number instead of Track.
+
+        Posting lists are sorted arrays of rows rather than dicts of tracks, which takes a fraction
+        of the memory, and the indexed text is not copied: fields_of(row) returns the current
+        [title, album title, artist name] of a row to check candidates against. Ranking is the
+        same as TrigramIndex, with rows standing in for indexing order.
+    """
+
+    def __init__(self, fields_of, postings: tuple = None, indexed=None):
+        self.__fields_of = fields_of
+        # for a catalogue file, postings are MappedPostings and indexed is a read-only view of the flags
+        self.__postings = ({}, {}, {}) if postings is None else postings
+        self.__indexed = bytearray() if indexed is None else indexed
+        self.__size = sum(self.__indexed)
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        return (row for row, indexed in enumerate(self.__indexed) if indexed)
+
+    def add(self, row: int, fields: list):
+        """ Indexes row under the given [title, album title, artist name]"""
+        if row >= len(self.__indexed):
+            self.__indexed.extend(bytes(row + 1 - len(self.__indexed)))
+        if not self.__indexed[row]:
+            self.__indexed[row] = 1
+            self.__size += 1
+        for postings, field in zip(self.__postings, fields):
+            for gram in trigrams(field.lower()):
+                rows = postings.get(gram)
+                if rows is None:
+                    rows = postings[gram] = array('i')
+                if not rows or rows[-1] < row:
+                    rows.append(row)
+                elif not self.__contains(rows, row):
+                    rows.insert(bisect.bisect_left(rows, row), row)
+
+    def export(self) -> tuple:
+        """ Returns the indexed rows as bytes and, for each field, the keys (see gram_key) of its
+            trigrams in ascending order, where each trigram's rows start and the rows themselves
+        """
+        fields = []
+        for postings in self.__postings:
+            grams = sorted(postings, key=gram_key)
+            starts = array('q', [0])
+            rows = array('i')
+            for gram in grams:
+                rows.extend(postings[gram])
+                starts.append(len(rows))
+            fields.append((array('q', map(gram_key, grams)), starts, rows))
+        return bytes(self.__indexed), fields
+
+    @staticmethod
+    def __contains(rows: array, row: int) -> bool:
+        position = bisect.bisect_left(rows, row)
+        return position < len(rows) and rows[position] == row
+
+    def search(self, query: str, limit: int = RESULT_LIMIT) -> list:
+        """ Returns up to limit rows with query as a substring of their title, album or artist"""
+        query = query.lower()
+        results = {}
+        for position, postings in enumerate(self.__postings):
+            for row in self.__candidates(postings, query):
+                if row not in results and query in self.__fields_of(row)[position].lower():
+                    results[row] = None
+                    if len(results) == limit:
+                        return list(results)
+        return list(results)
+
+    def __candidates(self, postings: dict, query: str):
+        grams = trigrams(query)
+        if not grams:
+            return iter(self)
+        lists = sorted((postings.get(gram, ()) for gram in grams), key=len)
+        if not lists[0]:
+            return iter(())
+        shortest, others = lists[0], lists[1:]
+        return (row for row in shortest if all(self.__contains(other, row) for other in others))
+
+
+class MappedPostings:
+    """ Read-only posting lists of one field, as exported by RowTrigramIndex.export, looked up by
+        bisecting the trigram keys rather than through a dict
+    """
+
+    def __init__(self, keys, starts, rows):
+        self.__keys = keys
+        self.__starts = starts
+        self.__rows = rows
+
+    def get(self, gram: str, default=None):
+        key = gram_key(gram)
+        position = bisect.bisect_left(self.__keys, key)
+        if position == len(self.__keys) or self.__keys[position] != key:
+            return default
+        return self.__rows[self.__starts[position]:self.__starts[position + 1]]
@@ -0,0 +1,69 @@
+import hashlib, os, pickle, struct, tempfile
+from pathlib import Path
+
+from music.adapters.memory_repository import MemoryRepository
+
+MAGIC = b'MUSICWIKI-SNAPSHOT'
+# Bump whenever the pickled layout of MemoryRepository or the domain model changes
+SNAPSHOT_VERSION = 4
+# CSV files memory_repository.populate reads, a snapshot is only used while these are unchanged
+SOURCE_FILES = ("raw_tracks_excerpt.csv", "raw_albums_excerpt.csv")
+# version, length of the source key, length of the payload, sha256 of both
+HEADER = struct.Struct('>HII32s')
+
+
+def source_key(data_path: Path, single_pass: bool) -> bytes:
+    """ Identifies the CSV files (by path, size and modification time) and importer a snapshot was built from"""
+    sources = []
+    for filename in SOURCE_FILES:
+        path = Path(data_path) / filename
+        if path.exists():
+            stat = path.stat()
+            sources.append((str(path.resolve()), stat.st_size, stat.st_mtime_ns))
+    return repr((single_pass, sources)).encode()
+
+
+def save_snapshot(repo: MemoryRepository, snapshot_path: Path, data_path: Path, single_pass: bool):
+    """ Writes repo to snapshot_path, replacing any older snapshot in one step so that other
+        workers never read a half written file
+    """
+    key = source_key(data_path, single_pass)
+    payload = pickle.dumps(repo, protocol=pickle.HIGHEST_PROTOCOL)
+    header = HEADER.pack(SNAPSHOT_VERSION, len(key), len(payload), hashlib.sha256(key + payload).digest())
+    snapshot_path = Path(snapshot_path)
+    descriptor, temporary_path = tempfile.mkstemp(dir=snapshot_path.resolve().parent, prefix=snapshot_path.name)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(MAGIC + header + key + payload)
+        os.replace(temporary_path, snapshot_path)
+    except:
+        os.unlink(temporary_path)
+        raise
+
+
+def load_snapshot(snapshot_path: Path, data_path: Path, single_pass: bool):
+    """ Returns the MemoryRepository stored at snapshot_path, or None if there is no snapshot, it
+        was written by another SNAPSHOT_VERSION, it fails its checksum or the CSV files have
+        changed since it was written
+    """
+    try:
+        with open(snapshot_path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+    if not data.startswith(MAGIC) or len(data) < len(MAGIC) + HEADER.size:
+        return None
+    version, key_length, payload_length, digest = HEADER.unpack_from(data, len(MAGIC))
+    if version != SNAPSHOT_VERSION:
+        return None
+    start = len(MAGIC) + HEADER.size
+    key = data[start:start + key_length]
+    payload = data[start + key_length:]
+    if len(payload) != payload_length or hashlib.sha256(key + payload).digest() != digest:
+        return None
+    if key != source_key(data_path, single_pass):
+        return None
+    repo = pickle.loads(payload)
+    if not isinstance(repo, MemoryRepository):
+        return None
+    return repo
@@ -1,3 +1,6 @@
+import functools, hashlib, time
+from pathlib import Path
+
 from flask import Flask, render_template, redirect, url_for, session, request, Blueprint, abort
 from flask import current_app as app
 from flask_wtf import FlaskForm
@@ -12,17 +15,58 @@ from music.browse import services
 
 browse_blueprint = Blueprint('browse_bp', __name__, url_prefix="/tracks")
 
+# A page is only reused while the templates it was rendered from are unchanged
+TEMPLATES_VERSION = hashlib.sha256(b''.join(path.read_bytes() for path in
+                                            sorted((Path(__file__).parents[1] / 'templates').rglob('*.html')))).hexdigest()
+
+
+def page_etag(version: str) -> str:
+    """ ETag of the page at the requested URL for the given catalogue version. Pages differ for signed
+        in users and carry the session's CSRF token, which flask-wtf only accepts for WTF_CSRF_TIME_LIMIT
+        seconds, so the tag also changes every half of that time.
+    """
+    time_limit = app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    period = int(time.time() // (time_limit / 2)) if time_limit else 0
+    state = (TEMPLATES_VERSION, version, request.full_path, 'username' in session, session.get('csrf_token'), period)
+    return hashlib.sha256(repr(state).encode()).hexdigest()
+
+
+def conditional(view):
+    """ Answers a GET whose If-None-Match holds the page's current ETag with 304 Not Modified, before the
+        view runs. Browsers must check back every time they reuse a page, since a review can change it.
+    """
+    @functools.wraps(view)
+    def conditional_view(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        version = services.get_catalogue_version(app.repo)
+        if version is None:
+            return view(*args, **kwargs)
+        etag = page_etag(version)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            # rendering may have put a CSRF token in the session
+            etag = page_etag(version)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return conditional_view
+
 
 
 @browse_blueprint.route('/browse')
 def new_browse():
-    #sort browse by default (track_id) on new request to browse
-    services.sort_tracks("get_track_id", False, app.repo)
+    #browse starts on the default sort (track_id), which needs no query string
     return redirect(url_for('browse_bp.browse', page = 1))
 
 
 
 @browse_blueprint.route('/browse/<page>', methods=['GET', 'POST'])
+@conditional
 def browse(page):
     #create forms
     form_left = GoLeft()
@@ -33,23 +77,27 @@ def browse(page):
     page = int(page)
     per_page = 30
 
+    #sort state lives in the query string so each request carries its own ordering
+    sort_method, descending = services.get_sort_method(request.args.get('sort'), request.args.get('order'))
+    sort_query = services.sort_query(sort_method, descending)
+
     #check if POST method is to go left
     if form_left.submit1.data and form_left.validate():
         if page > 1:
-            return redirect(url_for('browse_bp.browse', page = page-1))
+            return redirect(url_for('browse_bp.browse', page = page-1, **sort_query))
 
     #check if POST method is to go right
     if form_right.submit2.data and form_right.validate():
         if page*per_page < services.get_number_of_tracks(app.repo):
-            return redirect(url_for('browse_bp.browse', page = page+1))
+            return redirect(url_for('browse_bp.browse', page = page+1, **sort_query))
     
     #check if POST method is to change filter method
-    if drop_down.validate():
-        services.change_sort_method(drop_down.filter.data, app.repo)
-        return redirect(url_for('browse_bp.browse', page = 1))
+    if drop_down.validate() and drop_down.filter.data != "":
+        sort_method, descending = services.change_sort_method(drop_down.filter.data)
+        return redirect(url_for('browse_bp.browse', page = 1, **services.sort_query(sort_method, descending)))
         
     #generate new list from POST instructions (or default instructions)
-    tracks_new = services.get_list_of_tracks(page, per_page, app.repo)
+    tracks_new = services.get_page(sort_method, descending, page, per_page, app.repo)
 
     #check if returned list has no elements
     if len(tracks_new) == 0:
@@ -59,6 +107,7 @@ def browse(page):
 
 
 @browse_blueprint.route('/browse/track/<variable>')
+@conditional
 def browse_track(variable):
     track=services.get_track(int(variable), app.repo)
     if track != None:
@@ -68,6 +117,7 @@ def browse_track(variable):
 
 
 @browse_blueprint.route('/search', methods=['GET', 'POST'])
+@conditional
 def search():
     search_form = SearchForm()
     return_list = []
@@ -3,20 +3,27 @@ from flask import session
 from music.domainmodel.review import Review
 from music.domainmodel.track import Track
 from music.domainmodel.user import User
+from music.adapters.repository import SORT_METHODS
 
-def sort_tracks(input: str, sort_order: bool, repo):
-    repo.sort_tracks(input, sort_order)
+def get_sort_method(sort: str, order: str):
+    # sort state comes from the query string, fall back to ID ascending when missing or unknown
+    if sort not in SORT_METHODS:
+        return "get_track_id", False
+    return sort, order == "desc"
 
-def change_sort_method(data, repo):
-    if data != "":
-        if data == "get_track_rating":
-            repo.sort_tracks(data, True)
-        else:
-            repo.sort_tracks(data, False)
+def change_sort_method(data):
+    # rating is the only filter shown highest first
+    return data, data == "get_track_rating"
+
+def sort_query(sort_method: str, descending: bool) -> dict:
+    return {'sort': sort_method, 'order': "desc" if descending else "asc"}
 
 def get_list_of_tracks(page, per_page, repo):
     return repo.get_list_of_tracks(page, per_page)
 
+def get_page(sort_method, descending, page, per_page, repo):
+    return repo.get_page(sort_method, descending, page, per_page)
+
 def get_track(variable, repo):
     return repo.get_track(variable)
 
@@ -40,4 +47,7 @@ def recommend_track(username, repo):
     return repo.recommend_tracks(repo.get_user(username))
 
 def get_number_of_tracks(repo):
-    return repo.get_number_of_tracks()
\ No newline at end of file
+    return repo.get_number_of_tracks()
+
+def get_catalogue_version(repo):
+    return repo.get_catalogue_version()
\ No newline at end of file
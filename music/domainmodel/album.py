@@ -1,4 +1,6 @@
 class Album:
+    __slots__ = ('__album_id', '__title', '__album_url', '__album_type', '__release_year', '__tracks',
+                 '__dict__', '__weakref__')
 
     def __init__(self, album_id: int, title: str):
         if type(album_id) is not int or album_id < 0:
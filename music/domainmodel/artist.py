@@ -1,4 +1,6 @@
 class Artist:
+    __slots__ = ('__artist_id', '__full_name', '__tracks',
+                 '__dict__', '__weakref__')
 
     def __init__(self, artist_id: int, full_name: str):
         if type(artist_id) is not int or artist_id < 0:
@@ -1,4 +1,6 @@
 class Genre:
+    __slots__ = ('__genre_id', '__name', '__applied_to',
+                 '__dict__', '__weakref__')
 
     def __init__(self, genre_id: int, genre_name: str):
         if type(genre_id) is not int or genre_id < 0:
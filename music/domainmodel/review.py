@@ -3,6 +3,8 @@ from music.domainmodel.track import Track
 
 
 class Review:
+    __slots__ = ('__track', '__review_text', '__rating', '__timestamp', '__user',
+                 '__dict__', '__weakref__')
 
     def __init__(self, track: Track, review_text: str, rating: int, review_user=None):
         self.__track = None
@@ -4,6 +4,12 @@ from music.domainmodel.album import Album
 
 
 class Track:
+    # Attributes live in slots rather than a per-instance dict, as do those of the other domain classes.
+    # __dict__ and __weakref__ are only there for the SQLAlchemy mapping in orm.py and stay unused in memory mode
+    __slots__ = ('__track_id', '__title', '__artist', '__album', '__track_url', '__track_duration', '__genres',
+                 '__reviews', '__reviews_by_user', '__indexed_reviews', '__review_count', '__rating_sum',
+                 '__dict__', '__weakref__')
+
     def __init__(self, track_id: int, track_title: str):
         if type(track_id) is not int or track_id < 0:
             raise ValueError
@@ -20,24 +26,75 @@ class Track:
         self.__track_duration = None
         self.__genres: list = []
         self.__reviews: list = []
+        # user id -> position in __reviews of that user's latest review, see __review_positions
+        self.__reviews_by_user = None
+        self.__indexed_reviews: int = 0
+        # running totals so the rating never has to loop over reviews
+        self.__review_count: int = 0
+        self.__rating_sum: int = 0
 
     @property
     def reviews(self) -> list:
         return self.__reviews
-    
+
+    def __review_positions(self) -> dict:
+        # rebuilt when missing (instances loaded by the ORM skip __init__) or when the review
+        # list was changed without going through the methods below
+        positions = getattr(self, '_Track__reviews_by_user', None)
+        if positions is None or getattr(self, '_Track__indexed_reviews', None) != len(self.__reviews):
+            positions = {}
+            for position, review in enumerate(self.__reviews):
+                if review.review_user is not None:
+                    positions[review.review_user.user_id] = position
+            self.__reviews_by_user = positions
+            self.__indexed_reviews = len(self.__reviews)
+        return positions
+
     def add_review(self, review):
+        positions = self.__review_positions()
         self.__reviews.append(review)
+        self.__indexed_reviews += 1
+        if review.review_user is not None:
+            positions[review.review_user.user_id] = len(self.__reviews) - 1
+        self.__review_count += 1
+        self.__rating_sum += review.rating
+
+    def replace_review(self, index: int, review):
+        positions = self.__review_positions()
+        old_review = self.__reviews[index]
+        self.__reviews[index] = review
+        if old_review.review_user is not None and positions.get(old_review.review_user.user_id) == index:
+            del positions[old_review.review_user.user_id]
+        if review.review_user is not None:
+            positions[review.review_user.user_id] = index
+        self.__rating_sum += review.rating - old_review.rating
+
+    def review_by_user(self, user):
+        """ Returns the latest review of this track by user, or None"""
+        position = self.__review_positions().get(user.user_id)
+        return None if position is None else self.__reviews[position]
+
+    def set_user_review(self, review):
+        """ Replaces the review author's earlier review of this track, or adds review if there is none"""
+        position = None
+        if review.review_user is not None:
+            position = self.__review_positions().get(review.review_user.user_id)
+        if position is None:
+            self.add_review(review)
+        else:
+            self.replace_review(position, review)
 
     def get_num_of_reviews(self):
-        return len(self.__reviews)
-    
+        return self.__review_count
+
+    @property
+    def rating_sum(self) -> int:
+        return self.__rating_sum
+
     def average_rating(self):
-        if self.get_num_of_reviews() == 0:
+        if self.__review_count == 0:
             return 0
-        average_rating = 0
-        for i in self.__reviews:
-            average_rating += i.rating
-        return average_rating/self.get_num_of_reviews()
+        return self.__rating_sum/self.__review_count
 
     @property
     def track_id(self) -> int:
@@ -21,6 +21,9 @@ class User:
             self.__password = None
 
         self.__reviews: list[Review] = []
+        # track id -> positions in __reviews of this user's reviews of that track, see __review_positions
+        self.__reviews_by_track: dict = {}
+        self.__indexed_reviews: int = 0
         self.__liked_tracks: list[Track] = []
         self.__playlists: list[PlayList] = []  # Added to skeleton
 
@@ -54,15 +57,57 @@ class User:
             return
         self.__playlists.remove(playlist)
 
+    def __review_positions(self) -> dict:
+        # rebuilt when missing (instances loaded by the ORM skip __init__) or when the review
+        # list was changed without going through the methods below
+        positions = getattr(self, '_User__reviews_by_track', None)
+        if positions is None or getattr(self, '_User__indexed_reviews', None) != len(self.__reviews):
+            positions = {}
+            for position, review in enumerate(self.__reviews):
+                positions.setdefault(self.__track_key(review), []).append(position)
+            self.__reviews_by_track = positions
+            self.__indexed_reviews = len(self.__reviews)
+        return positions
+
+    @staticmethod
+    def __track_key(review: Review):
+        return review.track.track_id if review.track is not None else None
+
     def add_review(self, new_review: Review):
-        if not isinstance(new_review, Review) or new_review in self.__reviews:
+        if not isinstance(new_review, Review):
+            return
+        positions = self.__review_positions()
+        same_track = positions.setdefault(self.__track_key(new_review), [])
+        if any(self.__reviews[position] == new_review for position in same_track):
             return
         self.__reviews.append(new_review)
+        self.__indexed_reviews += 1
+        same_track.append(len(self.__reviews) - 1)
 
     def remove_review(self, review: Review):
-        if not isinstance(review, Review) or review not in self.__reviews:
+        if not isinstance(review, Review):
             return
-        self.__reviews.remove(review)
+        for position in self.__review_positions().get(self.__track_key(review), []):
+            if self.__reviews[position] == review:
+                del self.__reviews[position]
+                # later positions have all shifted, so index again on next use
+                self.__reviews_by_track = None
+                return
+
+    def review_of_track(self, track: Track):
+        """ Returns this user's latest review of track, or None"""
+        same_track = self.__review_positions().get(track.track_id)
+        return self.__reviews[same_track[-1]] if same_track else None
+
+    def set_track_review(self, new_review: Review):
+        """ Replaces this user's latest review of the same track, or adds new_review if there is none"""
+        if not isinstance(new_review, Review):
+            return
+        same_track = self.__review_positions().get(self.__track_key(new_review))
+        if same_track:
+            self.__reviews[same_track[-1]] = new_review
+        else:
+            self.add_review(new_review)
 
     @property
     def liked_tracks(self) -> list:
@@ -48,6 +48,21 @@ def session_factory():
     yield session_factory
     metadata.drop_all(engine)
 
+@pytest.fixture
+def single_pass_session_factory():
+    clear_mappers()
+    engine = create_engine(TEST_DATABASE_URI_IN_MEMORY)
+    metadata.create_all(engine)
+    for table in reversed(metadata.sorted_tables):
+        engine.execute(table.delete())
+    map_model_to_tables()
+    session_factory = sessionmaker(autocommit=False, autoflush=True, bind=engine)
+    repo_instance = database_repository.SqlAlchemyRepository(session_factory)
+    database_mode = True
+    repository_populate.populate(TEST_DATA_PATH_DATABASE_FULL, repo_instance, database_mode, single_pass=True)
+    yield session_factory
+    metadata.drop_all(engine)
+
 @pytest.fixture
 def empty_session():
     clear_mappers()
@@ -1,11 +1,17 @@
+import csv, io, re, shutil, threading
 from datetime import datetime, date
 
 import pytest
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 
 import music.adapters.repository as repo
-from music.adapters.database_repository import SqlAlchemyRepository
+from music.adapters.database_repository import SqlAlchemyRepository, create_database_engine
 from music.domainmodel import album, artist, genre, review, track, user
 from music.adapters.repository import RepositoryException
+from music.adapters.orm import metadata
+from test_db.conftest import TEST_DATA_PATH_DATABASE_FULL
 
 def test_repository_can_add_a_user(session_factory):
     repo = SqlAlchemyRepository(session_factory)
@@ -79,6 +85,46 @@ def test_repository_can_retrieve_tracks_by_artist(session_factory):
 
     assert first_track.artist.full_name == "??ss"
 
+def test_repository_pages_match_a_full_sort(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    repo.sort_tracks("get_track_name", True)
+
+    paged_ids = []
+    page = 1
+    while True:
+        tracks = repo.get_list_of_tracks(page, 30)
+        if len(tracks) == 0:
+            break
+        paged_ids += [track_obj.track_id for track_obj in tracks]
+        page += 1
+
+    expected_tracks = sorted(sorted(repo.get_all_tracks()), key=lambda track_obj: track_obj.title, reverse=True)
+    assert paged_ids == [track_obj.track_id for track_obj in expected_tracks]
+
+def test_repository_can_jump_straight_to_a_page(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    repo.sort_tracks("get_track_duration", False)
+    page_five = repo.get_list_of_tracks(5, 30)
+
+    repo.sort_tracks("get_track_duration", False)
+    first_five_pages = []
+    for page in range(1, 6):
+        first_five_pages += repo.get_list_of_tracks(page, 30)
+
+    assert page_five == first_five_pages[120:150]
+    assert repo.get_list_of_tracks(1000, 30) == []
+
+def test_repository_get_page_leaves_shared_sort_alone(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    by_artist = repo.get_page("get_track_artist_name", False, 1, 1)
+    by_id = repo.get_list_of_tracks(1, 1)
+
+    assert by_artist[0].artist.full_name == "??ss"
+    assert by_id[0].track_id == 2
+
 def test_repository_can_retrieve_tags(session_factory):
     repo = SqlAlchemyRepository(session_factory)
 
@@ -183,4 +229,317 @@ def test_recommend_does_not_return_none(session_factory):
 
     output = repo.recommend_tracks(new_user)
 
-    assert len(output) != 0
\ No newline at end of file
+    assert len(output) != 0
+
+def test_repository_persists_rating_totals(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    new_user = user.User(repo.generate_user_id(), "test", "Password1")
+    repo.add_user(new_user)
+    new_track = repo.get_track(3)
+    repo.add_review(review.Review(new_track, "test", 4, new_user))
+
+    with single_pass_session_factory() as session:
+        totals = list(session.execute('SELECT review_count, rating_sum FROM tracks WHERE id = 3'))
+    assert totals == [(1, 4)]
+
+    assert repo.get_track(3).average_rating() == 4
+    assert repo.get_page("get_track_rating", True, 1, 1)[0].track_id == 3
+
+def test_repository_can_search_tracks(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    new_track = track.Track(900001, 'Qzxmoon Drive')
+    new_track.track_duration = 1
+    new_track.artist = repo.get_artist(1)
+    repo.add_track(new_track)
+
+    # Check words can be searched by prefix, in any case, with punctuation ignored
+    assert repo.return_track_from_dict("qzxmo") == [new_track]
+    assert repo.return_track_from_dict("DRIVE qzx'") == [new_track]
+    assert new_track in repo.return_track_from_dict(new_track.artist.full_name)
+    # Check FTS5 query syntax in the input is treated as plain words
+    assert repo.return_track_from_dict('"qzxmoon*:(') == [new_track]
+    assert repo.return_track_from_dict('" *') == []
+    assert len(repo.return_track_from_dict("the")) == 30
+
+def test_repository_search_follows_renames(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    new_track = repo.get_track(2)
+    new_track.title = 'Qzxrenamed'
+    new_track.album.title = 'Qzxalbum'
+    repo._session_cm.commit()
+
+    assert repo.return_track_from_dict("Qzxrenamed") == [new_track]
+    assert new_track in repo.return_track_from_dict("Qzxalbum")
+
+def test_recommend_follows_the_recommendation_rules(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    new_user = user.User(repo.generate_user_id(), "test", "Password1")
+    repo.add_user(new_user)
+    liked_track = repo.get_track(2)
+    repo.add_review(review.Review(liked_track, "test", 5, new_user))
+    disliked_track = repo.get_track(3)
+    repo.add_review(review.Review(disliked_track, "test", 1, new_user))
+
+    output = repo.recommend_tracks(new_user)
+
+    assert 0 < len(output) <= 10
+    assert liked_track not in output
+    for track_object in output:
+        assert (track_object.artist == liked_track.artist or track_object.album == liked_track.album
+                or any(track_genre in liked_track.genres for track_genre in track_object.genres)
+                or abs(track_object.track_duration - liked_track.track_duration) <= 15)
+
+def test_repository_page_loads_in_fixed_number_of_queries(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+    repo.reset_session()
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = single_pass_session_factory.kw['bind']
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        for page in (1, 2):
+            statements.clear()
+            tracks = repo.get_page("get_track_album_name", False, page, 30)
+            # Everything browse.html shows for each track
+            for track_object in tracks:
+                track_object.artist.full_name, track_object.album.title, list(track_object.genres)
+                track_object.average_rating(), track_object.get_num_of_reviews()
+            assert len(tracks) == 30
+            # Page 2 also has to look up where the pages start
+            assert len(statements) <= 3
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+
+def test_repository_pages_follow_reviews_from_another_repository(single_pass_session_factory):
+    # Two workers sharing the database
+    repo, other_repo = SqlAlchemyRepository(single_pass_session_factory), SqlAlchemyRepository(single_pass_session_factory)
+    repo.get_page("get_track_rating", True, 2, 5)
+
+    new_user = user.User(other_repo.generate_user_id(), "test", "Password1")
+    other_repo.add_user(new_user)
+    for track_object in other_repo.get_page("get_track_id", False, 3, 4) + other_repo.get_page("get_track_id", False, 7, 4):
+        other_repo.add_review(review.Review(track_object, "great", 5, new_user))
+
+    repo.reset_session()
+    expected = [track_object.track_id for track_object in other_repo.get_page("get_track_rating", True, 2, 5)]
+    assert [track_object.track_id for track_object in repo.get_page("get_track_rating", True, 2, 5)] == expected
+    assert all(track_object.average_rating() == 5 for track_object in repo.get_page("get_track_rating", True, 2, 5)[:3])
+
+
+def test_tuned_engine_pools_connections_and_sets_pragmas(tmp_path):
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'tuned.db'}", profile='tuned', pool_size=2,
+                                    pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'temp_store': 'MEMORY'})
+    try:
+        assert isinstance(engine.pool, QueuePool)
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert connection.execute(text("PRAGMA temp_store")).scalar() == 2
+    finally:
+        engine.dispose()
+
+    assert isinstance(create_database_engine('sqlite://', profile='nullpool').pool, NullPool)
+    with pytest.raises(RepositoryException):
+        create_database_engine('sqlite://', profile='fastest')
+
+def query_plans(session_factory, action):
+    # Runs action, then returns the EXPLAIN QUERY PLAN lines of every statement it sent
+    statements = []
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    engine = session_factory.kw['bind']
+    event.listen(engine, 'before_cursor_execute', record_statement)
+    try:
+        action()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record_statement)
+    with engine.connect() as connection:
+        return [(statement, [row[3] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)])
+                for statement, parameters in statements]
+
+FULL_TABLE_SCAN = re.compile(r"^SCAN (tracks|albums|artists|genres|track_genre|reviews|users)(_\d+)?$")
+
+def test_browse_pages_read_the_sort_indexes(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    for sort_key, index_name in (("get_track_name", "ix_tracks_title_id"), ("get_track_duration", "ix_tracks_duration_id"),
+                                 ("get_track_rating", "ix_tracks_rating_id")):
+        repo.get_page(sort_key, False, 2, 30)  # cache the page boundaries first
+        plans = query_plans(single_pass_session_factory, lambda: repo.get_page(sort_key, False, 2, 30))
+        # the first statement checks the cached boundaries are still current
+        assert "catalogue_version" in plans[0][0]
+        page_plan = plans[1][1]
+        # Check the page is read in order straight off the index instead of sorting every track
+        assert f"SCAN tracks USING INDEX {index_name}" in page_plan
+        assert "USE TEMP B-TREE FOR ORDER BY" not in page_plan
+        # Check the genres for the page are looked up by track id
+        for statement, plan in plans:
+            assert not any(FULL_TABLE_SCAN.match(line) for line in plan), statement
+
+def test_lookups_and_recommendations_use_indexes(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+    new_user = user.User(repo.generate_user_id(), "test", "Password1")
+    repo.add_user(new_user)
+    repo.add_review(review.Review(repo.get_track(2), "test", 5, new_user))
+    repo.reset_session()
+
+    def lookups():
+        found_user = repo.get_user("test")
+        list(repo.get_track(2).reviews)
+        repo.recommend_tracks(found_user)
+
+    plans = query_plans(single_pass_session_factory, lookups)
+    assert len(plans) > 0
+    for statement, plan in plans:
+        assert not any(FULL_TABLE_SCAN.match(line) for line in plan), statement
+
+def test_repository_replaces_a_users_review_in_one_statement(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+    new_user = user.User(repo.generate_user_id(), "test", "Password1")
+    repo.add_user(new_user)
+    other_user = user.User(repo.generate_user_id(), "other", "Password1")
+    repo.add_user(other_user)
+    new_track = repo.get_track(2)
+    repo.add_review_to_user(other_user, review.Review(new_track, "other", 3, other_user))
+    first_review = review.Review(new_track, "first", 5, new_user)
+    repo.add_review_to_user(new_user, first_review)
+    repo.add_review_to_track(new_track, first_review, new_user)
+
+    user_ids = (other_user.user_id, new_user.user_id)
+
+    # Like a new request, the user and track are loaded and then the review is posted
+    repo.reset_session()
+    new_user, new_track = repo.get_user("test"), repo.get_track(2)
+    new_user.user_id, new_track.track_id
+    second_review = review.Review(new_track, "second", 2, new_user)
+    plans = query_plans(single_pass_session_factory, lambda: repo.add_review_to_user(new_user, second_review))
+    repo.add_review_to_track(new_track, second_review, new_user)
+
+    # Check posting the review was a single statement and it replaced the first one
+    assert len(plans) == 1
+    with single_pass_session_factory() as session:
+        rows = list(session.execute('SELECT user_id, review, rating FROM reviews WHERE track_id = 2'))
+        totals = list(session.execute('SELECT review_count, rating_sum FROM tracks WHERE id = 2'))
+    assert sorted(rows) == sorted([(user_ids[0], "other", 3), (user_ids[1], "second", 2)])
+    assert totals == [(2, 5)]
+    assert second_review in repo.get_track(2).reviews
+    assert sorted(track_review.review_text for track_review in repo.get_track(2).reviews) == ["other", "second"]
+    assert repo.get_track(2).average_rating() == 2.5
+
+
+def edit_tracks_file(data_path, edit):
+    tracks_file = data_path / "raw_tracks_excerpt.csv"
+    header, *rows = csv.reader(io.StringIO(tracks_file.read_text(encoding="unicode_escape")))
+    edit(rows)
+    output = io.StringIO()
+    csv.writer(output).writerows([header] + rows)
+    tracks_file.write_text(output.getvalue(), encoding="unicode_escape")
+
+
+def test_repository_sync_skips_unchanged_files(single_pass_session_factory):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+
+    # The fixture populated the tables without recording the files, so the first sync compares every row
+    changes = repo.sync_catalogue(TEST_DATA_PATH_DATABASE_FULL)
+    assert set(changes) == {'albums', 'artists', 'genres', 'tracks', 'track_genre'}
+    assert all(table_changes == (0, 0, 0) for table_changes in changes.values())
+    assert repo.sync_catalogue(TEST_DATA_PATH_DATABASE_FULL) == {}
+
+
+def test_repository_sync_writes_only_changed_rows(single_pass_session_factory, tmp_path):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+    data_path = tmp_path / "data"
+    shutil.copytree(TEST_DATA_PATH_DATABASE_FULL, data_path)
+    repo.record_catalogue_sources(data_path)
+    new_user = user.User(repo.generate_user_id(), "test", "Password1")
+    repo.add_user(new_user)
+    removed_track = repo.get_track(5)
+    new_review = review.Review(removed_track, "gone", 4, new_user)
+    repo.add_review_to_user(new_user, new_review)
+    repo.add_review_to_track(removed_track, new_review, new_user)
+
+    def edit(rows):
+        rows[0][37] = "Food (Remastered)"
+        rows[1][27] = "[{'genre_id': '999', 'genre_title': 'New Genre', 'genre_url': ''}]"
+        rows.remove(next(row for row in rows if row[0] == "5"))
+        rows.append(rows[3][:4] + ["888888", "New Artist"] + rows[3][6:])
+        rows[-1][0] = "999999"
+    edit_tracks_file(data_path, edit)
+
+    statements = []
+    event.listen(single_pass_session_factory.kw['bind'], 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    changes = repo.sync_catalogue(data_path, batch_size=10)
+
+    assert changes['tracks'] == (1, 1, 1)
+    assert changes['artists'] == (1, 0, 0)
+    assert changes['genres'] == (1, 0, 0)
+    assert changes['track_genre'][0] > 0
+    assert len([statement for statement in statements if statement.startswith(("INSERT", "UPDATE", "DELETE"))]) < 20
+    assert repo.get_track(2).title == "Food (Remastered)"
+    assert repo.get_track(5) is None
+    assert repo.get_track(999999).artist.full_name == "New Artist"
+    assert [track_genre.name for track_genre in repo.get_track(3).genres] == ["New Genre"]
+    assert [track_object.track_id for track_object in repo.return_track_from_dict("remastered")] == [2]
+    with single_pass_session_factory() as session:
+        assert list(session.execute('SELECT COUNT(*) FROM reviews')) == [(0,)]
+    assert repo.sync_catalogue(data_path) == {}
+
+
+def test_repository_syncs_once_when_workers_start_together(single_pass_session_factory, tmp_path):
+    data_path = tmp_path / "data"
+    shutil.copytree(TEST_DATA_PATH_DATABASE_FULL, data_path)
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'shared.db'}", pragmas={'journal_mode': 'WAL'})
+    metadata.create_all(engine)
+    shared_session_factory = sessionmaker(autocommit=False, autoflush=True, bind=engine)
+    SqlAlchemyRepository(shared_session_factory).sync_catalogue(data_path)
+    edit_tracks_file(data_path, lambda rows: rows[0].__setitem__(37, "Food (Remastered)"))
+
+    # Each worker has its own repository and connection, and they compare the digests at the same moment
+    start = threading.Barrier(3)
+    results = []
+    def worker():
+        worker_repo = SqlAlchemyRepository(shared_session_factory)
+        start.wait()
+        results.append(worker_repo.sync_catalogue(data_path))
+    workers = [threading.Thread(target=worker) for _ in range(3)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+
+    # Check only one worker wrote the change
+    assert len(results) == 3
+    assert sorted(len(changes) for changes in results) == [0, 0, 5]
+    assert next(changes for changes in results if changes)['tracks'] == (0, 1, 0)
+    engine.dispose()
+
+
+def test_repository_catalogue_version_changes_on_review_and_sync(single_pass_session_factory, tmp_path):
+    repo = SqlAlchemyRepository(single_pass_session_factory)
+    version = repo.get_catalogue_version()
+    assert version is not None
+    # every worker process reads the same version from the database
+    assert SqlAlchemyRepository(single_pass_session_factory).get_catalogue_version() == version
+
+    new_user = user.User(repo.generate_user_id(), "test", "Password1")
+    repo.add_user(new_user)
+    repo.add_review(review.Review(repo.get_track(2), "test", 4, new_user))
+    reviewed_version = repo.get_catalogue_version()
+    assert reviewed_version != version
+
+    data_path = tmp_path / "data"
+    shutil.copytree(TEST_DATA_PATH_DATABASE_FULL, data_path)
+    repo.record_catalogue_sources(data_path)
+    recorded_version = repo.get_catalogue_version()
+    assert recorded_version != reviewed_version
+    assert repo.sync_catalogue(data_path) == {}
+    assert repo.get_catalogue_version() == recorded_version
+    edit_tracks_file(data_path, lambda rows: rows[0].__setitem__(37, "Food (Remastered)"))
+    repo.sync_catalogue(data_path)
+    assert repo.get_catalogue_version() != recorded_version
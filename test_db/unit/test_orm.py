@@ -1,10 +1,12 @@
 import pytest
 
-import datetime
+import datetime, threading
 
+from sqlalchemy import create_engine
 from sqlalchemy.exc import IntegrityError
 
 from music.domainmodel import album, artist, genre, review, track, user
+from music.adapters.orm import indexes, metadata, upgrade_database
 
 
 def test_loading_of_user(empty_session):
@@ -122,3 +124,75 @@ def test_save_reviewed_track(empty_session):
     # tables.
     rows = list(empty_session.execute('SELECT user_id, track_id, review FROM reviews'))
     assert rows == [(user_key, track_key, review_text)]
+
+
+def test_upgrade_database_adds_indexes_and_triggers_to_an_old_database(empty_session):
+    engine = empty_session.bind
+    # Simulate a database from before the indexes and triggers, holding a duplicated review
+    for index in indexes:
+        empty_session.execute(f'DROP INDEX {index.name}')
+    for trigger in ('rating_totals_insert', 'rating_totals_update', 'rating_totals_delete'):
+        empty_session.execute(f'DROP TRIGGER {trigger}')
+    empty_session.execute('INSERT INTO users (id, user_name, password) VALUES (1, "test", "Password1")')
+    empty_session.execute('INSERT INTO tracks (id, title, duration) VALUES (2, "test_track", 5)')
+    empty_session.execute('INSERT INTO reviews (user_id, track_id, review, rating, timestamp) VALUES (1, 2, "old", 1, "2022-01-01")')
+    empty_session.execute('INSERT INTO reviews (user_id, track_id, review, rating, timestamp) VALUES (1, 2, "new", 4, "2022-01-02")')
+    empty_session.commit()
+
+    upgrade_database(engine)
+    upgrade_database(engine)
+
+    # Check only the newest review is kept, the track totals follow, and the constraint holds
+    assert list(empty_session.execute('SELECT review, rating FROM reviews')) == [("new", 4)]
+    assert list(empty_session.execute('SELECT review_count, rating_sum FROM tracks')) == [(1, 4)]
+    names = [row[0] for row in empty_session.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert all(index.name in names for index in indexes)
+    with pytest.raises(IntegrityError):
+        empty_session.execute('INSERT INTO reviews (user_id, track_id, review, rating, timestamp) VALUES (1, 2, "again", 2, "2022-01-03")')
+    empty_session.rollback()
+    # Check the totals are kept up to date from now on
+    empty_session.execute('UPDATE reviews SET rating = 5')
+    assert list(empty_session.execute('SELECT review_count, rating_sum FROM tracks')) == [(1, 5)]
+
+
+def test_upgrade_database_runs_once_when_workers_start_together(tmp_path):
+    database_uri = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(database_uri)
+    metadata.create_all(engine)
+    # Simulate a database from before the rating totals, search index, indexes and triggers
+    with engine.begin() as connection:
+        for index in indexes:
+            connection.execute(f'DROP INDEX {index.name}')
+        for row in list(connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")):
+            connection.execute(f'DROP TRIGGER {row[0]}')
+        connection.execute('DROP TABLE track_search')
+        connection.execute('DROP TABLE catalogue_version')
+        connection.execute('ALTER TABLE tracks DROP COLUMN review_count')
+        connection.execute('ALTER TABLE tracks DROP COLUMN rating_sum')
+    engine.dispose()
+
+    # Each worker has its own engine, and they all read the old schema at the same moment
+    start = threading.Barrier(3)
+    errors = []
+    def worker():
+        worker_engine = create_engine(database_uri)
+        start.wait()
+        try:
+            upgrade_database(worker_engine)
+        except Exception as error:
+            errors.append(error)
+        worker_engine.dispose()
+    workers = [threading.Thread(target=worker) for _ in range(3)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+
+    # Check no worker failed and the database was upgraded
+    assert errors == []
+    engine = create_engine(database_uri)
+    names = [row[0] for row in engine.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")]
+    assert all(index.name in names for index in indexes)
+    assert 'rating_totals_insert' in names and 'catalogue_version_review_insert' in names
+    assert list(engine.execute('SELECT review_count, rating_sum FROM tracks')) == []
+    engine.dispose()
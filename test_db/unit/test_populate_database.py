@@ -1,4 +1,5 @@
-from sqlalchemy import select, inspect
+from sqlalchemy import select, inspect, create_engine
+from sqlalchemy.orm import sessionmaker
 from datetime import datetime, date
 
 import pytest
@@ -8,12 +9,17 @@ from music.adapters.database_repository import SqlAlchemyRepository
 from music.domainmodel import album, artist, genre, review, track, user
 from music.adapters.repository import RepositoryException
 from music.adapters.orm import metadata
+from music.adapters import csv_data_importer
+from music.adapters.memory_repository import MemoryRepository
+from test_db.conftest import TEST_DATA_PATH_DATABASE_LIMITED
 
 def test_database_populate_inspect_table_names(database_engine):
 
     # Get table information
     inspector = inspect(database_engine)
-    assert inspector.get_table_names() == ['albums', 'artists', 'genres', 'reviews', 'sort_track', 'track_genre', 'tracks', 'users']
+    assert inspector.get_table_names() == ['albums', 'artists', 'catalogue_sources', 'catalogue_version', 'genres', 'reviews', 'track_genre',
+                                           'track_search', 'track_search_config', 'track_search_content', 'track_search_data',
+                                           'track_search_docsize', 'track_search_idx', 'tracks', 'users']
 
 def test_database_populate_select_all_albums(database_engine):
 
@@ -58,7 +64,7 @@ def test_database_populate_select_all_genres(database_engine):
 
     # Get table information
     inspector = inspect(database_engine)
-    name_of_genres_table = inspector.get_table_names()[2]
+    name_of_genres_table = inspector.get_table_names()[4]
 
     with database_engine.connect() as connection:
         # query for records in table genres
@@ -77,7 +83,7 @@ def test_database_populate_select_all_reviews(database_engine):
 
     # Get table information
     inspector = inspect(database_engine)
-    name_of_reviews_table = inspector.get_table_names()[3]
+    name_of_reviews_table = inspector.get_table_names()[5]
     with database_engine.connect() as connection:
         # query for records in table reviews
         connection.execute(f"INSERT INTO {name_of_reviews_table} (id, user_id, track_id, review, rating) VALUES ('999', '999', '999', 'TEST REVIEW', '5')")
@@ -93,7 +99,7 @@ def test_database_populate_select_all_track_genres(database_engine):
 
     # Get table information
     inspector = inspect(database_engine)
-    name_of_track_genres_table = inspector.get_table_names()[5]
+    name_of_track_genres_table = inspector.get_table_names()[6]
 
     with database_engine.connect() as connection:
         # query for records in table track_genres
@@ -112,7 +118,7 @@ def test_database_populate_select_all_tracks(database_engine):
 
     # Get table information
     inspector = inspect(database_engine)
-    name_of_tracks_table = inspector.get_table_names()[6]
+    name_of_tracks_table = inspector.get_table_names()[13]
 
 
     with database_engine.connect() as connection:
@@ -131,7 +137,7 @@ def test_database_populate_select_all_tracks(database_engine):
 def test_database_populate_select_all_users(database_engine):
     # Get table information
     inspector = inspect(database_engine)
-    name_of_users_table = inspector.get_table_names()[7]
+    name_of_users_table = inspector.get_table_names()[14]
     with database_engine.connect() as connection:
         # query for records in table users
         select_statement = select([metadata.tables[name_of_users_table]])
@@ -142,4 +148,27 @@ def test_database_populate_select_all_users(database_engine):
         for row in result:
             all_users.append(row['user_name'])
 
-        assert all_users[0] == "test_user"
\ No newline at end of file
+        assert all_users[0] == "test_user"
+
+def test_database_bulk_load_matches_per_object_populate(database_engine):
+    # Build the catalogue once with the single pass importer
+    catalogue = MemoryRepository()
+    csv_data_importer.load_all(TEST_DATA_PATH_DATABASE_LIMITED, catalogue)
+
+    # Insert it into a fresh database through the batched bulk load
+    bulk_engine = create_engine('sqlite://')
+    metadata.create_all(bulk_engine)
+    bulk_repo = SqlAlchemyRepository(sessionmaker(autocommit=False, autoflush=True, bind=bulk_engine))
+    bulk_repo.bulk_load(catalogue.get_albums(), catalogue.get_artists(), catalogue.get_genres(),
+                        catalogue.get_sorted_tracks(), batch_size=7)
+
+    # Check every table matches the database populated one object at a time
+    for table in metadata.sorted_tables:
+        # the catalogue version is a random token, different in every database
+        if table.name == 'catalogue_version':
+            continue
+        with database_engine.connect() as connection:
+            expected_rows = list(connection.execute(select([table])))
+        with bulk_engine.connect() as connection:
+            bulk_rows = list(connection.execute(select([table])))
+        assert bulk_rows == expected_rows
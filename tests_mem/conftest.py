@@ -1,6 +1,9 @@
 import pytest
+from sqlalchemy.orm import clear_mappers
+
 from music import create_app
-from music.adapters import memory_repository
+from music.adapters import columnar_repository, memory_repository
+from music.adapters.columnar_repository import ColumnarRepository
 from music.adapters.memory_repository import MemoryRepository
 
 from utils import get_project_root
@@ -12,11 +15,21 @@ TEST_DATA_PATH = get_project_root() / "tests_mem" / "data"
 
 @pytest.fixture
 def in_memory_repo():
+    # an earlier create_app() in database mode leaves the domain model mapped to the ORM
+    clear_mappers()
     repo = MemoryRepository()
     memory_repository.populate(TEST_DATA_PATH, repo)
     return repo
 
 
+@pytest.fixture
+def columnar_repo():
+    clear_mappers()
+    repo = ColumnarRepository()
+    columnar_repository.populate(TEST_DATA_PATH, repo)
+    return repo
+
+
 @pytest.fixture
 def client():
     my_app = create_app({
@@ -114,4 +114,48 @@ def test_comment_with_invalid_input(client, auth, comment, out_of_5, messages):
     )
     # Check that supplying invalid comment text generates appropriate error messages.
     for message in messages:
-        assert message in response.data
\ No newline at end of file
+        assert message in response.data
+
+def test_browse_sort_is_carried_in_the_url(client):
+    # Changing the filter redirects to page 1 with the sort in the query string
+    response = client.post('/tracks/browse/3', data={'filter': 'get_track_rating'})
+    assert response.headers['Location'] == '/tracks/browse/1?sort=get_track_rating&order=desc'
+
+    # Paging keeps the sort of the page it came from
+    response = client.post('/tracks/browse/1?sort=get_track_name&order=asc', data={'submit2': '>'})
+    assert response.headers['Location'] == '/tracks/browse/2?sort=get_track_name&order=asc'
+
+    # Another client browsing with the default sort is unaffected
+    sorted_page = client.get('/tracks/browse/1?sort=get_track_name&order=desc')
+    default_page = client.get('/tracks/browse/1')
+    assert sorted_page.status_code == default_page.status_code == 200
+    assert sorted_page.data != default_page.data
+
+@pytest.mark.parametrize('url', ('/tracks/browse/1?sort=get_track_name&order=asc', '/tracks/browse/track/2', '/tracks/search'))
+def test_unchanged_page_is_not_sent_again(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    etag, is_weak = response.get_etag()
+    assert etag is not None and not is_weak
+
+    response = client.get(url, headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.get_etag() == (etag, False)
+
+def test_review_and_sign_in_change_page_etags(client, auth):
+    etag = client.get('/tracks/browse/track/2').get_etag()[0]
+
+    # Signed in users see a review link, so they get another page
+    auth.register()
+    auth.login()
+    response = client.get('/tracks/browse/track/2', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    etag = response.get_etag()[0]
+
+    client.post('/tracks/review/2', data={'review_comment': 'Awesome track!', 'out_of_5': 3})
+    response = client.get('/tracks/browse/track/2', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert b'Awesome track!' in response.data
+    assert response.get_etag()[0] != etag
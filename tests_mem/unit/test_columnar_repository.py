@@ -0,0 +1,221 @@
+import gc, random
+
+import pytest
+
+from music.domainmodel import review, track, user
+from music.adapters import csv_data_importer
+from music.adapters.columnar_repository import ColumnarRepository
+from music.adapters.memory_repository import MemoryRepository
+from music.adapters.recommendation_engine import RecommendationEngine
+from music.adapters.repository import RepositoryException, SORT_METHODS
+from tests_mem.conftest import TEST_DATA_PATH
+
+
+@pytest.fixture
+def single_pass_repo():
+    repo = MemoryRepository()
+    csv_data_importer.load_all(TEST_DATA_PATH, repo)
+    return repo
+
+
+def track_ids(tracks):
+    return [track_object.track_id for track_object in tracks]
+
+
+def test_repository_gets_number_of_tracks(columnar_repo):  # Passes
+    assert columnar_repo.get_number_of_tracks() == 2000
+
+
+def test_repository_can_get_track_from_id(columnar_repo, single_pass_repo):  # Passes
+    track_found = columnar_repo.get_track(2)
+    expected = single_pass_repo.get_track(2)
+
+    assert track_found == expected
+    assert track_found.title == expected.title
+    assert track_found.track_url == expected.track_url
+    assert track_found.track_duration == expected.track_duration
+    assert track_found.artist.full_name == expected.artist.full_name
+    assert track_found.album.title == expected.album.title
+    assert track_found.genres == expected.genres
+    assert columnar_repo.get_track(0) is None
+
+
+def test_repository_builds_tracks_only_while_they_are_used(columnar_repo):  # Passes
+    track_found = columnar_repo.get_track(2)
+    assert columnar_repo.get_track(2) is track_found
+
+    del track_found
+    gc.collect()
+    # nothing refers to the track any more, so it is built again from the columns
+    assert columnar_repo.get_track(2).track_id == 2
+
+
+def test_repository_keeps_reviewed_tracks(columnar_repo):  # Passes
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = columnar_repo.get_track(2)
+    new_review = review.Review(reviewed_track, "review", 4, new_user)
+    columnar_repo.add_review_to_track(reviewed_track, new_review, new_user)
+    del reviewed_track
+    gc.collect()
+
+    assert columnar_repo.get_track(2).reviews == [new_review]
+    assert columnar_repo.get_track(2).average_rating() == 4
+
+
+def test_repository_catalogue_version_changes_on_review(columnar_repo):  # Passes
+    version = columnar_repo.get_catalogue_version()
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = columnar_repo.get_track(2)
+    columnar_repo.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", 4, new_user), new_user)
+
+    assert columnar_repo.get_catalogue_version() != version
+
+
+def test_repository_pages_match_memory_repository(columnar_repo, single_pass_repo):  # Passes
+    new_user = user.User(1, "Jeff", "Password1")
+    for repo in (columnar_repo, single_pass_repo):
+        for track_id, rating in ((2, 5), (3, 1), (5, 4)):
+            reviewed_track = repo.get_track(track_id)
+            repo.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", rating, new_user), new_user)
+
+    for sort_method in SORT_METHODS:
+        for descending in (False, True):
+            for page in (1, 2, 67):
+                assert track_ids(columnar_repo.get_page(sort_method, descending, page, 30)) == \
+                       track_ids(single_pass_repo.get_page(sort_method, descending, page, 30))
+
+
+def test_repository_rejects_unknown_sort_method(columnar_repo):  # Passes
+    with pytest.raises(RepositoryException):
+        columnar_repo.get_page("get_track_url", False, 1, 30)
+
+
+def test_repository_sorted_tracks_follow_sort_tracks(columnar_repo, single_pass_repo):  # Passes
+    columnar_repo.sort_tracks("get_track_duration", True)
+    single_pass_repo.sort_tracks("get_track_duration", True)
+
+    assert track_ids(columnar_repo.get_list_of_tracks(2, 30)) == track_ids(single_pass_repo.get_list_of_tracks(2, 30))
+    assert track_ids(columnar_repo.get_sorted_tracks()) == track_ids(single_pass_repo.get_sorted_tracks())
+
+
+def test_repository_search_matches_memory_repository(columnar_repo, single_pass_repo):  # Passes
+    for query in ("the", "lo", "x", "Love", "AWOL", "no such track"):
+        assert track_ids(columnar_repo.return_track_from_dict(query)) == \
+               track_ids(single_pass_repo.return_track_from_dict(query))
+
+
+def test_bulk_load_out_of_id_order_matches_per_track_adds(single_pass_repo):  # Passes
+    tracks = single_pass_repo.get_sorted_tracks()[:]
+    random.Random(235).shuffle(tracks)
+    tracks.append(tracks[0])  # a repeated id keeps the first row, as get_track always has
+    bulk_repo, repo = ColumnarRepository(), ColumnarRepository()
+    bulk_repo.bulk_load([], [], [], tracks)
+    for track_object in tracks:
+        repo.add_track(track_object)
+        repo.add_track_to_sort(track_object)
+        repo.add_track_dict(track_object, track_object.album, track_object.artist)
+
+    # Check the id index sorted once finds the same rows
+    assert track_ids(bulk_repo.get_sorted_tracks()) == track_ids(repo.get_sorted_tracks())
+    for track_id in track_ids(tracks):
+        assert bulk_repo.get_track(track_id).title == repo.get_track(track_id).title
+    assert bulk_repo.get_track(0) is None and bulk_repo.get_track(10 ** 6) is None
+    for query in ("the", "lo", "Love", "no such track"):
+        assert track_ids(bulk_repo.return_track_from_dict(query)) == track_ids(repo.return_track_from_dict(query))
+
+
+def test_repository_related_tracks_match_recommendation_engine(columnar_repo, single_pass_repo):  # Passes
+    engine = RecommendationEngine()
+    for track_object in single_pass_repo.get_sorted_tracks():
+        engine.add_track(track_object)
+
+    for track_id in (2, 3, 5, 10, 20, 140):
+        expected = sorted(track_ids(engine.related_tracks(single_pass_repo.get_track(track_id))))
+        assert sorted(track_ids(columnar_repo.related_tracks(columnar_repo.get_track(track_id)))) == expected
+
+
+def test_repository_recommends_related_tracks(columnar_repo):  # Passes
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = columnar_repo.get_track(2)
+    new_user.add_review(review.Review(reviewed_track, "review", 5, new_user))
+
+    recommended = columnar_repo.recommend_tracks(new_user)
+    assert 0 < len(recommended) <= 10
+    assert set(recommended) <= set(columnar_repo.related_tracks(reviewed_track))
+    assert reviewed_track not in recommended
+
+
+def test_repository_can_add_a_track(columnar_repo):  # Passes
+    new_track = track.Track(0, "Track title")
+    columnar_repo.add_track(new_track)
+
+    assert columnar_repo.get_number_of_tracks() == 2001
+    assert columnar_repo.get_track(0).title == "Track title"
+    assert columnar_repo.get_page("get_track_id", False, 1, 1)[0].track_id == 0
+
+
+@pytest.fixture
+def catalogue_repo(columnar_repo, tmp_path):
+    columnar_repo.save_catalogue(tmp_path / "tracks.catalogue", b"test data")
+    return ColumnarRepository.open_catalogue(tmp_path / "tracks.catalogue", b"test data")
+
+
+def test_catalogue_matches_columnar_repository(catalogue_repo, columnar_repo):  # Passes
+    assert catalogue_repo.get_number_of_tracks() == columnar_repo.get_number_of_tracks()
+    assert len(catalogue_repo.get_albums()) == len(columnar_repo.get_albums())
+    assert len(catalogue_repo.get_artists()) == len(columnar_repo.get_artists())
+    assert len(catalogue_repo.get_genres()) == len(columnar_repo.get_genres())
+
+    track_found = catalogue_repo.get_track(10)
+    expected = columnar_repo.get_track(10)
+    assert (track_found.title, track_found.track_url, track_found.track_duration, track_found.genres) == \
+           (expected.title, expected.track_url, expected.track_duration, expected.genres)
+    assert (track_found.artist.full_name, track_found.album.title, track_found.album.album_url) == \
+           (expected.artist.full_name, expected.album.title, expected.album.album_url)
+    assert [(a.album_id, getattr(a, 'album_type', None), getattr(a, 'release_year', None))
+            for a in catalogue_repo.get_albums()] == \
+           [(a.album_id, getattr(a, 'album_type', None), getattr(a, 'release_year', None))
+            for a in columnar_repo.get_albums()]
+
+    for sort_method in SORT_METHODS:
+        for descending in (False, True):
+            assert track_ids(catalogue_repo.get_page(sort_method, descending, 2, 30)) == \
+                   track_ids(columnar_repo.get_page(sort_method, descending, 2, 30))
+    for query in ("the", "lo", "x", "AWOL", "no such track"):
+        assert track_ids(catalogue_repo.return_track_from_dict(query)) == track_ids(columnar_repo.return_track_from_dict(query))
+    for track_id in (2, 3, 5, 140):
+        assert sorted(track_ids(catalogue_repo.related_tracks(catalogue_repo.get_track(track_id)))) == \
+               sorted(track_ids(columnar_repo.related_tracks(columnar_repo.get_track(track_id))))
+
+
+def test_catalogue_keeps_reviews_in_process(catalogue_repo):  # Passes
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = catalogue_repo.get_track(3)
+    catalogue_repo.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", 5, new_user), new_user)
+    del reviewed_track
+    gc.collect()
+
+    assert catalogue_repo.get_page("get_track_rating", True, 1, 1)[0].track_id == 3
+    assert catalogue_repo.get_track(3).average_rating() == 5
+
+
+def test_catalogue_is_read_only(catalogue_repo):  # Passes
+    with pytest.raises(RepositoryException):
+        catalogue_repo.add_track(track.Track(0, "Track title"))
+    assert catalogue_repo.get_number_of_tracks() == 2000
+
+
+def test_catalogue_from_other_source_is_rejected(catalogue_repo, tmp_path):  # Passes
+    with pytest.raises(RepositoryException):
+        ColumnarRepository.open_catalogue(tmp_path / "tracks.catalogue", b"other data")
+    with pytest.raises(OSError):
+        ColumnarRepository.open_catalogue(tmp_path / "missing.catalogue")
+
+
+def test_damaged_catalogue_is_rejected(catalogue_repo, tmp_path):  # Passes
+    data = (tmp_path / "tracks.catalogue").read_bytes()
+    # Empty, cut inside the header, cut inside the section table and cut inside the sections
+    for length in (0, 10, 100, len(data) // 2):
+        (tmp_path / "damaged.catalogue").write_bytes(data[:length])
+        with pytest.raises(RepositoryException):
+            ColumnarRepository.open_catalogue(tmp_path / "damaged.catalogue", b"test data")
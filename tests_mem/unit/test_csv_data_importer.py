@@ -0,0 +1,112 @@
+import shutil
+
+import pytest
+from sqlalchemy.orm import clear_mappers
+
+from music.adapters import csv_data_importer
+from music.adapters.memory_repository import MemoryRepository
+from tests_mem.conftest import TEST_DATA_PATH
+
+TRACKS_FILE = str(TEST_DATA_PATH / "raw_tracks_excerpt.csv")
+
+
+class EntityCollector:
+
+    def bulk_load(self, albums: list, artists: list, genres: list, tracks: list):
+        self.albums, self.artists, self.genres, self.tracks = albums, artists, genres, tracks
+
+
+def load(workers: int) -> EntityCollector:
+    collector = EntityCollector()
+    csv_data_importer.load_all(TEST_DATA_PATH, collector, workers)
+    return collector
+
+
+@pytest.fixture
+def serial_load():
+    clear_mappers()
+    return load(1)
+
+
+def test_record_ranges_split_on_row_boundaries():  # Passes
+    ranges = csv_data_importer.record_ranges(TRACKS_FILE, 7)
+
+    assert len(ranges) == 7
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    rows = [row for start, end in ranges for row in csv_data_importer.read_csv_range(TRACKS_FILE, start, end)]
+    assert rows == list(csv_data_importer.read_csv_file(TRACKS_FILE))
+
+
+def test_record_ranges_do_not_split_quoted_newlines(tmp_path):  # Passes
+    path = tmp_path / "tracks.csv"
+    path.write_bytes(b'id,text\n1,"a\nb\nc\nd"\n2,plain\n3,"e\nf"\n')
+
+    for parts in range(1, 8):
+        ranges = csv_data_importer.record_ranges(str(path), parts)
+        rows = [row for start, end in ranges for row in csv_data_importer.read_csv_range(str(path), start, end)]
+        assert rows == [['1', 'a\nb\nc\nd'], ['2', 'plain'], ['3', 'e\nf']]
+
+
+def test_record_ranges_give_up_on_escaped_quotes(tmp_path):  # Passes
+    path = tmp_path / "tracks.csv"
+    path.write_bytes(b'id,text\n1,"a \\" b"\n')
+
+    assert csv_data_importer.record_ranges(str(path), 2) is None
+
+
+def test_parallel_load_matches_serial_load(serial_load):  # Passes
+    parallel_load = load(3)
+
+    assert [(a.album_id, a.title, a.album_url, a.album_type, a.release_year) for a in parallel_load.albums[1:]] == \
+           [(a.album_id, a.title, a.album_url, a.album_type, a.release_year) for a in serial_load.albums[1:]]
+    assert [(a.artist_id, a.full_name) for a in parallel_load.artists] == \
+           [(a.artist_id, a.full_name) for a in serial_load.artists]
+    assert [(g.genre_id, g.name) for g in parallel_load.genres] == [(g.genre_id, g.name) for g in serial_load.genres]
+    for parallel_track, serial_track in zip(parallel_load.tracks, serial_load.tracks):
+        assert (parallel_track.track_id, parallel_track.title, parallel_track.track_url, parallel_track.track_duration) == \
+               (serial_track.track_id, serial_track.title, serial_track.track_url, serial_track.track_duration)
+        assert parallel_track.album is parallel_load.albums[parallel_load.albums.index(serial_track.album)]
+        assert parallel_track.artist.artist_id == serial_track.artist.artist_id
+        assert [g.genre_id for g in parallel_track.genres] == [g.genre_id for g in serial_track.genres]
+    assert len(parallel_load.tracks) == len(serial_load.tracks) == 2000
+    assert [len(a.get_tracks()) for a in parallel_load.albums] == [len(a.get_tracks()) for a in serial_load.albums]
+
+
+def test_albums_are_joined_from_the_albums_file(serial_load):  # Passes
+    albums = {a.album_id: a for a in serial_load.albums}
+
+    assert (albums[1].title, albums[1].album_url, albums[1].album_type, albums[1].release_year) == \
+           ('AWOL - A Way Of Life', 'http://freemusicarchive.org/music/AWOL/AWOL_-_A_Way_Of_Life/', 'Album', 2009)
+    # Album 147 is only in the tracks file
+    assert albums[147].title != "" and (albums[147].album_type, albums[147].release_year) == (None, None)
+    assert len(albums) == 432
+
+
+def test_albums_come_from_tracks_file_without_albums_file(tmp_path):  # Passes
+    clear_mappers()
+    shutil.copy(TRACKS_FILE, tmp_path)
+    collector = EntityCollector()
+    csv_data_importer.load_all(tmp_path, collector)
+
+    albums = {a.album_id: a for a in collector.albums}
+    assert (albums[1].title, albums[1].album_type, albums[1].release_year) == ('AWOL - A Way Of Life', None, None)
+    assert len(albums) == 432
+
+
+def test_catalogue_matches_load_all(serial_load):  # Passes
+    catalogue = csv_data_importer.read_catalogue(TEST_DATA_PATH)
+
+    assert catalogue['albums'] == {0: ("None", None, None, None),
+                                   **{a.album_id: (a.title, a.album_url, a.album_type, a.release_year)
+                                      for a in serial_load.albums[1:]}}
+    assert catalogue['tracks'] == {t.track_id: (t.title, t.album.album_id, t.artist.artist_id, t.track_duration, t.track_url)
+                                   for t in serial_load.tracks}
+
+
+def test_album_pass_matches_single_pass_albums(serial_load):  # Passes
+    repo = MemoryRepository()
+    csv_data_importer.load_albums(TEST_DATA_PATH, repo)
+
+    # Check each album is added once, in the order the tracks file first names it
+    assert [(a.album_id, a.title, getattr(a, 'album_url', None), getattr(a, 'release_year', None)) for a in repo.get_albums()] == \
+           [(a.album_id, a.title, getattr(a, 'album_url', None), getattr(a, 'release_year', None)) for a in serial_load.albums]
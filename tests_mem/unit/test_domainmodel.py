@@ -397,6 +397,22 @@ class TestTrack:
         track1.add_genre('32')
         assert track1.genres == [genre1, genre2]
 
+    def test_review_methods(self):  # Passes
+        track1 = Track(1, 'Shivers')
+        assert track1.average_rating() == 0
+        assert track1.get_num_of_reviews() == 0
+
+        track1.add_review(Review(track1, 'review 1', 2))
+        track1.add_review(Review(track1, 'review 2', 5))
+        assert track1.get_num_of_reviews() == 2
+        assert track1.average_rating() == 3.5
+
+        # Replacing a review keeps the count and updates the running total
+        track1.replace_review(0, Review(track1, 'review 1 again', 4))
+        assert track1.get_num_of_reviews() == 2
+        assert track1.rating_sum == 9
+        assert track1.average_rating() == 4.5
+
     def test_equality(self):  # Passes
         track1 = Track(1, 'Shivers')
         track2 = Track(2, 'Heat Waves')
@@ -675,11 +691,15 @@ class TestUser:
         assert user1.reviews == [review3]
 
 
-def create_csv_reader():
+def csv_file_names():
     dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     albums_file_name = os.path.join(dirname, 'data/raw_albums_excerpt.csv')
     tracks_file_name = os.path.join(dirname, 'data/raw_tracks_excerpt.csv')
-    reader = TrackCSVReader(albums_file_name, tracks_file_name)
+    return albums_file_name, tracks_file_name
+
+
+def create_csv_reader():
+    reader = TrackCSVReader(*csv_file_names())
     reader.read_csv_files()
     return reader
 
@@ -745,3 +765,39 @@ class TestCSVReader:
         # genre id = 3>]'
         sorted_genre_sample = str(sorted_genres[:3])
         assert sorted_genre_sample == '[<Genre Avant-Garde, genre id = 1>, <Genre International, genre id = 2>, <Genre Blues, genre id = 3>]'
+
+    def test_track_batches(self):  # Passes
+        reader = create_csv_reader()
+        batches = list(TrackCSVReader(*csv_file_names()).read_track_batches(600))
+
+        assert [len(batch) for batch in batches] == [600, 600, 600, 200]
+        tracks = [track for batch in batches for track in batch]
+        assert [track.track_id for track in tracks] == [track.track_id for track in reader.dataset_of_tracks]
+        assert [track.album for track in tracks] == [track.album for track in reader.dataset_of_tracks]
+
+    def test_track_batches_share_linked_objects(self):  # Passes
+        tracks = [track for batch in TrackCSVReader(*csv_file_names()).read_track_batches(7) for track in batch]
+        albums = {}
+        for track in tracks:
+            if track.album is not None:
+                assert albums.setdefault(track.album.album_id, track.album) is track.album
+        artist_tracks = [track for track in tracks if track.artist.artist_id == 1]
+        assert all(track.artist is artist_tracks[0].artist for track in artist_tracks)
+
+    def test_album_offsets_read_the_same_albums(self):  # Passes
+        albums_file_name, tracks_file_name = csv_file_names()
+        reader = TrackCSVReader(albums_file_name, tracks_file_name)
+        albums = reader.read_albums_file_as_dict()
+        offsets = reader.read_album_offsets()
+
+        assert offsets.keys() == albums.keys()
+        with open(albums_file_name, 'rb') as album_csv:
+            for album_id in (1, 4, 6):
+                album = reader.read_album_at(album_csv, offsets[album_id])
+                assert album == albums[album_id]
+                assert album.title == albums[album_id].title
+                assert album.release_year == albums[album_id].release_year
+
+    def test_track_batches_rejects_bad_batch_size(self):  # Passes
+        with pytest.raises(ValueError):
+            next(TrackCSVReader(*csv_file_names()).read_track_batches(0))
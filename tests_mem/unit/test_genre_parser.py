@@ -0,0 +1,41 @@
+import ast
+
+import pytest
+
+from music.adapters.csv_data_importer import read_csv_file
+from music.adapters.genre_parser import parse_genres
+from tests_mem.conftest import TEST_DATA_PATH
+from utils import get_project_root
+
+
+@pytest.mark.parametrize("data_path", [TEST_DATA_PATH, get_project_root() / "music" / "adapters" / "data"])
+def test_parse_genres_matches_literal_eval_on_every_row(data_path):  # Passes
+    for row in read_csv_file(str(data_path / "raw_tracks_excerpt.csv")):
+        if row[27] != "":
+            assert parse_genres(row[27]) == ast.literal_eval(row[27])
+
+
+@pytest.mark.parametrize("raw", [
+    "[]",
+    " [ ] ",
+    "[{}]",
+    "[{'genre_id': '1', }, ]",
+    "[{\"genre_title\": \"Rock 'n' Roll\"}]",
+    "[{'genre_title': 'a{b}c, d: e'}]",
+    "[{'genre_title': 'It\\'s'}]",
+    "[{'genre_id': 1}]",
+    "[{'genre_' 'id': '1'}]",
+])
+def test_parse_genres_matches_literal_eval_on_unusual_values(raw):  # Passes
+    assert parse_genres(raw) == ast.literal_eval(raw)
+
+
+@pytest.mark.parametrize("raw", ["", "[{'genre_id': '1'}{'genre_id': '2'}]", "[{'genre_id': '1'}] x"])
+def test_parse_genres_rejects_what_literal_eval_rejects(raw):  # Passes
+    with pytest.raises(SyntaxError):
+        parse_genres(raw)
+
+
+def test_parse_genres_reuses_parsed_value():  # Passes
+    raw = "[{'genre_id': '12', 'genre_title': 'Rock'}]"
+    assert parse_genres(raw) is parse_genres(raw)
@@ -1,7 +1,11 @@
 import pytest
 
 from music.domainmodel import album, artist, genre, review, track, user
-from music.adapters.repository import RepositoryException
+from music.adapters import csv_data_importer, memory_repository
+from music.adapters.memory_repository import MemoryRepository
+from music.adapters.recommendation_engine import RecommendationEngine
+from music.adapters.repository import RepositoryException, SORT_METHODS
+from tests_mem.conftest import TEST_DATA_PATH
 
 
 def test_repository_can_add_a_user(in_memory_repo):  # Passes
@@ -48,6 +52,15 @@ def test_repository_can_retrieve_a_user(in_memory_repo):  # Passes
     assert retrieve_user == new_user
 
 
+def test_repository_retrieves_user_ignoring_case(in_memory_repo):  # Passes
+    # Simulated user added to repository
+    new_user = user.User(1, "Jeff", "Password1")
+    in_memory_repo.add_user(new_user)
+
+    # Check user can be found regardless of the case used when searching
+    assert in_memory_repo.get_user("jEFF") is new_user
+
+
 def test_repository_does_not_retrieve_a_non_existent_user(in_memory_repo):  # Passes
     # Retrieve user that does not exist
     retrieve_user = in_memory_repo.get_user("MrDoesNotExist")
@@ -118,6 +131,49 @@ def test_repository_can_overwrite_track_review(in_memory_repo):  # Passes
     assert new_track.reviews == [new_review]
 
 
+def test_repository_catalogue_version_changes_on_review_and_import(in_memory_repo):  # Passes
+    version = in_memory_repo.get_catalogue_version()
+    assert in_memory_repo.get_catalogue_version() == version
+
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = in_memory_repo.get_track(2)
+    in_memory_repo.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", 5, new_user), new_user)
+    reviewed_version = in_memory_repo.get_catalogue_version()
+    assert reviewed_version != version
+
+    in_memory_repo.add_track(track.Track(0, "Track title"))
+    assert in_memory_repo.get_catalogue_version() not in (version, reviewed_version)
+
+
+def test_repository_overwrites_only_the_reviewing_users_review(in_memory_repo):  # Passes
+    user1 = user.User(1, "Jeff", "Password1")
+    user2 = user.User(2, "Anna", "Password1")
+    new_track = track.Track(0, "Track title")
+    other_track = track.Track(1, "Other title")
+    first_review = review.Review(new_track, "review", 5, user1)
+    other_review = review.Review(new_track, "review", 3, user2)
+    other_track_review = review.Review(other_track, "review", 4, user1)
+    for new_review, reviewer in ((first_review, user1), (other_review, user2), (other_track_review, user1)):
+        in_memory_repo.add_review_to_user(reviewer, new_review)
+        in_memory_repo.add_review_to_track(new_review.track, new_review, reviewer)
+
+    replacement = review.Review(new_track, "review2", 1, user1)
+    in_memory_repo.add_review_to_user(user1, replacement)
+    in_memory_repo.add_review_to_track(new_track, replacement, user1)
+    assert new_track.reviews == [replacement, other_review]
+    assert user1.reviews == [replacement, other_track_review]
+    assert user2.reviews == [other_review]
+    assert new_track.average_rating() == 2
+    assert new_track.review_by_user(user1) is replacement
+    assert user1.review_of_track(new_track) is replacement
+    assert user1.review_of_track(other_track) is other_track_review
+
+    # Lookups still work after removing a review shifts the others
+    user1.remove_review(replacement)
+    assert user1.review_of_track(new_track) is None
+    assert user1.review_of_track(other_track) is other_track_review
+
+
 def test_repository_can_add_a_track(in_memory_repo):  # Passes
     # Number of tracks before adding a new track
     tracks_before_add = in_memory_repo.get_number_of_tracks()
@@ -217,6 +273,53 @@ def test_repository_gets_specified_list_of_tracks(in_memory_repo):  # Passes
     assert specified_tracks == in_memory_repo.get_sorted_tracks()[30:60]
 
 
+def test_repository_gets_page_without_changing_shared_sort(in_memory_repo):  # Passes
+    # Page 2 of tracks by title, highest first
+    page = in_memory_repo.get_page("get_track_name", True, 2, 30)
+    expected = sorted(sorted(in_memory_repo.get_sorted_tracks()), key=lambda t: t.title, reverse=True)[30:60]
+
+    # Check the page is ordered and the shared sorted list is left in id order
+    assert page == expected
+    assert in_memory_repo.get_list_of_tracks(1, 30) == sorted(in_memory_repo.get_sorted_tracks())[0:30]
+
+
+def test_repository_rating_order_follows_new_reviews(in_memory_repo):  # Passes
+    # Simulated user reviews a track from the middle of the catalogue
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = in_memory_repo.get_track(155)
+    in_memory_repo.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", 5, new_user), new_user)
+
+    # Check the track moves to the top of the rating order
+    assert in_memory_repo.get_page("get_track_rating", True, 1, 30)[0] is reviewed_track
+
+    # Replace the review with a low rating and rate another track higher
+    in_memory_repo.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", 1, new_user), new_user)
+    other_track = in_memory_repo.get_track(2)
+    in_memory_repo.add_review_to_track(other_track, review.Review(other_track, "review", 3, new_user), new_user)
+
+    # Check both orders are repositioned without a re-sort
+    assert in_memory_repo.get_page("get_track_rating", True, 1, 30)[0:2] == [other_track, reviewed_track]
+    assert in_memory_repo.get_page("get_track_rating", False, 67, 30)[-2:] == [reviewed_track, other_track]
+
+
+def test_repository_deferred_indexes_match_per_track_inserts(in_memory_repo):  # Passes
+    # Same tracks added one at a time, each bisected into the sort indexes
+    repo = MemoryRepository()
+    for track_object in in_memory_repo.get_sorted_tracks():
+        repo.add_track(track_object)
+
+    # Check every ordering built once at the end of populate matches
+    for function in SORT_METHODS:
+        for order in (False, True):
+            assert in_memory_repo.get_page(function, order, 2, 30) == repo.get_page(function, order, 2, 30)
+
+
+def test_repository_rejects_unknown_sort_method(in_memory_repo):  # Passes
+    # Check that only known sort methods can be used
+    with pytest.raises(RepositoryException):
+        in_memory_repo.get_page("__class__", False, 1, 30)
+
+
 def test_repository_can_add_album(in_memory_repo):  # Passes
     # Simulated album added to repository
     new_album = album.Album(0, "Album Title")
@@ -261,6 +364,16 @@ def test_repository_can_get_albums(in_memory_repo):  # Passes
     assert all(isinstance(x, album.Album) for x in albums_from_function)
 
 
+def test_repository_can_get_album_from_id(in_memory_repo):  # Passes
+    # Simulated album added to repository
+    new_album = album.Album(999999, "Album Title")
+    in_memory_repo.add_album(new_album)
+
+    # Check album is found by its id, and an unknown id returns None
+    assert in_memory_repo.get_album(999999) is new_album
+    assert in_memory_repo.get_album(999998) is None
+
+
 def test_repository_can_add_artist(in_memory_repo):  # Passes
     # Simulated artist added to repository
     new_artist = artist.Artist(0, "Artist Name")
@@ -305,6 +418,16 @@ def test_repository_can_get_artists(in_memory_repo):  # Passes
     assert all(isinstance(x, artist.Artist) for x in artists_from_function)
 
 
+def test_repository_can_get_artist_from_id(in_memory_repo):  # Passes
+    # Simulated artist added to repository
+    new_artist = artist.Artist(999999, "Artist Name")
+    in_memory_repo.add_artist(new_artist)
+
+    # Check artist is found by its id, and an unknown id returns None
+    assert in_memory_repo.get_artist(999999) is new_artist
+    assert in_memory_repo.get_artist(999998) is None
+
+
 def test_repository_can_add_genre(in_memory_repo):  # Passes
     # Simulated genre added to repository
     new_genre = genre.Genre(0, "Genre Name")
@@ -389,6 +512,35 @@ def test_repository_can_get_tracks_from_track_dict_with_any_value(in_memory_repo
     assert return1 == return2 == return3 == [new_track]
 
 
+def test_repository_search_ranks_title_matches_first(in_memory_repo):  # Passes
+    # Simulated tracks, the first only matches "Qzxmoon" on its artist name
+    first_track = track.Track(900001, "Qzxquiet Song")
+    second_track = track.Track(900002, "Qzxmoon Drive")
+    in_memory_repo.add_track_dict(first_track, album.Album(0, "Album"), artist.Artist(0, "Qzxmoon Band"))
+    in_memory_repo.add_track_dict(second_track, album.Album(0, "Album"), artist.Artist(0, "Someone"))
+
+    # Check title matches come before artist matches and searching is case insensitive
+    assert in_memory_repo.return_track_from_dict("QZXMOON") == [second_track, first_track]
+    # Check short searches and searches with no matches still work
+    assert first_track in in_memory_repo.return_track_from_dict("Qz")
+    assert in_memory_repo.return_track_from_dict("Qzxmoon Bandx") == []
+
+
+def test_repository_search_is_updated_when_track_is_re_added(in_memory_repo):  # Passes
+    new_track = track.Track(900003, "Old Title")
+    in_memory_repo.add_track_dict(new_track, album.Album(0, "Album"), artist.Artist(0, "Artist"))
+    new_track.title = "New Title"
+    in_memory_repo.add_track_dict(new_track, album.Album(0, "Album"), artist.Artist(0, "Artist"))
+
+    # Check only the new title can be found
+    assert in_memory_repo.return_track_from_dict("Old Title") == []
+    assert in_memory_repo.return_track_from_dict("New Title") == [new_track]
+
+
+def test_repository_search_returns_at_most_30_tracks(in_memory_repo):  # Passes
+    assert len(in_memory_repo.return_track_from_dict("a")) == 30
+
+
 def test_repository_can_sort_tracks_by_track_name(in_memory_repo):  # Passes
     # Simulated track
     new_track = track.Track(512, '"')
@@ -569,6 +721,20 @@ def test_repository_does_not_recommend_tracks_from_low_rated_reviews(in_memory_r
     assert tracks_recommended == []
 
 
+def test_recommendation_engine_bulk_add_matches_per_track_add(in_memory_repo):  # Passes
+    tracks = in_memory_repo.get_sorted_tracks()
+    engine, bulk_engine = RecommendationEngine(), RecommendationEngine()
+    for track_object in tracks:
+        engine.add_track(track_object)
+    bulk_engine.add_tracks(tracks[:100])
+    bulk_engine.add_tracks(tracks[50:])
+
+    # Check the duration index sorted once finds the same related tracks in the same order
+    for track_id in (2, 3, 5, 10, 20, 140):
+        seed_track = in_memory_repo.get_track(track_id)
+        assert list(bulk_engine.related_tracks(seed_track)) == list(engine.related_tracks(seed_track))
+
+
 def test_repository_does_not_recommend_same_track(in_memory_repo):  # Passes
     # Get track from CSV that already has genres, album, artist, duration
     new_track = in_memory_repo.get_track(2)
@@ -583,6 +749,23 @@ def test_repository_does_not_recommend_same_track(in_memory_repo):  # Passes
     assert new_track not in tracks_recommended
 
 
+def test_repository_recommends_from_every_related_track(in_memory_repo):  # Passes
+    new_track = in_memory_repo.get_track(2)
+    new_user = user.User(0, "USERNAME", "Password1")
+    new_user.add_review(review.Review(new_track, "review", 5, new_user))
+    tracks_recommended = in_memory_repo.recommend_tracks(new_user)
+
+    # Every track meeting the criteria, found by comparing against the whole catalogue
+    related = {track_object for track_object in in_memory_repo.get_sorted_tracks() if track_object != new_track and (
+        track_object.artist == new_track.artist or track_object.album == new_track.album
+        or any(track_genre in new_track.genres for track_genre in track_object.genres)
+        or abs(track_object.track_duration - new_track.track_duration) <= 15)}
+
+    # Check up to 10 different tracks are picked from exactly those tracks
+    assert len(tracks_recommended) == len(set(tracks_recommended)) == min(10, len(related))
+    assert set(tracks_recommended) <= related
+
+
 def test_repository_can_generate_unique_user_id(in_memory_repo):  # Passes
     # Run function to generate new ID
     new_id = in_memory_repo.generate_user_id()
@@ -594,3 +777,35 @@ def test_repository_can_generate_unique_user_id(in_memory_repo):  # Passes
     # Check the newly generated ID is unique
     assert new_id not in current_user_ids
 
+
+
+def test_single_pass_import_matches_csv_importer():  # Passes
+    # Populate one repository with the per-entity importer and one with the single pass importer
+    chain_repo = MemoryRepository()
+    csv_data_importer.populate(TEST_DATA_PATH, chain_repo)
+    single_pass_repo = MemoryRepository()
+    csv_data_importer.populate(TEST_DATA_PATH, single_pass_repo, single_pass=True)
+
+    def describe(repo):
+        albums = [(a.album_id, a.title, [t.track_id for t in a.get_tracks()]) for a in repo.get_albums()]
+        artists = [(a.artist_id, a.full_name, [t.track_id for t in a.get_tracks()]) for a in repo.get_artists()]
+        genres = [(g.genre_id, g.name) for g in repo.get_genres()]
+        tracks = [(t.track_id, t.title, t.track_url, t.track_duration, t.album.album_id, t.artist.artist_id,
+                   [g.genre_id for g in t.genres]) for a in repo.get_albums() for t in a.get_tracks()]
+        return albums, artists, genres, tracks
+
+    # Check both importers build the same albums, artists, genres and track links
+    assert describe(single_pass_repo) == describe(chain_repo)
+    assert single_pass_repo.get_number_of_tracks() == chain_repo.get_number_of_tracks()
+
+
+def test_single_pass_populate_fills_search_and_sort():  # Passes
+    # Populate a memory repository through the single pass importer
+    repo = MemoryRepository()
+    memory_repository.populate(TEST_DATA_PATH, repo, single_pass=True)
+
+    # Check tracks are shared with their album/artist and are searchable and sortable
+    found_track = repo.get_track(2)
+    assert found_track.album is repo.get_album(found_track.album.album_id)
+    assert found_track in repo.return_track_from_dict("Food")
+    assert len(repo.get_sorted_tracks()) == repo.get_number_of_tracks() == 2000
@@ -139,6 +139,17 @@ def test_get_first_page_of_tracks(in_memory_repo):
     assert first_page[0] == first_track
     assert first_page[29] == last_track
 
+def test_get_page_of_tracks_sorted_by_query(in_memory_repo):
+    sort_method, descending = browse_services.get_sort_method('get_track_duration', 'asc')
+
+    first_page = browse_services.get_page(sort_method, descending, 1, 30, in_memory_repo)
+
+    assert [track.track_duration for track in first_page] == sorted(track.track_duration for track in first_page)
+
+def test_unknown_sort_falls_back_to_track_id():
+    assert browse_services.get_sort_method('eval', 'desc') == ('get_track_id', False)
+    assert browse_services.get_sort_method(None, None) == ('get_track_id', False)
+
 def test_can_get_reviews_for_track(in_memory_repo):
     auth_services.create_and_add_user('user1', 'Password1', in_memory_repo)
     auth_services.create_and_add_user('user2', 'Password1', in_memory_repo)
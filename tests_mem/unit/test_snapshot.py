@@ -0,0 +1,98 @@
+import os, shutil
+
+import pytest
+from sqlalchemy.orm import clear_mappers
+
+from music import create_app
+from music.domainmodel import review, user
+from music.adapters import memory_repository, snapshot
+from music.adapters.memory_repository import MemoryRepository
+from music.adapters.snapshot import load_snapshot, save_snapshot
+from tests_mem.conftest import TEST_DATA_PATH
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    clear_mappers()
+    path = tmp_path / "data"
+    shutil.copytree(TEST_DATA_PATH, path)
+    return path
+
+
+@pytest.fixture
+def populated_repo(data_path):
+    repo = MemoryRepository()
+    memory_repository.populate(data_path, repo, True)
+    return repo
+
+
+def track_ids(tracks):
+    return [track_object.track_id for track_object in tracks]
+
+
+def test_snapshot_round_trip(data_path, populated_repo, tmp_path):  # Passes
+    save_snapshot(populated_repo, tmp_path / "repo.snapshot", data_path, True)
+    loaded = load_snapshot(tmp_path / "repo.snapshot", data_path, True)
+
+    assert loaded.get_number_of_tracks() == populated_repo.get_number_of_tracks()
+    assert len(loaded.get_albums()) == len(populated_repo.get_albums())
+    assert loaded.get_track(2).album is loaded.get_album(loaded.get_track(2).album.album_id)
+    assert track_ids(loaded.get_page("get_track_name", True, 3, 30)) == \
+           track_ids(populated_repo.get_page("get_track_name", True, 3, 30))
+    assert track_ids(loaded.return_track_from_dict("lo")) == track_ids(populated_repo.return_track_from_dict("lo"))
+
+
+def test_snapshot_keeps_rating_index_working(data_path, populated_repo, tmp_path):  # Passes
+    save_snapshot(populated_repo, tmp_path / "repo.snapshot", data_path, True)
+    loaded = load_snapshot(tmp_path / "repo.snapshot", data_path, True)
+    new_user = user.User(1, "Jeff", "Password1")
+    reviewed_track = loaded.get_track(3)
+    loaded.add_review_to_track(reviewed_track, review.Review(reviewed_track, "review", 5, new_user), new_user)
+
+    assert loaded.get_page("get_track_rating", True, 1, 1) == [reviewed_track]
+
+
+def test_snapshot_is_ignored_when_csv_files_change(data_path, populated_repo, tmp_path):  # Passes
+    save_snapshot(populated_repo, tmp_path / "repo.snapshot", data_path, True)
+    tracks_file = data_path / "raw_tracks_excerpt.csv"
+    modified = tracks_file.stat().st_mtime_ns + 10**9
+    os.utime(tracks_file, ns=(modified, modified))
+
+    assert load_snapshot(tmp_path / "repo.snapshot", data_path, True) is None
+
+
+def test_snapshot_is_ignored_for_other_importer(data_path, populated_repo, tmp_path):  # Passes
+    save_snapshot(populated_repo, tmp_path / "repo.snapshot", data_path, True)
+
+    assert load_snapshot(tmp_path / "repo.snapshot", data_path, False) is None
+
+
+def test_snapshot_is_ignored_when_corrupt(data_path, populated_repo, tmp_path):  # Passes
+    snapshot_path = tmp_path / "repo.snapshot"
+    save_snapshot(populated_repo, snapshot_path, data_path, True)
+    data = bytearray(snapshot_path.read_bytes())
+    data[-10] ^= 0xff
+    snapshot_path.write_bytes(bytes(data))
+
+    assert load_snapshot(snapshot_path, data_path, True) is None
+    assert load_snapshot(tmp_path / "missing.snapshot", data_path, True) is None
+
+
+def test_snapshot_is_ignored_from_other_version(data_path, populated_repo, tmp_path, monkeypatch):  # Passes
+    save_snapshot(populated_repo, tmp_path / "repo.snapshot", data_path, True)
+    monkeypatch.setattr(snapshot, "SNAPSHOT_VERSION", snapshot.SNAPSHOT_VERSION + 1)
+
+    assert load_snapshot(tmp_path / "repo.snapshot", data_path, True) is None
+
+
+def test_app_starts_when_snapshot_cannot_be_pickled(data_path, tmp_path, monkeypatch):  # Passes
+    def too_deep(*args, **kwargs):
+        raise RecursionError("maximum recursion depth exceeded while pickling an object")
+    monkeypatch.setattr(snapshot.pickle, "dumps", too_deep)
+
+    app = create_app({'TESTING': True, 'TEST_DATA_PATH': data_path, 'REPOSITORY': 'memory',
+                      'MEMORY_SNAPSHOT': tmp_path / "repo.snapshot", 'WTF_CSRF_ENABLED': False})
+
+    # Check the app serves from the freshly populated repository and no snapshot is left behind
+    assert app.test_client().get('/tracks/browse/track/2').status_code == 200
+    assert list(tmp_path.glob("repo.snapshot*")) == []